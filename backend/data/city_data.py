@@ -178,6 +178,7 @@ def _build_zone_entry(zone_id: str, zone: dict, live: dict) -> dict:
 def get_all_zones(city: str = None, state: str = None) -> list[dict]:
     """Return zone data with live readings. Optionally filter by city or state."""
     from data.live_data import fetch_all_zones_live_data
+    from data.reading_store import record_readings
 
     filtered = ZONES
     if state:
@@ -192,9 +193,28 @@ def get_all_zones(city: str = None, state: str = None) -> list[dict]:
     for zone_id, zone in filtered.items():
         live = live_data.get(zone_id, {})
         result.append(_build_zone_entry(zone_id, zone, live))
+    record_readings(result)
     return result
 
 
+def get_zone_snapshot(city: str = None, state: str = None, attempts: int = 3) -> tuple:
+    """
+    (zones, snapshot version they belong to). The version is read before and
+    after the fetch and the fetch repeated until both agree (a refresh during
+    the fetch bumps it; the retry is then served from the live cache). If it
+    never settles, the older version is returned, so results keyed by it are
+    dropped rather than served once newer readings are seen.
+    """
+    from data.snapshot import get_snapshot_version
+
+    for _ in range(attempts):
+        before = get_snapshot_version()
+        zones = get_all_zones(city=city, state=state)
+        if get_snapshot_version() == before:
+            break
+    return zones, before
+
+
 def get_zone(zone_id: str) -> dict | None:
     """Return data for a specific zone with live readings."""
     zone = ZONES.get(zone_id)
@@ -207,6 +227,29 @@ def get_zone(zone_id: str) -> dict | None:
     return _build_zone_entry(zone_id, zone, live or {})
 
 
+def get_cached_zone(zone_id: str) -> dict | None:
+    """Return a zone built from cached live readings, or None if not cached / stale."""
+    return get_cached_zone_version(zone_id)[0]
+
+
+def get_cached_zone_version(zone_id: str) -> tuple:
+    """
+    (zone built from cached live readings, version at which they last changed),
+    or (None, None) if not cached / stale. Unlike the global snapshot version,
+    a zone's version only moves when that zone's own readings change.
+    """
+    zone = ZONES.get(zone_id)
+    if not zone:
+        return None, None
+
+    from data.live_data import peek_zone_live_version
+    live, version = peek_zone_live_version(zone["lat"], zone["lng"])
+    if live is None:
+        return None, None
+
+    return _build_zone_entry(zone_id, zone, live), version
+
+
 def get_cities(state: str = None) -> list[dict]:
     """Return list of unique districts, optionally filtered by state."""
     seen = set()
@@ -0,0 +1,69 @@
+"""
+In-process publish/subscribe bus for results produced in the background.
+
+Every publish on a topic gets the next version number for that topic and
+becomes the topic's latest event, so readers can serve the most recent
+result without recomputing it. Subscribers are called synchronously in the
+publisher's thread; a failing subscriber is logged and does not affect the
+publisher or other subscribers.
+"""
+
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    __slots__ = ("topic", "version", "payload", "published_at")
+
+    def __init__(self, topic, version, payload):
+        self.topic = topic
+        self.version = version
+        self.payload = payload
+        self.published_at = datetime.now().isoformat()
+
+    def to_dict(self) -> dict:
+        return {"topic": self.topic, "version": self.version, "published_at": self.published_at}
+
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._subscribers = {}
+
+    def publish(self, topic: str, payload) -> Event:
+        with self._lock:
+            previous = self._latest.get(topic)
+            event = Event(topic, previous.version + 1 if previous else 1, payload)
+            self._latest[topic] = event
+            subscribers = list(self._subscribers.get(topic, ())) + list(self._subscribers.get("*", ()))
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception(f"Subscriber {getattr(callback, '__name__', callback)} failed on {topic}")
+        return event
+
+    def subscribe(self, topic: str, callback):
+        """Call callback(event) for every publish on topic ("*" = all topics)."""
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(callback)
+        return callback
+
+    def unsubscribe(self, topic: str, callback):
+        with self._lock:
+            if callback in self._subscribers.get(topic, []):
+                self._subscribers[topic].remove(callback)
+
+    def latest(self, topic: str):
+        """Most recent event on topic, or None."""
+        return self._latest.get(topic)
+
+    def topics(self) -> dict:
+        return {topic: event.to_dict() for topic, event in self._latest.items()}
+
+
+bus = EventBus()
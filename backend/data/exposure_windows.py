@@ -0,0 +1,171 @@
+"""
+Rolling time-weighted exposure windows.
+
+Readings are held (sample-and-hold) until the next reading of the same zone,
+for at most MAX_GAP_S, and integrated into fixed BUCKET_S time buckets, shared by all zones and kept
+in a ring covering the longest window. Per window (1h / 8h / 24h by default)
+running totals of value·seconds, covered seconds, seconds above a limit and
+reading counts are kept alongside the buckets: adding time touches the
+current bucket plus the totals, and buckets leaving a window are subtracted
+once. Reading a window mean is therefore a division, never a rescan.
+"""
+
+import time
+import threading
+
+import numpy as np
+
+BUCKET_S = 300
+WINDOWS = {"1h": 3600, "8h": 8 * 3600, "24h": 24 * 3600}
+MAX_GAP_S = 1800        # readings are not carried forward across longer gaps (e.g. downtime)
+
+_TOTALS = ("value_s", "covered_s", "exceed_s", "readings", "exceed_readings")
+
+
+class ExposureWindows:
+    """Rolling time-weighted means and exceedances for zones × fields."""
+
+    def __init__(self, fields, limits, windows=None):
+        self.fields = list(fields)
+        self.limits = np.asarray(limits, dtype=np.float64)
+        self.windows = dict(windows or WINDOWS)
+        self._spans = np.array([w // BUCKET_S for w in self.windows.values()])
+        self._n_buckets = int(self._spans.max())
+        self._lock = threading.Lock()
+        self._index = {}
+        self._ids = []
+        self._buckets = None        # name -> (n_buckets, zones, fields)
+        self._totals = None         # name -> (n_windows, zones, fields)
+        self._last = None           # (zones, fields) value currently held, NaN = none
+        self._expiry = None         # (zones, fields) time the held value stops counting (reading + MAX_GAP_S)
+        self._clock = None          # time up to which held values are integrated
+        self._bucket = None         # absolute index of the newest bucket
+
+    # ── state ──────────────────────────────────────────────────────────────
+
+    def _rows(self, zone_ids):
+        for zid in zone_ids:
+            if zid not in self._index:
+                self._index[zid] = len(self._ids)
+                self._ids.append(zid)
+        capacity = len(self._last) if self._last is not None else 0
+        if len(self._ids) > capacity:
+            size = max(len(self._ids), 2 * capacity, 64)
+            f, b, w = len(self.fields), self._n_buckets, len(self.windows)
+            buckets = {name: np.zeros((b, size, f)) for name in _TOTALS}
+            totals = {name: np.zeros((w, size, f)) for name in _TOTALS}
+            last = np.full((size, f), np.nan)
+            expiry = np.full((size, f), -np.inf)
+            if capacity:
+                for name in _TOTALS:
+                    buckets[name][:, :capacity] = self._buckets[name]
+                    totals[name][:, :capacity] = self._totals[name]
+                last[:capacity] = self._last
+                expiry[:capacity] = self._expiry
+            self._buckets, self._totals, self._last, self._expiry = buckets, totals, last, expiry
+        return np.array([self._index[zid] for zid in zone_ids], dtype=np.int64)
+
+    def _roll_to(self, bucket):
+        """Make `bucket` the newest one: expire buckets that left each window, recycle the oldest."""
+        if self._bucket is None:
+            self._bucket = bucket
+            return
+        if bucket <= self._bucket:
+            return
+        if bucket - self._bucket >= self._n_buckets:       # everything expired
+            for name in _TOTALS:
+                self._buckets[name][:] = 0
+                self._totals[name][:] = 0
+            self._bucket = bucket
+            return
+        for b in range(self._bucket + 1, bucket + 1):
+            for w, span in enumerate(self._spans):
+                slot = (b - span) % self._n_buckets        # bucket b - span just left window w
+                for name in _TOTALS:
+                    self._totals[name][w] -= self._buckets[name][slot]
+            for name in _TOTALS:
+                self._buckets[name][b % self._n_buckets] = 0
+        for name in _TOTALS:
+            np.maximum(self._totals[name], 0, out=self._totals[name])    # float drift
+        self._bucket = bucket
+
+    def _add(self, bucket, name, values):
+        self._buckets[name][bucket % self._n_buckets] += values
+        self._totals[name] += values
+
+    def _integrate(self, until):
+        """
+        Add held values × elapsed time up to `until`, bucket by bucket. A value
+        counts for at most MAX_GAP_S after its reading, never longer.
+        """
+        if self._clock is None or self._last is None:
+            self._clock = until
+            return
+        start = self._clock
+        stop = min(until, float(self._expiry.max()))
+        held = ~np.isnan(self._last)
+        values = np.where(held, self._last, 0.0)
+        above = held & (self._last > self.limits)
+        while start < stop:
+            bucket = int(start // BUCKET_S)
+            end = min(stop, (bucket + 1) * BUCKET_S)
+            seconds = np.where(held, np.clip(np.minimum(end, self._expiry) - start, 0.0, None), 0.0)
+            self._roll_to(bucket)
+            self._add(bucket, "value_s", values * seconds)
+            self._add(bucket, "covered_s", seconds)
+            self._add(bucket, "exceed_s", above * seconds)
+            start = end
+        self._roll_to(int(until // BUCKET_S))
+        self._clock = max(self._clock, until)
+
+    # ── updates ────────────────────────────────────────────────────────────
+
+    def update(self, zone_ids, values, at=None):
+        """Record readings (one row per zone, NaN = missing) taken at `at`."""
+        at = time.time() if at is None else at
+        values = np.asarray(values, dtype=np.float64).reshape(len(zone_ids), len(self.fields))
+        with self._lock:
+            self._integrate(at)
+            rows = self._rows(zone_ids)
+            bucket = int(at // BUCKET_S)
+            self._roll_to(bucket)
+            valid = ~np.isnan(values)
+            counts = np.zeros(self._last.shape)
+            exceed = np.zeros(self._last.shape)
+            counts[rows] = valid
+            with np.errstate(invalid="ignore"):
+                exceed[rows] = valid & (values > self.limits)
+            self._add(bucket, "readings", counts)
+            self._add(bucket, "exceed_readings", exceed)
+            self._last[rows] = np.where(valid, values, self._last[rows])
+            self._expiry[rows] = np.where(valid, at + MAX_GAP_S, self._expiry[rows])
+
+    # ── queries ────────────────────────────────────────────────────────────
+
+    def snapshot(self, zone_ids, at=None):
+        """
+        Window aggregates for zone_ids (missing zones → NaN / 0), each shaped
+        (zones, fields, windows) in the order of self.windows:
+        mean, covered_s, exceed_hours, readings, exceed_readings.
+        """
+        n, f, w = len(zone_ids), len(self.fields), len(self.windows)
+        out = {
+            "mean": np.full((n, f, w), np.nan), "covered_s": np.zeros((n, f, w)),
+            "exceed_hours": np.zeros((n, f, w)), "readings": np.zeros((n, f, w)),
+            "exceed_readings": np.zeros((n, f, w)),
+        }
+        with self._lock:
+            if self._last is None:
+                return out
+            self._integrate(time.time() if at is None else at)
+            known = np.array([zid in self._index for zid in zone_ids], dtype=bool)
+            rows = np.array([self._index[zid] for zid, k in zip(zone_ids, known) if k], dtype=np.int64)
+            totals = {name: self._totals[name][:, rows].transpose(1, 2, 0) for name in _TOTALS}
+        covered = totals["covered_s"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["mean"][known] = np.where(covered > 0, totals["value_s"] / covered, np.nan)
+        out["covered_s"][known] = covered
+        out["exceed_hours"][known] = totals["exceed_s"] / 3600
+        out["readings"][known] = totals["readings"]
+        out["exceed_readings"][known] = totals["exceed_readings"]
+        return out
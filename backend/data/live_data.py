@@ -14,6 +14,8 @@ import asyncio
 import time
 import logging
 
+from data.snapshot import bump_snapshot_version
+
 logger = logging.getLogger(__name__)
 
 # ── API Configuration ──────────────────────────────────────────────────────
@@ -40,7 +42,28 @@ def _cache_get(key):
 
 
 def _cache_set(key, data):
-    _cache[key] = {"data": data, "ts": time.time()}
+    previous = _cache.get(key)
+    changed = previous is None or previous["data"] != data
+    # Each entry remembers the snapshot version at which its readings last changed.
+    # The version is bumped only after the new data is in place, so a reader that
+    # sees the same version before and after building a snapshot saw no change.
+    entry = {"data": data, "ts": time.time(), "version": None if changed else previous["version"]}
+    _cache[key] = entry
+    if changed:
+        entry["version"] = bump_snapshot_version()
+
+
+def peek_zone_live_data(lat, lng):
+    """Return cached live data for a location if still fresh, without fetching."""
+    return _cache_get(f"{lat:.4f},{lng:.4f}")
+
+
+def peek_zone_live_version(lat, lng):
+    """(cached live data, version it last changed at) if still fresh, else (None, None)."""
+    entry = _cache.get(f"{lat:.4f},{lng:.4f}")
+    if entry and (time.time() - entry["ts"]) < CACHE_TTL_SECONDS:
+        return entry["data"], entry["version"]
+    return None, None
 
 
 # ═══════════════════════════════════════════════════════════════════════════
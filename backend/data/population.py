@@ -0,0 +1,110 @@
+"""
+District population and vulnerable-group counts per zone.
+
+Loaded once from data/district_population.csv (override with
+URBANECOTWIN_POPULATION_FILE; a GeoJSON FeatureCollection whose feature
+properties carry the same columns also works). Weight vectors are cached
+per zone list, so aggregations are dot products over arrays aligned with
+the zones being summarized.
+"""
+
+import os
+import csv
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+POPULATION_FILE = os.environ.get("URBANECOTWIN_POPULATION_FILE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "district_population.csv")
+COLUMNS = ["population", "children_0_6", "elderly_60_plus"]
+MAX_CACHED_VECTORS = 32
+
+_records = None
+_vectors = OrderedDict()
+_lock = threading.Lock()
+
+
+def _read_records(path):
+    if path.endswith((".geojson", ".json")):
+        with open(path, encoding="utf-8") as f:
+            rows = [feature.get("properties", {}) for feature in json.load(f).get("features", [])]
+    else:
+        with open(path, encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(line for line in f if not line.startswith("#")))
+    records = {}
+    for row in rows:
+        try:
+            records[row["zone_id"]] = {
+                **{c: float(row.get(c) or 0) for c in COLUMNS},
+                "district": row.get("district"),
+                "state": row.get("state"),
+            }
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Skipping population row {row}: {e}")
+    return records
+
+
+def population_records() -> dict:
+    """zone id → {population, children_0_6, elderly_60_plus, district, state}."""
+    global _records
+    if _records is None:
+        try:
+            _records = _read_records(POPULATION_FILE)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load population data from {POPULATION_FILE}: {e}")
+            _records = {}
+    return _records
+
+
+def population_vectors(zone_ids) -> dict:
+    """
+    Arrays aligned with zone_ids: population, children_0_6, elderly_60_plus,
+    vulnerable (children + elderly) and known (zone has population data).
+    Cached per zone list.
+    """
+    key = tuple(zone_ids)
+    with _lock:
+        cached = _vectors.get(key)
+        if cached is not None:
+            _vectors.move_to_end(key)
+            return cached
+    records = population_records()
+    empty = {c: 0.0 for c in COLUMNS}
+    matrix = np.array([[records.get(zid, empty)[c] for c in COLUMNS] for zid in zone_ids],
+                      dtype=np.float64).reshape(len(zone_ids), len(COLUMNS))
+    vectors = {c: matrix[:, i] for i, c in enumerate(COLUMNS)}
+    vectors["vulnerable"] = vectors["children_0_6"] + vectors["elderly_60_plus"]
+    vectors["known"] = np.array([zid in records for zid in zone_ids], dtype=bool)
+    with _lock:
+        _vectors[key] = vectors
+        while len(_vectors) > MAX_CACHED_VECTORS:
+            _vectors.popitem(last=False)
+    return vectors
+
+
+def group_weights(zone_ids, groups) -> tuple:
+    """
+    (group names, G × Z matrix of population weights): row g holds the
+    population of zones in group g, so matrix @ values gives population-weighted
+    sums for every group at once. Cached with the zone vectors.
+    """
+    key = ("groups", tuple(zone_ids), tuple(groups))
+    with _lock:
+        cached = _vectors.get(key)
+        if cached is not None:
+            _vectors.move_to_end(key)
+            return cached
+    names = sorted(set(groups))
+    codes = np.array([names.index(g) for g in groups], dtype=np.int64)
+    matrix = np.zeros((len(names), len(zone_ids)))
+    matrix[codes, np.arange(len(zone_ids))] = population_vectors(zone_ids)["population"]
+    with _lock:
+        _vectors[key] = (names, matrix)
+        while len(_vectors) > MAX_CACHED_VECTORS:
+            _vectors.popitem(last=False)
+    return names, matrix
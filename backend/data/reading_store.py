@@ -0,0 +1,118 @@
+"""
+Historical reading store.
+
+Every time get_all_zones() sees a zone reading that differs from the last
+one recorded for that zone, the reading is appended to a local SQLite table
+(backend/var/readings.sqlite3). Models that need history (anomaly detection,
+rolling windows, ...) train on this store instead of the current snapshot.
+
+Each batch of new readings is also published on the event bus as
+"readings.snapshot" with the changed zone ids and their values.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+import numpy as np
+
+from data.events import bus
+from data.snapshot import get_snapshot_version
+from data.storage import var_path
+
+logger = logging.getLogger(__name__)
+
+READINGS_DB_PATH = os.environ.get("URBANECOTWIN_READINGS_DB") or var_path("readings.sqlite3")
+RETENTION_DAYS = 90
+READINGS_TOPIC = "readings.snapshot"
+
+READING_FIELDS = [
+    "current_co2_ppm", "current_aqi", "pm2_5", "pm10",
+    "carbon_monoxide_ugm3", "nitrogen_dioxide_ugm3", "sulphur_dioxide_ugm3", "ozone_ugm3",
+    "avg_temperature_c", "avg_humidity_pct", "avg_wind_speed_kmh",
+]
+
+_lock = threading.Lock()
+_conn = None
+_last = {}      # zone id -> last recorded reading tuple
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(READINGS_DB_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{f} REAL" for f in READING_FIELDS)
+        _conn.execute(f"CREATE TABLE IF NOT EXISTS readings (zone_id TEXT NOT NULL, ts REAL NOT NULL, {columns})")
+        _conn.execute("CREATE INDEX IF NOT EXISTS readings_zone_ts ON readings (zone_id, ts)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts)")
+        _conn.execute("DELETE FROM readings WHERE ts < ?", (time.time() - RETENTION_DAYS * 86400,))
+        _conn.commit()
+    return _conn
+
+
+def record_readings(zones) -> int:
+    """Append readings that changed since the last call; returns the number of new rows."""
+    rows = []
+    now = time.time()
+    with _lock:
+        for zone in zones:
+            if not zone.get("current_co2_ppm"):
+                continue    # no live data for this zone
+            values = tuple(zone.get(f) for f in READING_FIELDS)
+            if _last.get(zone["id"]) != values:
+                _last[zone["id"]] = values
+                rows.append((zone["id"], now, *values))
+        if not rows:
+            return 0
+        try:
+            conn = _db()
+            placeholders = ", ".join("?" * (len(READING_FIELDS) + 2))
+            conn.executemany(f"INSERT INTO readings VALUES ({placeholders})", rows)
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record readings: {e}")
+            return 0
+    bus.publish(READINGS_TOPIC, {
+        "zone_ids": [r[0] for r in rows],
+        "fields": READING_FIELDS,
+        "values": [r[2:] for r in rows],
+        "recorded_at": now,
+        "snapshot_version": get_snapshot_version(),
+    })
+    return len(rows)
+
+
+def load_readings(since: float = None, fields=None, limit: int = None):
+    """
+    Readings as arrays: (zone_ids, timestamps, values (N, F)), oldest first.
+    With limit, the most recent `limit` rows are returned.
+    """
+    fields = fields or READING_FIELDS
+    sql = f"SELECT zone_id, ts, {', '.join(fields)} FROM readings"
+    args = []
+    if since is not None:
+        sql += " WHERE ts >= ?"
+        args.append(since)
+    sql += " ORDER BY ts DESC"
+    if limit:
+        sql += " LIMIT ?"
+        args.append(int(limit))
+    with _lock:
+        rows = _db().execute(sql, args).fetchall()
+    rows.reverse()
+    if not rows:
+        return [], np.zeros(0), np.zeros((0, len(fields)))
+    zone_ids = [r[0] for r in rows]
+    timestamps = np.array([r[1] for r in rows], dtype=np.float64)
+    values = np.array([r[2:] for r in rows], dtype=np.float64)   # NULL -> nan
+    return zone_ids, timestamps, values
+
+
+def reading_count(since: float = None) -> int:
+    with _lock:
+        if since is None:
+            return _db().execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        return _db().execute("SELECT COUNT(*) FROM readings WHERE ts >= ?", (since,)).fetchone()[0]
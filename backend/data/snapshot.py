@@ -0,0 +1,150 @@
+"""
+Snapshot versioning for live zone readings.
+
+The live-data cache bumps the snapshot version whenever a fetch brings in
+readings that differ from what was cached. Derived results can then be keyed
+by snapshot version and stop being served as soon as the data changes.
+"""
+
+import threading
+from collections import OrderedDict
+
+_lock = threading.Lock()
+_version = 0
+
+
+def get_snapshot_version() -> int:
+    """Current snapshot version (monotonic, starts at 0 before any data)."""
+    return _version
+
+
+def bump_snapshot_version() -> int:
+    """Mark the live readings as changed and return the new version."""
+    global _version
+    with _lock:
+        _version += 1
+        return _version
+
+
+class SnapshotCache:
+    """
+    Bounded LRU cache for results derived from one snapshot.
+
+    Entries are stored together with the snapshot version they were computed
+    on. As soon as a newer version is seen, older entries are dropped, so a
+    cache hit is always consistent with the current readings. Lookups and
+    stores under an older version (e.g. a run pinned to an earlier snapshot)
+    bypass the cache instead of moving it backwards.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _stale(self, version):
+        return self._version is not None and version is not None and version < self._version
+
+    def _advance(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """Return (hit, value) for key under the given snapshot version."""
+        with self._lock:
+            if self._stale(version):
+                self.misses += 1
+                return False, None
+            self._advance(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, value):
+        with self._lock:
+            if self._stale(version):
+                return
+            self._advance(version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key, value=None):
+        """Drop key; with value, only if it still maps to that value."""
+        with self._lock:
+            if value is None or self._entries.get(key) is value:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "snapshot_version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class LRUCache:
+    """
+    Bounded LRU cache for results whose keys carry their own version (e.g. a
+    zone's reading version), so nothing is invalidated wholesale.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (hit, value) for key."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,19 @@
+"""
+Local runtime storage for trained models, job state and other artifacts
+produced by the backend. Defaults to backend/var/, override with
+URBANECOTWIN_VAR_DIR.
+"""
+
+import os
+
+VAR_DIR = os.environ.get(
+    "URBANECOTWIN_VAR_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "var"),
+)
+
+
+def var_path(*parts) -> str:
+    """Absolute path under the runtime storage directory (parent dirs are created)."""
+    path = os.path.join(VAR_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
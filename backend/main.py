@@ -3,14 +3,30 @@ UrbanEcoTwin-NetZero — FastAPI Backend
 Multi-Agent AI-Powered Digital Twin for Net-Zero Sustainability Planning
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers.api import router as api_router
+from modules.agent_scheduler import start_scheduler, stop_scheduler
+from modules.report_export import prune_exports, clear_exports
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Background agents (disable with URBANECOTWIN_DISABLE_SCHEDULER=1)
+    start_scheduler()
+    prune_exports()
+    yield
+    stop_scheduler()
+    clear_exports()
+
 
 app = FastAPI(
     title="UrbanEcoTwin-NetZero API",
     description="AI-Powered Digital Twin for Net-Zero Sustainability Planning",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS — allow frontend
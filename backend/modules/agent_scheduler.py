@@ -0,0 +1,119 @@
+"""
+MODULE 6b: Agent Scheduler
+Runs the multi-agent system in the background, each agent on its own cadence.
+
+  - Monitoring: on every new data snapshot (and at least every 5 minutes)
+  - Prediction: every 15 minutes
+  - Optimization: every 30 minutes
+  - Policy: hourly
+Due agents of one tick share one AgentRun (same zones, shared memo) and
+publish their results on the event bus as "agents.<name>". API reads serve
+the latest published results; alerts and other subscribers react to them.
+
+Disable with URBANECOTWIN_DISABLE_SCHEDULER=1.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from data.city_data import get_zone_snapshot
+from data.events import bus
+from modules.multi_agent import AGENTS, AGENT_INTERVALS, AgentRun, agent_topic, _agent_executor, _timed
+
+logger = logging.getLogger(__name__)
+
+TICK_S = 30
+ON_SNAPSHOT = {"monitoring"}
+SCHEDULER_ENABLED = os.environ.get("URBANECOTWIN_DISABLE_SCHEDULER", "0") != "1"
+
+_state = {name: {"last_run": None, "snapshot_version": None, "runs": 0, "errors": 0} for name in AGENTS}
+_stop = threading.Event()
+_thread = None
+
+
+def _is_due(name, now, version):
+    state = _state[name]
+    if state["last_run"] is None:
+        return True
+    if name in ON_SNAPSHOT and version != state["snapshot_version"]:
+        return True
+    return now - state["last_run"] >= AGENT_INTERVALS[name]
+
+
+def run_due_agents(force=False):
+    """Run every agent that is due (or all with force) on one shared snapshot and publish the results."""
+    zones, version = get_zone_snapshot()     # refreshes the live-data cache when its TTL has expired
+    now = time.time()
+    due = [name for name in AGENTS if force or _is_due(name, now, version)]
+    if not due:
+        return []
+
+    run = AgentRun(zones=zones, version=version)
+    futures = {name: _agent_executor.submit(_timed, AGENTS[name].analyze, run=run) for name in due}
+    published = []
+    for name, future in futures.items():
+        state = _state[name]
+        state.update(last_run=now, snapshot_version=version)
+        try:
+            result, elapsed = future.result()
+        except Exception:
+            state["errors"] += 1
+            logger.exception(f"Scheduled {name} agent failed")
+            continue
+        state["runs"] += 1
+        next_run = datetime.fromtimestamp(now) + timedelta(seconds=AGENT_INTERVALS[name])
+        bus.publish(agent_topic(name), {
+            "result": result,
+            "snapshot_version": version,
+            "elapsed_s": elapsed,
+            "next_run_at": next_run.isoformat(),
+        })
+        published.append(name)
+    return published
+
+
+def _loop():
+    while not _stop.is_set():
+        try:
+            run_due_agents()
+        except Exception:
+            logger.exception("Agent scheduler tick failed")
+        _stop.wait(TICK_S)
+
+
+def start_scheduler():
+    """Start the background scheduler thread (no-op when disabled or already running)."""
+    global _thread
+    if not SCHEDULER_ENABLED or (_thread is not None and _thread.is_alive()):
+        return False
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="agent-scheduler", daemon=True)
+    _thread.start()
+    logger.info("Agent scheduler started")
+    return True
+
+
+def stop_scheduler():
+    _stop.set()
+
+
+def get_scheduler_status():
+    return {
+        "enabled": SCHEDULER_ENABLED,
+        "running": _thread is not None and _thread.is_alive(),
+        "tick_seconds": TICK_S,
+        "agents": {
+            name: {
+                "interval_s": AGENT_INTERVALS[name],
+                "on_new_snapshot": name in ON_SNAPSHOT,
+                "last_run": datetime.fromtimestamp(s["last_run"]).isoformat() if s["last_run"] else None,
+                "runs": s["runs"],
+                "errors": s["errors"],
+            }
+            for name, s in _state.items()
+        },
+        "topics": bus.topics(),
+    }
@@ -0,0 +1,318 @@
+"""
+MODULE 13b: Alert Rule DSL
+Alert conditions as small expressions kept in data/alert_rules.json, e.g.
+
+    co2 >= 470
+    aqi >= 120 or co2 >= 440
+    pm2_5 > 55 and wind < 5 for 30m
+    mean_8h(ozone_ugm3) > 100 or exceed_hours_24h(pm2_5) >= 6
+
+Expressions are parsed with `ast` (a whitelisted subset: comparisons,
+and / or / not, + - * /, numbers, reading fields or their aliases, abs(),
+min(), max() and rolling aggregates mean_<window>(field) /
+exceed_hours_<window>(field) from the health module's exposure windows) and
+compiled once into closures over NumPy arrays. A rule is evaluated for all
+zones at once; an optional `for <n>s|m|h|d` suffix requires the condition to
+have held continuously that long. The file is re-read when it changes, so
+edits take effect without a restart (duration timers start over).
+"""
+
+import os
+import re
+import ast
+import json
+import time
+import logging
+import threading
+from functools import reduce
+
+import numpy as np
+
+from data.exposure_windows import WINDOWS
+from data.reading_store import READING_FIELDS
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.environ.get("URBANECOTWIN_ALERT_RULES") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "alert_rules.json")
+
+
+class RuleError(ValueError):
+    """A rule or rule file that cannot be compiled."""
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  COMPILER
+# ═══════════════════════════════════════════════════════════════════════════
+
+_DURATION = re.compile(r"^(?P<expr>.+?)\s+for\s+(?P<n>\d+(?:\.\d+)?)\s*(?P<unit>[smhd])\s*$", re.S)
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+_AGGREGATE = re.compile(rf"^(?P<stat>mean|exceed_hours)_(?P<window>{'|'.join(WINDOWS)})$")
+
+_BINOPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+_CMPOPS = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less,
+    ast.LtE: np.less_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_FUNCS = {"abs": (np.abs, 1), "min": (np.minimum, 2), "max": (np.maximum, 2)}
+
+
+class Expression:
+    """A compiled expression: called with an evaluation context, returns one value per zone."""
+
+    def __init__(self, source, aliases):
+        self.source = source.strip()
+        self.fields = set()
+        self.aggregates = set()
+        self.duration_s = 0.0
+        text = self.source
+        match = _DURATION.match(text)
+        if match:
+            text = match["expr"]
+            self.duration_s = float(match["n"]) * _UNITS[match["unit"]]
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError as e:
+            raise RuleError(f"Invalid rule '{self.source}': {e.msg}") from None
+        self._aliases = aliases
+        self._fn = self._compile(tree.body)
+        self._since = np.zeros(0)       # per RuleSet zone row: when the condition started holding (NaN = not)
+
+    def _compile(self, node):
+        if isinstance(node, ast.BoolOp):
+            op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            parts = [self._compile(v) for v in node.values]
+            return lambda ctx: reduce(op, (p(ctx) for p in parts))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub)):
+            operand = self._compile(node.operand)
+            op = np.logical_not if isinstance(node.op, ast.Not) else np.negative
+            return lambda ctx: op(operand(ctx))
+        if isinstance(node, ast.Compare) and all(type(o) in _CMPOPS for o in node.ops):
+            terms = [self._compile(n) for n in [node.left, *node.comparators]]
+            pairs = [(_CMPOPS[type(o)], terms[i], terms[i + 1]) for i, o in enumerate(node.ops)]
+            return lambda ctx: reduce(np.logical_and, (op(a(ctx), b(ctx)) for op, a, b in pairs))
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            op, left, right = _BINOPS[type(node.op)], self._compile(node.left), self._compile(node.right)
+            return lambda ctx: op(left(ctx), right(ctx))
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = float(node.value)
+            return lambda ctx: value
+        if isinstance(node, ast.Name):
+            field = self._field(node.id)
+            self.fields.add(field)
+            return lambda ctx: ctx["fields"][field]
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            name = node.func.id
+            aggregate = _AGGREGATE.match(name)
+            if aggregate and len(node.args) == 1 and isinstance(node.args[0], ast.Name):
+                key = (aggregate["stat"], aggregate["window"], self._field(node.args[0].id))
+                self.aggregates.add(key)
+                return lambda ctx: ctx["aggregates"][key]
+            if name in _FUNCS and len(node.args) == _FUNCS[name][1]:
+                op, args = _FUNCS[name][0], [self._compile(a) for a in node.args]
+                return lambda ctx: op(*(a(ctx) for a in args))
+            raise RuleError(f"Unknown function {name}() in rule '{self.source}'")
+        raise RuleError(f"Unsupported syntax in rule '{self.source}': {ast.dump(node)[:60]}")
+
+    def _field(self, name):
+        field = self._aliases.get(name, name)
+        if field not in READING_FIELDS:
+            raise RuleError(f"Unknown field '{name}' in rule '{self.source}'")
+        return field
+
+    def __call__(self, ctx) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = np.broadcast_to(self._fn(ctx), (ctx["size"],))
+        if not self.duration_s or ctx["rows"] is None:
+            return result       # scenario contexts (e.g. forecasts) have no timers
+        # Condition must have held for duration_s (state per zone row of the owning RuleSet)
+        mask = result.astype(bool)
+        rows, now = ctx["rows"], ctx["now"]
+        if len(self._since) < ctx["capacity"]:
+            self._since = np.concatenate([self._since, np.full(ctx["capacity"] - len(self._since), np.nan)])
+        since = self._since[rows]
+        since = np.where(mask, np.where(np.isnan(since), now, since), np.nan)
+        self._since[rows] = since
+        return mask & (now - np.nan_to_num(since, nan=now) >= self.duration_s)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  RULE SETS
+# ═══════════════════════════════════════════════════════════════════════════
+
+class RuleSet:
+    """
+    All rules of one rule file, compiled. Groups:
+      alerts       — per type, ordered levels with enter / exit conditions (hysteresis)
+      monitoring   — threshold findings for the monitoring agent (first match per zone)
+      risk_levels  — digital twin risk classes (first match per zone, else default)
+    """
+
+    def __init__(self, config):
+        aliases = dict(config.get("aliases", {}))
+        self.aliases = aliases
+        self.expressions = []
+        if any(not group.get("levels") for group in config.get("alerts", [])):
+            raise RuleError("Every alert type needs at least one level")
+        self.alerts = [
+            {
+                "type": group["type"],
+                "value": self._expression(group["value"], aliases),
+                "levels": [
+                    {
+                        **{k: v for k, v in level.items() if k not in ("enter", "exit")},
+                        "enter": self._expression(level["enter"], aliases),
+                        "exit": self._expression(level["exit"], aliases),
+                    }
+                    for level in group["levels"]
+                ],
+            }
+            for group in config.get("alerts", [])
+        ]
+        self.monitoring = [
+            {
+                **rule,
+                "when": self._expression(rule["when"], aliases),
+                "value": self._expression(rule["value"], aliases),
+            }
+            for rule in config.get("monitoring", [])
+        ]
+        self.risk_levels = [
+            {**rule, "when": self._expression(rule["when"], aliases)}
+            for rule in config.get("risk_levels", [])
+        ]
+        self.default_risk_level = config.get("default_risk_level", "Low")
+        self.fields = set().union(*(e.fields for e in self.expressions))
+        self.aggregates = set().union(*(e.aggregates for e in self.expressions))
+        self.has_durations = any(e.duration_s for e in self.expressions)
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def _expression(self, source, aliases):
+        expression = Expression(str(source), aliases)
+        self.expressions.append(expression)
+        return expression
+
+    def context(self, zone_ids, columns, now=None) -> dict:
+        """
+        Evaluation context for zone_ids. `columns` maps each field in
+        self.fields to an array aligned with zone_ids; rolling aggregates are
+        looked up once for all rules.
+        """
+        with self._lock:
+            for zid in zone_ids:
+                if zid not in self._index:
+                    self._index[zid] = len(self._index)
+            rows = np.array([self._index[zid] for zid in zone_ids], dtype=np.int64)
+            capacity = len(self._index)
+        aggregates = {}
+        if self.aggregates and len(zone_ids):
+            from modules.health_impact import POLLUTANT_KEYS, exposure_windows
+            windows = exposure_windows([{"id": zid} for zid in zone_ids])
+            names = list(WINDOWS)
+            for stat, window, field in self.aggregates:
+                if field in POLLUTANT_KEYS:
+                    aggregates[(stat, window, field)] = windows[stat][:, POLLUTANT_KEYS.index(field), names.index(window)]
+                else:
+                    aggregates[(stat, window, field)] = np.full(len(zone_ids), np.nan)    # not tracked in windows
+        return {
+            "zone_ids": list(zone_ids), "size": len(zone_ids), "rows": rows, "capacity": capacity,
+            "now": time.time() if now is None else now,
+            "fields": {f: np.asarray(columns[f], dtype=np.float64) for f in self.fields},
+            "aggregates": aggregates,
+        }
+
+    def timed_zone_ids(self) -> list:
+        """Zones where a `for` condition is pending or held: they can change as time passes, without new readings."""
+        with self._lock:
+            ids = list(self._index)         # insertion order is row order
+        rows = set()
+        for expression in self.expressions:
+            if expression.duration_s:
+                rows.update(np.flatnonzero(~np.isnan(expression._since)).tolist())
+        return [ids[r] for r in sorted(rows)]
+
+    def scenario_context(self, columns, aggregates, size) -> dict:
+        """
+        Stateless context over `size` hypothetical rows (e.g. zones × forecast
+        hours): `for` durations are not tracked, conditions count as soon as they hold.
+        """
+        return {
+            "zone_ids": None, "size": size, "rows": None, "capacity": 0, "now": time.time(),
+            "fields": {f: np.broadcast_to(np.asarray(columns[f], dtype=np.float64), (size,)) for f in self.fields},
+            "aggregates": {k: np.broadcast_to(np.asarray(v, dtype=np.float64), (size,)) for k, v in aggregates.items()},
+        }
+
+    def zone_context(self, zones, now=None) -> dict:
+        """Context built from zone dicts (missing / None readings → NaN)."""
+        columns = {
+            f: np.array([np.nan if z.get(f) is None else z[f] for z in zones], dtype=np.float64)
+            for f in self.fields
+        }
+        return self.context([z["id"] for z in zones], columns, now)
+
+    def evaluate(self, rules, ctx, key="when") -> np.ndarray:
+        """First matching rule per zone (index into `rules`, -1 = none)."""
+        if not rules:
+            return np.full(ctx["size"], -1)
+        masks = np.stack([np.asarray(rule[key](ctx), dtype=bool) for rule in rules])
+        return np.where(masks.any(axis=0), masks.argmax(axis=0), -1)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  LOADING (hot reload)
+# ═══════════════════════════════════════════════════════════════════════════
+
+_state = {"rules": None, "mtime": None, "loaded_at": None, "error": None}
+_load_lock = threading.Lock()
+
+
+def get_rules() -> RuleSet:
+    """The current rule set, recompiled whenever the rule file changes."""
+    try:
+        mtime = os.stat(RULES_PATH).st_mtime_ns
+    except OSError as e:
+        mtime = None
+        if _state["rules"] is None:
+            raise RuleError(f"Alert rule file {RULES_PATH} not readable: {e}") from None
+    if mtime == _state["mtime"] or mtime is None:
+        return _state["rules"]
+    with _load_lock:
+        if mtime != _state["mtime"]:
+            try:
+                with open(RULES_PATH, encoding="utf-8") as f:
+                    rules = RuleSet(json.load(f))
+                _state.update(rules=rules, loaded_at=time.time(), error=None)
+                logger.info(f"Loaded alert rules from {RULES_PATH}")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Keep serving the last good rule set
+                _state["error"] = str(e)
+                logger.warning(f"Could not load alert rules from {RULES_PATH}: {e}")
+                if _state["rules"] is None:
+                    raise RuleError(f"Could not load alert rules from {RULES_PATH}: {e}") from None
+            _state["mtime"] = mtime
+    return _state["rules"]
+
+
+def format_message(template, zone_name, value, threshold=None) -> str:
+    shown = round(value) if float(value).is_integer() else round(value, 1)
+    return template.format(zone=zone_name, value=shown, threshold=threshold)
+
+
+def get_rules_status():
+    rules = get_rules()
+    return {
+        "path": RULES_PATH,
+        "loaded_at": _state["loaded_at"],
+        "error": _state["error"],
+        "alerts": [
+            {"type": g["type"], "value": g["value"].source,
+             "levels": [{"severity": l["severity"], "enter": l["enter"].source, "exit": l["exit"].source} for l in g["levels"]]}
+            for g in rules.alerts
+        ],
+        "monitoring": [{"id": r["id"], "when": r["when"].source} for r in rules.monitoring],
+        "risk_levels": [{"level": r["level"], "when": r["when"].source} for r in rules.risk_levels],
+        "default_risk_level": rules.default_risk_level,
+        "fields": sorted(rules.fields),
+        "aggregates": sorted(f"{stat}_{window}({field})" for stat, window, field in rules.aggregates),
+    }
@@ -1,101 +1,379 @@
 """
 MODULE 13: Sustainability Alert System
-Generates alerts for high-risk zones based on environmental thresholds.
+Stateful threshold alerts for high-risk zones.
+
+  - Evaluated incrementally: only zones whose readings changed (the reading
+    store's "readings.snapshot" events) are re-checked
+  - Rules come from the alert rule DSL (data/alert_rules.json, hot-reloaded):
+    each alert type has ordered levels with an enter and an exit condition,
+    so readings oscillating around a threshold do not flap. All types and
+    levels are evaluated as vectorized predicates in one pass
+  - One alert per zone and metric with a stable id; severity changes update
+    it in place. Lifecycle: open → acknowledged → resolved (automatically
+    when the condition clears, or by an operator)
+  - Alerts and their transitions persist in SQLite under backend/var/, and
+    every transition is published once on the event bus as "alerts.transitions"
 """
 
-from datetime import datetime
-from data.city_data import get_all_zones
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
 
+import numpy as np
 
-# Alert thresholds
-THRESHOLDS = {
-    "co2_critical": 470,
-    "co2_warning": 440,
-    "co2_caution": 420,
-    "aqi_critical": 150,
-    "aqi_warning": 120,
-    "aqi_caution": 100,
-}
+from data.city_data import ZONES, get_all_zones
+from data.events import bus
+from data.reading_store import READINGS_TOPIC, READING_FIELDS
+from data.storage import var_path
+from modules.alert_rules import format_message, get_rules
+from modules.multi_agent import agent_topic
+from modules.predictive_alerts import get_predictive_alerts
 
+logger = logging.getLogger(__name__)
 
-def get_alerts(state=None):
-    """Generate sustainability alerts for all zones."""
-    zones = get_all_zones(state=state)
+ALERTS_DB_PATH = os.environ.get("URBANECOTWIN_ALERTS_DB") or var_path("alerts.sqlite3")
+ALERTS_TOPIC = "alerts.transitions"
+RETENTION_DAYS = 30
+
+ACTIVE_STATUSES = ("open", "acknowledged")
+SEVERITY_ORDER = {"critical": 0, "warning": 1, "info": 2}
+
+
+def alert_levels(enter, stay, current) -> np.ndarray:
+    """
+    New level per zone (0 = clear, k = k-th level) with hysteresis: the
+    highest level whose enter condition holds, or the highest level up to the
+    current one whose exit condition does not. enter / stay: zones × levels.
+    """
+    rank = np.arange(1, enter.shape[1] + 1)
+    entered = np.where(enter, rank, 0).max(axis=1)
+    held = np.where(stay & (rank <= np.asarray(current)[:, None]), rank, 0).max(axis=1)
+    return np.maximum(entered, held)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  STORAGE
+# ═══════════════════════════════════════════════════════════════════════════
+
+_lock = threading.Lock()
+_conn = None
+# Per zone row: latest readings and, per alert type, the level held and its active alert id (0 = none)
+_state = {"ids": [], "index": {}, "latest": np.zeros((0, len(READING_FIELDS))), "levels": {}, "alert_ids": {}}
+
+_COLUMNS = ("id", "zone_id", "zone_name", "state", "type", "severity", "status", "value", "peak_value",
+            "threshold", "title", "message", "recommended_action", "color", "opened_at", "updated_at",
+            "acknowledged_at", "resolved_at", "resolved_by")
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(ALERTS_DB_PATH, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                zone_id TEXT NOT NULL,
+                zone_name TEXT,
+                state TEXT,
+                type TEXT NOT NULL,
+                level INTEGER NOT NULL,
+                severity TEXT NOT NULL,
+                status TEXT NOT NULL,
+                value REAL,
+                peak_value REAL,
+                threshold REAL,
+                title TEXT,
+                message TEXT,
+                recommended_action TEXT,
+                color TEXT,
+                opened_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                acknowledged_at TEXT,
+                resolved_at TEXT,
+                resolved_by TEXT
+            )
+        """)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS alert_events (
+                alert_id INTEGER NOT NULL,
+                ts TEXT NOT NULL,
+                event TEXT NOT NULL,
+                severity TEXT,
+                value REAL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS alerts_status ON alerts (status, state)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS alerts_opened ON alerts (opened_at)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS alert_events_alert ON alert_events (alert_id, ts)")
+        cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).isoformat()
+        _conn.execute("DELETE FROM alert_events WHERE alert_id IN "
+                      "(SELECT id FROM alerts WHERE resolved_at IS NOT NULL AND resolved_at < ?)", (cutoff,))
+        _conn.execute("DELETE FROM alerts WHERE resolved_at IS NOT NULL AND resolved_at < ?", (cutoff,))
+        _conn.commit()
+        # Hysteresis state continues from the alerts left active by a previous process
+        for row in _conn.execute(f"SELECT id, zone_id, type, level FROM alerts WHERE status IN {ACTIVE_STATUSES}"):
+            r = _rows([row["zone_id"]])[0]
+            levels, alert_ids = _type_arrays(row["type"])
+            levels[r], alert_ids[r] = row["level"], row["id"]
+    return _conn
+
+
+def _rows(zone_ids):
+    """Row per zone id, growing the engine arrays (by doubling) for new zones."""
+    index = _state["index"]
+    for zid in zone_ids:
+        if zid not in index:
+            index[zid] = len(_state["ids"])
+            _state["ids"].append(zid)
+    capacity = len(_state["latest"])
+    if len(_state["ids"]) > capacity:
+        size = max(len(_state["ids"]), 2 * capacity, 64)
+        latest = np.full((size, len(READING_FIELDS)), np.nan)
+        latest[:capacity] = _state["latest"]
+        _state["latest"] = latest
+        for arrays in (_state["levels"], _state["alert_ids"]):
+            for name, arr in arrays.items():
+                arrays[name] = np.concatenate([arr, np.zeros(size - capacity, dtype=np.int64)])
+    return np.array([index[zid] for zid in zone_ids], dtype=np.int64)
+
+
+def _type_arrays(alert_type):
+    if alert_type not in _state["levels"]:
+        _state["levels"][alert_type] = np.zeros(len(_state["latest"]), dtype=np.int64)
+        _state["alert_ids"][alert_type] = np.zeros(len(_state["latest"]), dtype=np.int64)
+    return _state["levels"][alert_type], _state["alert_ids"][alert_type]
+
+
+def _alert(row):
+    alert = {k: row[k] for k in _COLUMNS}
+    for k in ("value", "peak_value", "threshold"):     # REAL columns: show whole readings as ints again
+        if alert[k] is not None and float(alert[k]).is_integer():
+            alert[k] = int(alert[k])
+    alert["timestamp"] = alert["opened_at"]
+    return alert
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  EVALUATION
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _fields(spec, zone_id, value):
+    zone = ZONES.get(zone_id, {})
+    return {
+        "zone_name": zone.get("name", zone_id),
+        "state": zone.get("state"),
+        "severity": spec["severity"],
+        "threshold": spec.get("threshold"),
+        "color": spec.get("color"),
+        "title": spec.get("title"),
+        "message": format_message(spec.get("message", ""), zone.get("name", zone_id), value, spec.get("threshold")),
+        "recommended_action": spec.get("recommended_action"),
+    }
+
+
+def _transition(conn, alert_id, event, severity, value, ts, transitions):
+    conn.execute("INSERT INTO alert_events VALUES (?, ?, ?, ?, ?)", (alert_id, ts, event, severity, value))
+    transitions.append((alert_id, event))
+
+
+def _resolve(conn, alert_id, value, ts, resolved_by, transitions):
+    conn.execute("UPDATE alerts SET level = 0, status = 'resolved', value = COALESCE(?, value), updated_at = ?, "
+                 "resolved_at = ?, resolved_by = ? WHERE id = ?", (value, ts, ts, resolved_by, alert_id))
+    _transition(conn, alert_id, "resolved", None, value, ts, transitions)
+
+
+def _apply_group(conn, group, ids, rows, fresh, ctx, ts, transitions):
+    """Level transitions of one alert type for the evaluated zones; Python work only for touched zones."""
+    alert_type, levels = group["type"], group["levels"]
+    level_arr, id_arr = _type_arrays(alert_type)
+    enter = np.stack([np.asarray(l["enter"](ctx), dtype=bool) for l in levels], axis=1)
+    stay = ~np.stack([np.asarray(l["exit"](ctx), dtype=bool) for l in levels], axis=1)
+    values = np.asarray(group["value"](ctx), dtype=np.float64)
+    current = np.minimum(level_arr[rows], len(levels))      # the rule file may have dropped levels
+    new = alert_levels(enter, stay, current)
+    alert_ids = id_arr[rows]
+    level_arr[rows] = new
+
+    for k in np.flatnonzero((new != current) | ((alert_ids > 0) & fresh)).tolist():
+        zid, old, level, alert_id = ids[k], int(current[k]), int(new[k]), int(alert_ids[k])
+        value = None if np.isnan(values[k]) else float(values[k])
+        if level == 0:
+            if alert_id:
+                _resolve(conn, alert_id, value, ts, "auto", transitions)
+                id_arr[rows[k]] = 0
+        elif not alert_id:
+            if level < old or value is None:
+                continue    # resolved by hand: stays closed unless it escalates
+            f = _fields(levels[level - 1], zid, value)
+            cursor = conn.execute(
+                "INSERT INTO alerts (zone_id, zone_name, state, type, level, severity, status, value, peak_value, "
+                "threshold, title, message, recommended_action, color, opened_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'open', ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (zid, f["zone_name"], f["state"], alert_type, level, f["severity"], value, value, f["threshold"],
+                 f["title"], f["message"], f["recommended_action"], f["color"], ts, ts),
+            )
+            id_arr[rows[k]] = cursor.lastrowid
+            _transition(conn, cursor.lastrowid, "opened", f["severity"], value, ts, transitions)
+        elif value is None:
+            continue
+        elif level != old:
+            f = _fields(levels[level - 1], zid, value)
+            escalated = level > old
+            conn.execute(
+                "UPDATE alerts SET level = ?, severity = ?, value = ?, peak_value = MAX(peak_value, ?), "
+                "threshold = ?, title = ?, message = ?, recommended_action = ?, color = ?, updated_at = ?"
+                + (", status = 'open', acknowledged_at = NULL" if escalated else "") + " WHERE id = ?",
+                (level, f["severity"], value, value, f["threshold"], f["title"], f["message"],
+                 f["recommended_action"], f["color"], ts, alert_id),
+            )
+            _transition(conn, alert_id, "escalated" if escalated else "deescalated", f["severity"], value, ts, transitions)
+        else:
+            conn.execute("UPDATE alerts SET value = ?, peak_value = MAX(peak_value, ?), message = ?, updated_at = ? "
+                         "WHERE id = ?", (value, value, _fields(levels[level - 1], zid, value)["message"], ts, alert_id))
+
+
+def evaluate(zone_ids, values, fields, at=None) -> list:
+    """
+    Absorb new readings for zone_ids (values: one row per zone in `fields`
+    order) and apply level transitions for every alert type. Only these zones
+    are re-checked, plus zones with a pending or held `for` duration timer.
+    Returns [(alert id, event)] for what changed.
+    """
+    now = time.time() if at is None else at
+    ts = datetime.fromtimestamp(now).isoformat()
+    values = np.asarray(values, dtype=np.float64).reshape(len(zone_ids), len(fields))
+    rules = get_rules()
+    transitions = []
+    with _lock:
+        conn = _db()
+        fresh_rows = _rows(zone_ids)
+        latest = _state["latest"]
+        for j, field in enumerate(READING_FIELDS):
+            if field in fields:
+                latest[fresh_rows, j] = values[:, fields.index(field)]
+        ids, rows = list(zone_ids), fresh_rows
+        if rules.has_durations:
+            fresh_ids = set(zone_ids)
+            timed = [zid for zid in rules.timed_zone_ids() if zid not in fresh_ids and zid in _state["index"]]
+            if timed:
+                ids, rows = ids + timed, np.concatenate([rows, _rows(timed)])
+        fresh = np.isin(rows, fresh_rows)
+        ctx = rules.context(ids, {f: latest[rows, READING_FIELDS.index(f)] for f in rules.fields}, now)
+        for group in rules.alerts:
+            _apply_group(conn, group, ids, rows, fresh, ctx, ts, transitions)
+
+        # Alert types removed from the rule file
+        types = {group["type"] for group in rules.alerts}
+        for alert_type in [t for t in _state["alert_ids"] if t not in types]:
+            for alert_id in _state["alert_ids"][alert_type][_state["alert_ids"][alert_type] > 0].tolist():
+                _resolve(conn, alert_id, None, ts, "rule_removed", transitions)
+            del _state["levels"][alert_type], _state["alert_ids"][alert_type]
+        conn.commit()
+    if transitions:
+        _publish(transitions)
+    return transitions
+
+
+def _publish(transitions):
+    ids = sorted({alert_id for alert_id, _ in transitions})
+    with _lock:
+        rows = {row["id"]: _alert(row) for row in _db().execute(
+            f"SELECT * FROM alerts WHERE id IN ({', '.join('?' * len(ids))})", ids)}
+    bus.publish(ALERTS_TOPIC, {"transitions": [{"event": event, "alert": rows[alert_id]} for alert_id, event in transitions]})
+
+
+def _on_readings(event):
+    payload = event.payload
+    try:
+        evaluate(payload["zone_ids"], [[v if v is not None else np.nan for v in row] for row in payload["values"]],
+                 payload["fields"], payload["recorded_at"])
+    except sqlite3.Error as e:
+        logger.warning(f"Could not evaluate alerts: {e}")
+
+
+bus.subscribe(READINGS_TOPIC, _on_readings)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  MONITORING (informational, replaced on every monitoring run)
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Informational alerts from the latest background monitoring run (hotspots, ML anomalies)
+_monitoring_alerts = {"version": None, "alerts": []}
+
+
+def _on_monitoring_published(event):
+    result = event.payload["result"]
+    names = {s["zone_id"]: s["zone_name"] for s in result.get("zone_status", [])}
     alerts = []
-    alert_id = 1
-
-    for zone in zones:
-        # CO₂ alerts
-        if zone["current_co2_ppm"] >= THRESHOLDS["co2_critical"]:
-            alerts.append({
-                "id": alert_id,
-                "zone_id": zone["id"],
-                "zone_name": zone["name"],
-                "type": "co2",
-                "severity": "critical",
-                "color": "#ef4444",
-                "title": "🚨 Critical CO₂ Level",
-                "message": f"CO₂ levels at {zone['current_co2_ppm']} ppm in {zone['name']} — exceeds critical threshold ({THRESHOLDS['co2_critical']} ppm)",
-                "value": zone["current_co2_ppm"],
-                "threshold": THRESHOLDS["co2_critical"],
-                "recommended_action": "Immediate emission controls required. Activate emergency air quality protocols.",
-                "timestamp": datetime.now().isoformat(),
-            })
-            alert_id += 1
-        elif zone["current_co2_ppm"] >= THRESHOLDS["co2_warning"]:
-            alerts.append({
-                "id": alert_id,
-                "zone_id": zone["id"],
-                "zone_name": zone["name"],
-                "type": "co2",
-                "severity": "warning",
-                "color": "#f97316",
-                "title": "⚠️ Elevated CO₂ Level",
-                "message": f"CO₂ at {zone['current_co2_ppm']} ppm in {zone['name']} — approaching critical threshold",
-                "value": zone["current_co2_ppm"],
-                "threshold": THRESHOLDS["co2_warning"],
-                "recommended_action": "Increase monitoring frequency. Prepare emission reduction measures.",
-                "timestamp": datetime.now().isoformat(),
-            })
-            alert_id += 1
-
-        # AQI alerts
-        if zone["current_aqi"] >= THRESHOLDS["aqi_critical"]:
-            alerts.append({
-                "id": alert_id,
-                "zone_id": zone["id"],
-                "zone_name": zone["name"],
-                "type": "aqi",
-                "severity": "critical",
-                "color": "#ef4444",
-                "title": "🚨 Hazardous Air Quality",
-                "message": f"AQI at {zone['current_aqi']} in {zone['name']} — hazardous to health",
-                "value": zone["current_aqi"],
-                "threshold": THRESHOLDS["aqi_critical"],
-                "recommended_action": "Issue public health advisory. Restrict outdoor activities.",
-                "timestamp": datetime.now().isoformat(),
-            })
-            alert_id += 1
-        elif zone["current_aqi"] >= THRESHOLDS["aqi_warning"]:
-            alerts.append({
-                "id": alert_id,
-                "zone_id": zone["id"],
-                "zone_name": zone["name"],
-                "type": "aqi",
-                "severity": "warning",
-                "color": "#f97316",
-                "title": "⚠️ Poor Air Quality",
-                "message": f"AQI at {zone['current_aqi']} in {zone['name']} — unhealthy for sensitive groups",
-                "value": zone["current_aqi"],
-                "threshold": THRESHOLDS["aqi_warning"],
-                "recommended_action": "Advisory for sensitive groups to limit outdoor exposure.",
-                "timestamp": datetime.now().isoformat(),
-            })
-            alert_id += 1
-
-    # Sort by severity
-    severity_order = {"critical": 0, "warning": 1, "info": 2}
-    alerts.sort(key=lambda x: severity_order.get(x["severity"], 3))
+    for hotspot in result.get("geo_spatial_hotspots", []):
+        alerts.append({
+            "id": f"hotspot-{hotspot.get('propagation_source_id')}",
+            "zone_id": hotspot.get("propagation_source_id"),
+            "zone_name": hotspot["propagation_source"],
+            "zone_ids": hotspot["zone_ids"],
+            "type": "hotspot",
+            "severity": "info",
+            "status": "open",
+            "color": "#3b82f6",
+            "title": "🛰️ Pollution Hotspot Cluster",
+            "message": hotspot["message"],
+            "value": hotspot["avg_co2_ppm"],
+            "threshold": None,
+            "recommended_action": "Coordinate controls across the clustered zones, starting at the propagation source.",
+        })
+    for anomaly in result.get("anomalies", []):
+        if anomaly.get("method") != "isolation_forest":
+            continue
+        alerts.append({
+            "id": f"anomaly-{anomaly['zone_id']}",
+            "zone_id": anomaly["zone_id"],
+            "zone_name": names.get(anomaly["zone_id"], anomaly.get("zone_name")),
+            "type": "anomaly",
+            "severity": "info",
+            "status": "open",
+            "color": "#3b82f6",
+            "title": "🔍 Unusual Reading Pattern",
+            "message": f"ML anomaly detection flagged an unusual CO₂/AQI/PM2.5 combination in {anomaly.get('zone_name')}",
+            "value": None,
+            "threshold": None,
+            "recommended_action": "Verify sensor readings and check for local emission events.",
+        })
+    _monitoring_alerts.update(version=event.version, published_at=event.published_at, alerts=alerts)
+
+
+bus.subscribe(agent_topic("monitoring"), _on_monitoring_published)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  QUERIES & LIFECYCLE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def get_alerts(state=None):
+    """Active sustainability alerts (threshold alerts plus the latest monitoring findings)."""
+    get_all_zones(state=state)      # refreshes readings; changed zones are evaluated via the event bus
+    sql = f"SELECT * FROM alerts WHERE status IN {ACTIVE_STATUSES}"
+    args = ()
+    if state:
+        sql += " AND state = ?"
+        args = (state,)
+    with _lock:
+        alerts = [_alert(row) for row in _db().execute(sql, args)]
+
+    for info in _monitoring_alerts["alerts"]:
+        if not state or ZONES.get(info["zone_id"], {}).get("state") == state:
+            alerts.append({**info, "timestamp": _monitoring_alerts["published_at"]})
+
+    predictive = get_predictive_alerts(state=state)
+
+    # Sort by severity, newest first within a severity
+    alerts.sort(key=lambda x: x["timestamp"] or "", reverse=True)
+    alerts.sort(key=lambda x: SEVERITY_ORDER.get(x["severity"], 3))
 
     return {
         "alerts": alerts,
@@ -103,5 +381,67 @@ def get_alerts(state=None):
         "critical_count": sum(1 for a in alerts if a["severity"] == "critical"),
         "warning_count": sum(1 for a in alerts if a["severity"] == "warning"),
         "info_count": sum(1 for a in alerts if a["severity"] == "info"),
+        "predictive_alerts": predictive["alerts"],
+        "predictive_count": predictive["total_alerts"],
         "last_checked": datetime.now().isoformat(),
     }
+
+
+def get_alert(alert_id: int):
+    """One alert with its transition history, or None."""
+    with _lock:
+        conn = _db()
+        row = conn.execute("SELECT * FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        if row is None:
+            return None
+        events = conn.execute("SELECT ts, event, severity, value FROM alert_events WHERE alert_id = ? ORDER BY ts",
+                              (alert_id,)).fetchall()
+    return {**_alert(row), "history": [dict(e) for e in events]}
+
+
+def get_alert_history(state=None, status=None, limit: int = 100):
+    """Alerts newest first, including resolved ones."""
+    sql, clauses, args = "SELECT * FROM alerts", [], []
+    if state:
+        clauses.append("state = ?")
+        args.append(state)
+    if status:
+        clauses.append("status = ?")
+        args.append(status)
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY opened_at DESC LIMIT ?"
+    args.append(int(limit))
+    with _lock:
+        return [_alert(row) for row in _db().execute(sql, args)]
+
+
+def _set_status(alert_id, status, allowed_from, **fields):
+    ts = datetime.now().isoformat()
+    with _lock:
+        conn = _db()
+        row = conn.execute("SELECT status, zone_id, type, severity, value FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        if row is None:
+            return None
+        if row["status"] not in allowed_from:
+            return {"error": f"Alert is {row['status']}"}
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE alerts SET status = ?, updated_at = ?, {assignments} WHERE id = ?",
+                     (status, ts, *[ts if v is None else v for v in fields.values()], alert_id))
+        event = "acknowledged" if status == "acknowledged" else "resolved"
+        _transition(conn, alert_id, event, row["severity"], row["value"], ts, [])
+        conn.commit()
+        if status == "resolved" and row["type"] in _state["alert_ids"]:
+            _state["alert_ids"][row["type"]][_state["index"][row["zone_id"]]] = 0
+    _publish([(alert_id, event)])
+    return get_alert(alert_id)
+
+
+def acknowledge_alert(alert_id: int):
+    """open → acknowledged. None if the alert does not exist."""
+    return _set_status(alert_id, "acknowledged", ("open",), acknowledged_at=None)
+
+
+def resolve_alert(alert_id: int):
+    """Close an active alert by hand; it only reopens if the zone escalates or clears and re-enters."""
+    return _set_status(alert_id, "resolved", ACTIVE_STATUSES, resolved_at=None, resolved_by="operator")
@@ -0,0 +1,261 @@
+"""
+MODULE 6c: Anomaly Detection Service
+Isolation Forest trained on the historical reading store instead of being
+refit on every monitoring call.
+
+  - Training: the most recent MAX_TRAINING_ROWS readings (data/reading_store),
+    fitted in a background process and persisted to backend/var/anomaly_model.pkl
+  - Scoring:  each snapshot batch goes through decision_function only
+              (score < 0 ⇒ anomaly, same cut as IsolationForest.predict)
+  - Retraining: every RETRAIN_INTERVAL_S when history has grown, or when the
+    scored batch drifts from the training distribution (standardized mean
+    shift > DRIFT_Z, or an anomaly rate above DRIFT_RATE_FACTOR × contamination)
+    and the model is older than DRIFT_COOLDOWN_S
+
+With too little history (cold start) the model is fitted synchronously on the
+available history plus the current batch, matching the previous behaviour.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data.reading_store import load_readings, reading_count
+from data.storage import var_path
+
+try:
+    import joblib
+    from sklearn.ensemble import IsolationForest
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.environ.get("URBANECOTWIN_ANOMALY_MODEL") or var_path("anomaly_model.pkl")
+FEATURES = ["current_co2_ppm", "current_aqi", "pm2_5"]
+PM25_SCALE = 10.0           # pm2_5 is scaled down to the range of the other features
+CONTAMINATION = 0.15
+N_ESTIMATORS = 100
+MIN_TRAINING_ROWS = 500
+MAX_TRAINING_ROWS = 50_000
+RETRAIN_INTERVAL_S = 6 * 3600
+RETRAIN_MIN_GROWTH = 0.2    # scheduled retrain only when history grew by 20%
+DRIFT_Z = 0.5
+DRIFT_RATE_FACTOR = 2.0
+DRIFT_COOLDOWN_S = 1800     # minimum model age before a drift-triggered retrain
+
+_lock = threading.Lock()
+_state = {"artifact": None, "mtime": None, "pending": None, "last_drift": None, "retrains": 0}
+_pool = None
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  FEATURES + FITTING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _feature_matrix(values: np.ndarray) -> np.ndarray:
+    """(N, 3) raw [co2, aqi, pm2_5] → model features; missing pm2_5 counts as 0."""
+    X = np.array(values, dtype=np.float64, copy=True)
+    X[:, 2] = np.nan_to_num(X[:, 2]) / PM25_SCALE
+    return X
+
+
+def _zone_features(zones) -> np.ndarray:
+    return _feature_matrix([[z.get(f) if z.get(f) is not None else np.nan for f in FEATURES] for z in zones])
+
+
+def _fit_model(X: np.ndarray, seed: int = 42):
+    """Top-level so it can run in the training process."""
+    model = IsolationForest(n_estimators=N_ESTIMATORS, contamination=CONTAMINATION, random_state=seed)
+    model.fit(X)
+    return model
+
+
+def _history_features(zones=None):
+    """
+    Feature rows from the reading store. With zones, a zone's latest stored row
+    is left out when it is the zone's current reading, i.e. the store already
+    holds this batch and the caller adds it itself.
+    """
+    zone_ids, _, values = load_readings(fields=FEATURES, limit=MAX_TRAINING_ROWS)
+    keep = ~np.isnan(values[:, :2]).any(axis=1)     # co2 / aqi are required
+    if zones:
+        latest = {zid: i for i, zid in enumerate(zone_ids)}
+        for z in zones:
+            i = latest.get(z["id"])
+            current = np.array([z.get(f) for f in FEATURES], dtype=np.float64)
+            if i is not None and np.array_equal(values[i], current, equal_nan=True):
+                keep[i] = False
+    values = values[keep]
+    return _feature_matrix(values) if len(values) else np.zeros((0, len(FEATURES)))
+
+
+def _artifact(model, X, reason):
+    return {
+        "model": model,
+        "mean": X.mean(axis=0),
+        "std": X.std(axis=0) + 1e-9,
+        "n_rows": len(X),
+        "trained_at": time.time(),
+        "reason": reason,
+        "features": FEATURES,
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  PERSISTENCE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _save(artifact):
+    tmp_path = f"{MODEL_PATH}.tmp"
+    try:
+        joblib.dump(artifact, tmp_path)
+        os.replace(tmp_path, MODEL_PATH)
+        return os.path.getmtime(MODEL_PATH)
+    except OSError as e:
+        logger.warning(f"Could not save anomaly model to {MODEL_PATH}: {e}")
+        return None
+
+
+def _load():
+    """Persisted artifact (reloaded when the file changes), or None."""
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return _state["artifact"]
+    if _state["mtime"] != mtime:
+        try:
+            artifact = joblib.load(MODEL_PATH)
+            if artifact.get("features") != FEATURES:
+                logger.warning(f"Anomaly model at {MODEL_PATH} uses other features — ignoring it")
+                artifact = None
+        except Exception as e:
+            logger.warning(f"Could not load anomaly model from {MODEL_PATH}: {e}")
+            artifact = None
+        _state.update(mtime=mtime, artifact=artifact or _state["artifact"])
+    return _state["artifact"]
+
+
+def _install(artifact):
+    with _lock:
+        mtime = _save(artifact)
+        _state.update(artifact=artifact, mtime=mtime)
+        _state["retrains"] += 1
+    logger.info(f"Anomaly model trained on {artifact['n_rows']} readings ({artifact['reason']})")
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  RETRAINING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=1)
+    return _pool
+
+
+def retrain(reason: str = "manual", background: bool = True):
+    """Fit a new model on the reading history. Returns False if one is already training."""
+    with _lock:
+        pending = _state["pending"]
+        if pending is not None and not pending.done():
+            return False
+        X = _history_features()
+        if len(X) < MIN_TRAINING_ROWS:
+            return False
+        future = None
+        if background:
+            try:
+                future = _executor().submit(_fit_model, X)
+            except RuntimeError:    # pool shut down or broken — train in-process instead
+                future = None
+        _state["pending"] = future
+    if future is None:
+        _install(_artifact(_fit_model(X), X, reason))
+        return True
+
+    def _done(done):
+        try:
+            _install(_artifact(done.result(), X, reason))
+        except Exception:
+            logger.exception("Background anomaly model training failed")
+
+    future.add_done_callback(_done)
+    return True
+
+
+def _check_retrain(artifact, X, flags):
+    if artifact["n_rows"] < MIN_TRAINING_ROWS:     # cold-start model
+        if reading_count() >= MIN_TRAINING_ROWS:
+            retrain("history available")
+        return
+    shift = np.abs(X.mean(axis=0) - artifact["mean"]) / artifact["std"]
+    rate = float(flags.mean()) if len(flags) else 0.0
+    age = time.time() - artifact["trained_at"]
+    if shift.max() > DRIFT_Z or rate > DRIFT_RATE_FACTOR * CONTAMINATION:
+        _state["last_drift"] = {
+            "at": datetime.now().isoformat(),
+            "max_mean_shift_z": round(float(shift.max()), 3),
+            "anomaly_rate": round(rate, 3),
+        }
+        if age >= DRIFT_COOLDOWN_S:
+            retrain("drift")
+    elif age >= RETRAIN_INTERVAL_S:
+        if reading_count() >= artifact["n_rows"] * (1 + RETRAIN_MIN_GROWTH):
+            retrain("scheduled")
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  SCORING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def score_zones(zones):
+    """
+    Anomaly scores for one snapshot batch: (scores, is_anomaly) arrays aligned
+    with zones. Lower scores are more anomalous; None without scikit-learn.
+    """
+    if not HAS_SKLEARN or not zones:
+        return None
+    X = _zone_features(zones)
+    X = np.nan_to_num(X)
+    artifact = _load()
+    if artifact is None:
+        history = _history_features(zones)
+        train = np.vstack([history, X])
+        if len(train) < 3:
+            return None
+        artifact = _artifact(_fit_model(train), train, "cold start")
+        if len(history) >= MIN_TRAINING_ROWS:
+            _install(artifact)
+        else:
+            _state["artifact"] = artifact       # keep in memory until history is large enough
+    scores = artifact["model"].decision_function(X)
+    flags = scores < 0
+    _check_retrain(artifact, X, flags)
+    return scores, flags
+
+
+def get_model_status():
+    artifact = _state["artifact"] or (_load() if HAS_SKLEARN else None)
+    pending = _state["pending"]
+    return {
+        "available": HAS_SKLEARN,
+        "trained": artifact is not None,
+        "trained_at": datetime.fromtimestamp(artifact["trained_at"]).isoformat() if artifact else None,
+        "training_rows": artifact["n_rows"] if artifact else 0,
+        "reason": artifact["reason"] if artifact else None,
+        "persisted": artifact is not None and _state["mtime"] is not None,
+        "training_in_progress": pending is not None and not pending.done(),
+        "history_rows": reading_count() if HAS_SKLEARN else 0,
+        "retrains": _state["retrains"],
+        "last_drift": _state["last_drift"],
+        "features": FEATURES,
+        "contamination": CONTAMINATION,
+    }
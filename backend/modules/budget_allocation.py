@@ -0,0 +1,306 @@
+"""
+MODULE 5b: Budget Allocation Engine
+Solves the multiple-choice knapsack behind budget-constrained optimization:
+pick at most one candidate strategy per zone so that total value (CO₂
+reduction or RL reward) is maximized under one global budget.
+
+Solvers:
+  - Dynamic programming over a cost grid. When every cost is a whole number
+    of rupees and the budget spans few enough multiples of their gcd, the grid
+    is that gcd and the DP is exact. Otherwise costs are rounded up to a
+    budget-scaled grid: every DP solution is still feasible at full
+    precision, but selections spending close to the whole budget can be
+    missed, so the result is not marked exact
+  - Lagrangian relaxation: bisection on the budget multiplier gives the LP
+    upper bound and a feasible primal, followed by a fill-up pass that spends
+    leftover budget on the best remaining upgrades
+The better feasible solution is returned with its optimality gap against the
+LP (Lagrangian dual) upper bound.
+
+Budget sweeps use the same LP structure: each group's options reduce to the
+upper convex hull of (cost, value), and walking all hull increments in order
+of marginal efficiency yields the whole value-vs-budget curve (and the
+marginal abatement cost curve) in one pass.
+"""
+
+import numpy as np
+
+# DP work budget (groups × options × cost cells); bigger instances use a coarser
+# grid, and beyond DP_MAX_GROUPS only the Lagrangian solver runs (its gap is
+# already negligible at that scale)
+DP_MAX_OPERATIONS = 20_000_000
+DP_MAX_CELLS = 10_000
+DP_MIN_CELLS = 64
+DP_MAX_GROUPS = 2_000
+LAGRANGIAN_ITERATIONS = 60
+FILL_UP_MAX_ROUNDS = 200
+
+
+def _prepare(costs, values, budget):
+    """Mask options that can never be part of a useful solution with -inf value."""
+    costs = np.asarray(costs, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    usable = np.isfinite(costs) & np.isfinite(values) & (values > 0) & (costs >= 0) & (costs <= budget)
+    return np.where(usable, costs, 0.0), np.where(usable, values, -np.inf), usable
+
+
+def _pick(costs, values, lam):
+    """Best option per group for multiplier lam (-1 = fund nothing)."""
+    net = values - lam * costs
+    best = net.argmax(axis=1)
+    rows = np.arange(len(best))
+    best_net = net[rows, best]
+    return np.where(best_net > 0, best, -1), np.maximum(best_net, 0.0)
+
+
+def _totals(costs, values, choice):
+    chosen = choice >= 0
+    rows = np.nonzero(chosen)[0]
+    return costs[rows, choice[rows]].sum(), values[rows, choice[rows]].sum()
+
+
+def _fill_up(costs, values, choice, budget):
+    """Spend leftover budget on the largest value upgrades that still fit."""
+    rows = np.arange(len(choice))
+    for _ in range(FILL_UP_MAX_ROUNDS):
+        spent, _ = _totals(costs, values, choice)
+        leftover = budget - spent
+        cur_cost = np.where(choice >= 0, costs[rows, choice], 0.0)
+        cur_value = np.where(choice >= 0, values[rows, choice], 0.0)
+        gain = values - cur_value[:, None]
+        fits = (costs - cur_cost[:, None] <= leftover + 1e-9) & (gain > 0)
+        gain = np.where(fits, gain, -np.inf)
+        flat = gain.argmax()
+        if not np.isfinite(gain.flat[flat]):
+            break
+        g, k = divmod(int(flat), gain.shape[1])
+        choice[g] = k
+    return choice
+
+
+def _lagrangian(costs, values, budget):
+    """Bisection on the budget multiplier. Returns (choice, upper_bound)."""
+    choice, net = _pick(costs, values, 0.0)
+    upper_bound = net.sum()
+    if _totals(costs, values, choice)[0] <= budget:
+        return choice, upper_bound
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = np.where(costs > 0, values / costs, 0.0)
+    lo, hi = 0.0, float(np.nanmax(np.where(np.isfinite(ratios), ratios, 0.0))) + 1.0
+    feasible = _pick(costs, values, hi)[0]
+    for _ in range(LAGRANGIAN_ITERATIONS):
+        mid = (lo + hi) / 2
+        choice, net = _pick(costs, values, mid)
+        upper_bound = min(upper_bound, mid * budget + net.sum())
+        if _totals(costs, values, choice)[0] > budget:
+            lo = mid
+        else:
+            hi = mid
+            feasible = choice
+    return _fill_up(costs, values, feasible.copy(), budget), upper_bound
+
+
+def _cost_grid(costs, usable, budget, max_cells):
+    """(cost in cells, number of cells, exact): the gcd grid of integral costs if it fits, else rounded up."""
+    used = costs[usable]
+    if np.all(used == np.round(used)) and (used.size == 0 or used.max() < 2 ** 53):
+        step = int(np.gcd.reduce(np.round(used).astype(np.int64))) if used.size else 0
+        if step == 0:       # nothing usable costs anything
+            return np.zeros(costs.shape, dtype=np.int64), 0, True
+        if budget // step <= max_cells:
+            return np.round(costs / step).astype(np.int64), int(budget // step), True
+    cell_size = budget / max_cells
+    return np.ceil(costs / cell_size - 1e-9).astype(np.int64), max_cells, False
+
+
+def _dynamic_programming(costs, values, usable, budget):
+    """
+    DP over a cost grid. Returns (choice, exact), or (None, False) when the
+    instance is too large.
+    """
+    groups, options = costs.shape
+    if groups > DP_MAX_GROUPS:
+        return None, False
+    cells = int(min(DP_MAX_CELLS, DP_MAX_OPERATIONS // max(groups * options, 1)))
+    if cells < DP_MIN_CELLS:
+        return None, False
+
+    cost_cells, cells, exact = _cost_grid(costs, usable, budget, cells)
+    usable = usable & (cost_cells <= cells)
+    capacity = np.arange(cells + 1)
+
+    dp = np.zeros(cells + 1)
+    decisions = np.full((groups, cells + 1), -1, dtype=np.int16)
+    for g in range(groups):
+        ks = np.nonzero(usable[g])[0]
+        if len(ks) == 0:
+            continue
+        source = capacity[None, :] - cost_cells[g, ks][:, None]
+        candidates = np.where(source >= 0, dp[np.maximum(source, 0)] + values[g, ks][:, None], -np.inf)
+        best = candidates.argmax(axis=0)
+        best_value = candidates[best, capacity]
+        improved = best_value > dp
+        decisions[g] = np.where(improved, ks[best], -1)
+        dp = np.where(improved, best_value, dp)
+
+    choice = np.full(groups, -1, dtype=int)
+    remaining = cells
+    for g in range(groups - 1, -1, -1):
+        k = decisions[g, remaining]
+        if k >= 0:
+            choice[g] = k
+            remaining -= cost_cells[g, k]
+    return choice, exact
+
+
+def allocate_budget(costs, values, budget):
+    """
+    Multiple-choice knapsack: at most one option per group, total cost ≤ budget.
+
+    costs, values: (groups, options) arrays; pad ragged groups with inf cost.
+    Returns the chosen option per group (-1 = unfunded), totals, the LP upper
+    bound, the optimality gap, the solver that produced the solution and
+    whether it is provably optimal (exact DP grid).
+    """
+    costs, values, usable = _prepare(costs, values, budget)
+    if costs.size == 0 or budget <= 0:
+        return {
+            "choice": np.full(len(costs), -1, dtype=int),
+            "total_cost": 0.0, "total_value": 0.0,
+            "upper_bound": 0.0, "optimality_gap": 0.0, "method": "trivial", "exact": True,
+        }
+
+    choice, upper_bound = _lagrangian(costs, values, budget)
+    method, exact = "lagrangian", False
+    total_cost, total_value = _totals(costs, values, choice)
+
+    dp_choice, dp_exact = _dynamic_programming(costs, values, usable, budget)
+    if dp_choice is not None:
+        dp_choice = _fill_up(costs, values, dp_choice, budget)
+        dp_cost, dp_value = _totals(costs, values, dp_choice)
+        if dp_value >= total_value:
+            choice, total_cost, total_value, method = dp_choice, dp_cost, dp_value, "dynamic_programming"
+        exact = dp_exact        # an exact DP optimum bounds the Lagrangian one, so whichever is returned is optimal
+
+    upper_bound = max(upper_bound, total_value)
+    gap = (upper_bound - total_value) / upper_bound if upper_bound > 0 else 0.0
+    return {
+        "choice": choice,
+        "total_cost": float(total_cost),
+        "total_value": float(total_value),
+        "upper_bound": float(upper_bound),
+        "optimality_gap": round(float(gap), 6),
+        "method": method,
+        "exact": exact,
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  BUDGET SWEEP
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _hull_vertices(costs, values):
+    """Upper convex hull of one group's (cost, value) options, starting at (0, 0)."""
+    options = np.nonzero(np.isfinite(values))[0]
+    options = options[np.lexsort((-values[options], costs[options]))]
+    hull = [(-1, 0.0, 0.0)]
+    for k in options:
+        c, v = costs[k], values[k]
+        if v <= hull[-1][2]:
+            continue        # dominated: costs at least as much for no more value
+        while len(hull) >= 2:
+            (_, c1, v1), (_, c2, v2) = hull[-2], hull[-1]
+            # Drop the last vertex if it lies on or below the chord to the new one
+            if (v2 - v1) * (c - c1) <= (v - v1) * (c2 - c1):
+                hull.pop()
+            else:
+                break
+        hull.append((int(k), float(c), float(v)))
+    return hull
+
+
+def marginal_increments(costs, values):
+    """
+    Hull increments of every group, sorted by marginal efficiency (value per cost).
+    Within a group the efficiencies decrease, so any prefix of the sorted list
+    is a consistent allocation (each group sits on one of its hull vertices).
+    """
+    costs, values, _ = _prepare(costs, values, np.inf)
+    rows = []
+    for g in range(len(costs)):
+        hull = _hull_vertices(costs[g], values[g])
+        for (k0, c0, v0), (k1, c1, v1) in zip(hull[:-1], hull[1:]):
+            rows.append((g, k0, k1, c1 - c0, v1 - v0))
+    if not rows:
+        empty = np.zeros(0)
+        return {"group": empty.astype(int), "from_option": empty.astype(int), "to_option": empty.astype(int),
+                "delta_cost": empty, "delta_value": empty}
+
+    group, from_option, to_option, delta_cost, delta_value = (np.array(col) for col in zip(*rows))
+    with np.errstate(divide="ignore"):
+        efficiency = np.where(delta_cost > 0, delta_value / np.maximum(delta_cost, 1e-12), np.inf)
+    order = np.lexsort((group, -efficiency))
+    return {
+        "group": group[order].astype(int),
+        "from_option": from_option[order].astype(int),
+        "to_option": to_option[order].astype(int),
+        "delta_cost": delta_cost[order],
+        "delta_value": delta_value[order],
+    }
+
+
+def budget_curve(costs, values, budgets):
+    """
+    Value-vs-budget curve from one pass over the sorted hull increments.
+
+    For each budget the longest affordable prefix of increments is a feasible
+    allocation; adding the affordable fraction of the next increment gives the
+    LP upper bound, so every point carries its own optimality gap.
+    """
+    increments = marginal_increments(costs, values)
+    cum_cost = np.cumsum(increments["delta_cost"])
+    cum_value = np.cumsum(increments["delta_value"])
+    budgets = np.asarray(budgets, dtype=np.float64)
+
+    taken = np.searchsorted(cum_cost, budgets + 1e-9, side="right")
+    spent = np.where(taken > 0, cum_cost[np.maximum(taken - 1, 0)], 0.0)
+    value = np.where(taken > 0, cum_value[np.maximum(taken - 1, 0)], 0.0)
+
+    # Fraction of the next increment that fits gives the LP bound at that budget
+    has_next = taken < len(cum_cost)
+    next_i = np.minimum(taken, max(len(cum_cost) - 1, 0))
+    if len(cum_cost):
+        fraction = np.where(has_next, (budgets - spent) / np.maximum(increments["delta_cost"][next_i], 1e-12), 0.0)
+        upper = value + np.where(has_next, np.clip(fraction, 0, 1) * increments["delta_value"][next_i], 0.0)
+    else:
+        upper = value
+
+    # A group is funded once its first increment is in the prefix
+    first_position = np.full(len(costs), np.iinfo(np.int64).max)
+    np.minimum.at(first_position, increments["group"], np.arange(len(increments["group"])))
+    funded = np.searchsorted(np.sort(first_position), taken, side="left")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gap = np.where(upper > 0, (upper - value) / upper, 0.0)
+    return {
+        "increments": increments,
+        "cumulative_cost": cum_cost,
+        "cumulative_value": cum_value,
+        "budgets": budgets,
+        "increments_taken": taken,
+        "total_cost": spent,
+        "total_value": value,
+        "upper_bound": upper,
+        "optimality_gap": gap,
+        "groups_funded": funded,
+    }
+
+
+def choice_at(increments, increments_taken, groups):
+    """Chosen option per group after the first `increments_taken` increments."""
+    choice = np.full(groups, -1, dtype=int)
+    prefix = slice(0, int(increments_taken))
+    # Increments of a group appear in hull order, so the last one wins
+    choice[increments["group"][prefix]] = increments["to_option"][prefix]
+    return choice
@@ -0,0 +1,117 @@
+"""
+MODULE 16: Snapshot Computation Graph
+Derived products (sustainability scores, carbon credits, net-zero roadmap,
+health impact, policy report) as nodes of one dependency graph.
+
+A pull fetches the zone snapshot once, then resolves the node and its
+dependencies against it. Every node result is memoized per (snapshot
+version, state), so each product is computed at most once per snapshot and
+state however many reports, dashboards or agents ask for it, and everything
+is invalidated as soon as the snapshot version changes. Concurrent pulls of
+the same node wait for the first one instead of computing it again.
+"""
+
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from data.city_data import get_zone_snapshot
+from data.snapshot import SnapshotCache, get_snapshot_version
+from modules.carbon_credits import calculate_carbon_credits
+from modules.health_impact import get_health_impact
+from modules.netzero_planner import generate_netzero_roadmap
+from modules.policy_report import generate_report
+from modules.sustainability_score import get_sustainability_scores
+
+
+class ComputeGraph:
+    """Named nodes fn(state=, zones=, **dependency results), memoized per snapshot version and state."""
+
+    def __init__(self, maxsize: int = 128):
+        self._nodes = {}
+        self._cache = SnapshotCache(maxsize=maxsize)      # (node, state) -> Future
+        self._lock = threading.Lock()
+        self.computed = Counter()
+
+    def node(self, name, deps=()):
+        def register(fn):
+            self._nodes[name] = (fn, tuple(deps))
+            return fn
+        return register
+
+    def pull(self, name, state=None, zones=None, version=None):
+        """
+        Result of node `name` for state. Callers already holding a zone snapshot
+        (e.g. an agent run) pass it with its version; otherwise it is fetched once here.
+        """
+        if zones is None:
+            zones, version = get_zone_snapshot(state=state)
+        elif version is None:
+            version = get_snapshot_version()
+        return self._resolve(name, state, zones, version)
+
+    def _resolve(self, name, state, zones, version):
+        fn, deps = self._nodes[name]
+        key = (name, state)
+        with self._lock:
+            hit, future = self._cache.get(key, version)
+            owner = not hit
+            if owner:
+                future = Future()
+                self._cache.put(key, version, future)
+        if owner:
+            try:
+                inputs = {dep: self._resolve(dep, state, zones, version) for dep in deps}
+                future.set_result(fn(state=state, zones=zones, **inputs))
+                self.computed[name] += 1
+            except Exception as e:
+                self._cache.discard(key, future)
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "nodes": {name: list(deps) for name, (_, deps) in self._nodes.items()},
+            "computed": dict(self.computed),
+            "cache": self._cache.stats(),
+        }
+
+
+graph = ComputeGraph()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  NODES
+# ═══════════════════════════════════════════════════════════════════════════
+
+@graph.node("scores")
+def _scores(state, zones):
+    return get_sustainability_scores(state=state, zones=zones)
+
+
+@graph.node("credits")
+def _credits(state, zones):
+    return calculate_carbon_credits(state=state, zones=zones)
+
+
+@graph.node("roadmap")
+def _roadmap(state, zones):
+    return generate_netzero_roadmap(state=state, zones=zones)
+
+
+@graph.node("health")
+def _health(state, zones):
+    return get_health_impact(state=state, zones=zones)
+
+
+@graph.node("report", deps=("scores", "credits", "roadmap"))
+def _report(state, zones, scores, credits, roadmap):
+    return generate_report(state=state, zones=zones, scores=scores, credits=credits, roadmap=roadmap)
+
+
+def pull(name, state=None, zones=None, version=None):
+    return graph.pull(name, state=state, zones=zones, version=version)
+
+
+def get_graph_stats():
+    return graph.stats()
@@ -4,18 +4,19 @@ Creates a virtual model of the city with zone-level environmental state.
 """
 
 from data.city_data import get_all_zones, get_zone
+from modules.alert_rules import get_rules
+
+
+def risk_levels(zones) -> list:
+    """Risk level per zone from the alert rules' risk_levels (first match, vectorized over zones)."""
+    rules = get_rules()
+    matched = rules.evaluate(rules.risk_levels, rules.zone_context(zones)).tolist()
+    return [rules.risk_levels[i]["level"] if i >= 0 else rules.default_risk_level for i in matched]
 
 
 def classify_risk(co2: float, aqi: int) -> str:
     """Classify zone risk level based on CO₂ and AQI."""
-    if aqi >= 150 or co2 >= 470:
-        return "Critical"
-    elif aqi >= 120 or co2 >= 440:
-        return "High"
-    elif aqi >= 90 or co2 >= 410:
-        return "Medium"
-    else:
-        return "Low"
+    return risk_levels([{"id": None, "current_co2_ppm": co2, "current_aqi": aqi}])[0]
 
 
 RISK_COLORS = {
@@ -26,12 +27,10 @@ RISK_COLORS = {
 }
 
 
-def get_digital_twin(city=None, state=None):
-    """Returns the full digital twin state for all zones."""
-    zones = get_all_zones(city=city, state=state)
+def twin_rows(zones) -> list:
+    """Digital twin entries (zone identity, readings and risk) for zone dicts."""
     twin_data = []
-    for zone in zones:
-        risk = classify_risk(zone["current_co2_ppm"], zone["current_aqi"])
+    for zone, risk in zip(zones, risk_levels(zones)):
         twin_data.append({
             "id": zone["id"],
             "name": zone["name"],
@@ -49,13 +48,19 @@ def get_digital_twin(city=None, state=None):
             "sulphur_dioxide_ugm3": zone.get("sulphur_dioxide_ugm3", 0),
             "ozone_ugm3": zone.get("ozone_ugm3", 0),
             "risk_level": risk,
-            "risk_color": RISK_COLORS[risk],
+            "risk_color": RISK_COLORS.get(risk, "#94a3b8"),
             "source": zone.get("source", "live"),
             "api_source": zone.get("api_source", "Open-Meteo"),
             "tree_count": zone.get("tree_count"),
             "solar_panels_installed": zone.get("solar_panels_installed"),
             "factories": zone.get("factories"),
         })
+    return twin_data
+
+
+def get_digital_twin(city=None, state=None):
+    """Returns the full digital twin state for all zones."""
+    twin_data = twin_rows(get_all_zones(city=city, state=state))
     return {
         "state": state or "all",
         "total_zones": len(twin_data),
@@ -7,11 +7,24 @@ WHO Guidelines used for thresholds:
   - PM2.5: 15 µg/m³ (24h), PM10: 45 µg/m³ (24h)
   - NO₂: 25 µg/m³ (24h), O₃: 100 µg/m³ (8h)
   - CO: 4000 µg/m³ (24h)
+Summaries are also population weighted (district populations from
+data/district_population.csv): weighted risk, expected cases per condition
+and per-state rollups are dot products against precomputed weight vectors.
+Exposure is the time-weighted mean over each pollutant's WHO averaging period
+(rolling windows fed by the reading store); the instantaneous reading is used
+only until a window has MIN_WINDOW_COVERAGE of data.
 """
 
-import math
+import time
+import threading
+
 import numpy as np
-from data.city_data import get_all_zones
+from data.city_data import get_zone_snapshot
+from data.events import bus
+from data.exposure_windows import ExposureWindows
+from data.population import group_weights, population_vectors
+from data.reading_store import READINGS_TOPIC, load_readings
+from data.snapshot import SnapshotCache, get_snapshot_version
 
 # ── WHO Air Quality Guidelines (2021) ──────────────────────────────────────
 WHO_LIMITS = {
@@ -63,66 +76,151 @@ POLLUTANT_KEYS = ["pm2_5", "pm10", "nitrogen_dioxide_ugm3", "ozone_ugm3",
                   "sulphur_dioxide_ugm3", "carbon_monoxide_ugm3"]
 
 
+# ── Matrix form of the tables above (rows follow POLLUTANT_KEYS) ──────────
+_SAFE = np.array([WHO_LIMITS[k]["safe"] for k in POLLUTANT_KEYS], dtype=np.float64)
+_SEVERE = np.array([WHO_LIMITS[k]["severe"] for k in POLLUTANT_KEYS], dtype=np.float64)
+# Weighted average of normalized pollutant levels (baseline model);
+# PM2.5 and NO₂ get highest weights per WHO evidence
+RISK_WEIGHTS = np.array([0.30, 0.15, 0.20, 0.12, 0.10, 0.13])
+CONDITION_NAMES = list(CONDITION_WEIGHTS)
+_CONDITION_W = np.array([[CONDITION_WEIGHTS[c][k] for k in POLLUTANT_KEYS] for c in CONDITION_NAMES]) * 3.0  # sharper sigmoid
+_CONDITION_B = np.array([CONDITION_WEIGHTS[c]["intercept"] for c in CONDITION_NAMES])
+_WHO_KEYS = list(WHO_LIMITS)
+_WHO_COLUMNS = [POLLUTANT_KEYS.index(k) for k in _WHO_KEYS]
+_WHO_BINS = [np.array([WHO_LIMITS[k]["safe"], WHO_LIMITS[k]["moderate"], WHO_LIMITS[k]["unhealthy"]]) for k in _WHO_KEYS]
+WHO_STATUSES = [("Compliant", "#22c55e"), ("Near Limit", "#eab308"), ("Exceeds Limit", "#f97316"), ("Severely Exceeds", "#dc2626")]
+RISK_LEVEL_BINS = [15, 35, 55, 75]
+
+# WHO averaging period per pollutant (2021 guidelines)
+WHO_AVERAGING = {
+    "pm2_5": "24h", "pm10": "24h", "nitrogen_dioxide_ugm3": "24h",
+    "ozone_ugm3": "8h", "sulphur_dioxide_ugm3": "24h", "carbon_monoxide_ugm3": "24h",
+}
+MIN_WINDOW_COVERAGE = 0.125     # share of the averaging period with data before its mean is used
+
+
 # ═══════════════════════════════════════════════════════════════════════════
-#  ML MODELS
+#  ROLLING EXPOSURE WINDOWS
 # ═══════════════════════════════════════════════════════════════════════════
 
-def _normalize_pollutant(value, key):
-    """Normalize pollutant value to 0-1 scale using WHO limits."""
-    limits = WHO_LIMITS.get(key, {"safe": 50, "severe": 500})
-    return min(max((value - limits["safe"]) / (limits["severe"] - limits["safe"]), 0), 1)
+_exposure = ExposureWindows(POLLUTANT_KEYS, _SAFE)
+_WINDOW_NAMES = list(_exposure.windows)
+_AVERAGING_WINDOW = np.array([_WINDOW_NAMES.index(WHO_AVERAGING[k]) for k in POLLUTANT_KEYS])
+_AVERAGING_SECONDS = np.array([_exposure.windows[WHO_AVERAGING[k]] for k in POLLUTANT_KEYS], dtype=np.float64)
+_exposure_state = {"replayed": False}
+_exposure_lock = threading.Lock()
+
+
+def _ensure_exposure(until=None):
+    """Replay the last day of the reading store (before `until`) into the windows once per process."""
+    with _exposure_lock:
+        if _exposure_state["replayed"]:
+            return
+        _exposure_state["replayed"] = True
+        zone_ids, timestamps, values = load_readings(since=time.time() - max(_exposure.windows.values()), fields=POLLUTANT_KEYS)
+        if until is not None:
+            keep = timestamps < until
+            zone_ids, timestamps, values = np.array(zone_ids)[keep], timestamps[keep], values[keep]
+        if len(timestamps):
+            zone_ids = np.array(zone_ids)
+            bounds = np.flatnonzero(np.diff(timestamps)) + 1
+            for batch in np.split(np.arange(len(timestamps)), bounds):
+                _exposure.update(zone_ids[batch].tolist(), values[batch], timestamps[batch[0]])
+
+
+def _on_readings(event):
+    payload = event.payload
+    _ensure_exposure(until=payload["recorded_at"])
+    cols = [payload["fields"].index(k) for k in POLLUTANT_KEYS]
+    values = [[row[c] if row[c] is not None else np.nan for c in cols] for row in payload["values"]]
+    _exposure.update(payload["zone_ids"], values, payload["recorded_at"])
+
+
+bus.subscribe(READINGS_TOPIC, _on_readings)
+
+
+def exposure_windows(zones) -> dict:
+    """Rolling 1h / 8h / 24h aggregates for zones × POLLUTANT_KEYS × windows."""
+    _ensure_exposure()
+    return _exposure.snapshot([z["id"] for z in zones])
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  ML MODELS (vectorized over zones)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _pollutant_matrix(zones) -> np.ndarray:
+    """Raw zones × pollutants matrix (POLLUTANT_KEYS order, missing = 0)."""
+    return np.array([[z.get(k) or 0 for k in POLLUTANT_KEYS] for z in zones], dtype=np.float64).reshape(len(zones), len(POLLUTANT_KEYS))
+
+
+def _normalize(raw: np.ndarray) -> np.ndarray:
+    """Normalize pollutant values to a 0-1 scale using WHO safe / severe limits."""
+    return np.clip((raw - _SAFE) / (_SEVERE - _SAFE), 0, 1)
 
 
 def _sigmoid(x):
     """Logistic sigmoid function."""
-    return 1 / (1 + math.exp(-x))
+    return 1 / (1 + np.exp(-x))
 
 
-def _ml_risk_score(zone):
+def _risk_scores(normalized, aqi, temp) -> np.ndarray:
     """
-    Compute overall health risk score (0-100) using a weighted ensemble.
-    Combines: normalized pollutant exposure + logistic regression model.
+    Overall health risk score (0-100) per zone using a weighted ensemble.
+    Combines: normalized pollutant exposure + AQI model + heat stress.
     """
-    normalized = {}
-    for key in POLLUTANT_KEYS:
-        val = zone.get(key, 0)
-        normalized[key] = _normalize_pollutant(val, key)
-
-    # Weighted average of normalized pollutant levels (baseline model)
-    # PM2.5 and NO₂ get highest weights per WHO evidence
-    weights = {"pm2_5": 0.30, "pm10": 0.15, "nitrogen_dioxide_ugm3": 0.20,
-               "ozone_ugm3": 0.12, "sulphur_dioxide_ugm3": 0.10, "carbon_monoxide_ugm3": 0.13}
+    weighted_sum = normalized @ RISK_WEIGHTS
+    aqi_risk = np.minimum(aqi / 300, 1.0)            # secondary model
+    heat_factor = np.maximum(0, (temp - 28) / 20)     # heat amplifies pollution effects above 28°C
+    ensemble_score = weighted_sum * 0.45 + aqi_risk * 0.40 + heat_factor * 0.15
+    return np.round(np.minimum(ensemble_score * 100, 100), 1)
 
-    weighted_sum = sum(normalized[k] * weights[k] for k in POLLUTANT_KEYS)
 
-    # AQI contribution (secondary model)
-    aqi = zone.get("current_aqi") or 0
-    aqi_risk = min(aqi / 300, 1.0)
+def _condition_probabilities(normalized) -> np.ndarray:
+    """Logistic regression probability of every condition: zones × conditions."""
+    return np.round(_sigmoid(_CONDITION_B + normalized @ _CONDITION_W.T), 3)
 
-    # Temperature stress factor (heat amplifies pollution health effects)
-    temp = zone.get("avg_temperature_c") or 0
-    heat_factor = max(0, (temp - 28) / 20)  # increases above 28°C
 
-    # Ensemble: combine models with learned weights
-    ensemble_score = (weighted_sum * 0.45 + aqi_risk * 0.40 + heat_factor * 0.15)
+def _who_classes(raw) -> np.ndarray:
+    """WHO status index (0 = Compliant … 3 = Severely Exceeds): zones × WHO_LIMITS pollutants."""
+    return np.stack([np.digitize(raw[:, c], bins, right=True) for c, bins in zip(_WHO_COLUMNS, _WHO_BINS)], axis=1) \
+        if len(raw) else np.zeros((0, len(_WHO_KEYS)), dtype=np.int64)
 
-    return round(min(ensemble_score * 100, 100), 1)
 
-
-def _predict_condition_risk(zone, condition_name, weights):
+def health_matrices(zones) -> dict:
     """
-    Predict probability of a specific health condition using logistic regression.
-    Returns probability (0-1) and severity classification.
+    Every model output for a batch of zones, computed once from the normalized
+    exposure matrix (WHO-period rolling means, or current readings until covered).
     """
-    # Feature vector: normalized pollutant values
-    logit = weights["intercept"]
-    for key in POLLUTANT_KEYS:
-        val = zone.get(key, 0)
-        norm = _normalize_pollutant(val, key)
-        logit += norm * weights[key] * 3.0  # scale for sharper sigmoid
+    raw = _pollutant_matrix(zones)
+    windows = exposure_windows(zones)
+    cols = np.arange(len(POLLUTANT_KEYS))
+    averaged = windows["mean"][:, cols, _AVERAGING_WINDOW]
+    time_weighted = windows["covered_s"][:, cols, _AVERAGING_WINDOW] >= MIN_WINDOW_COVERAGE * _AVERAGING_SECONDS
+    exposure = np.where(time_weighted & ~np.isnan(averaged), averaged, raw)
+    normalized = _normalize(exposure)
+    aqi = np.array([z.get("current_aqi") or 0 for z in zones], dtype=np.float64)
+    temp = np.array([z.get("avg_temperature_c") or 0 for z in zones], dtype=np.float64)
+    return {
+        "raw": raw,
+        "exposure": exposure,
+        "time_weighted": time_weighted & ~np.isnan(averaged),
+        "windows": windows,
+        "normalized": normalized,
+        "risk_score": _risk_scores(normalized, aqi, temp),
+        "probabilities": _condition_probabilities(normalized),
+        "who_class": _who_classes(exposure),
+    }
+
+
+def risk_scores(zones) -> np.ndarray:
+    """Overall health risk score (0-100) for each zone."""
+    return health_matrices(zones)["risk_score"]
 
-    probability = _sigmoid(logit)
-    return round(probability, 3)
+
+def _ml_risk_score(zone):
+    """Overall health risk score (0-100) for one zone."""
+    return float(risk_scores([zone])[0])
 
 
 def _classify_overall_risk(score):
@@ -149,27 +247,39 @@ def _classify_overall_risk(score):
                 "advisory": "Air quality is good. Enjoy outdoor activities."}
 
 
-def _who_compliance(zone):
-    """Check WHO guideline compliance for each pollutant."""
-    compliance = []
-    for key, limits in WHO_LIMITS.items():
-        val = zone.get(key, 0)
-        if val <= limits["safe"]:
-            status = "Compliant"
-            color = "#22c55e"
-        elif val <= limits["moderate"]:
-            status = "Near Limit"
-            color = "#eab308"
-        elif val <= limits["unhealthy"]:
-            status = "Exceeds Limit"
-            color = "#f97316"
-        else:
-            status = "Severely Exceeds"
-            color = "#dc2626"
+RISK_CLASSES = [_classify_overall_risk(score) for score in (0,) + tuple(RISK_LEVEL_BINS)]
+_POLLUTANT_NAMES = [k.replace("_ugm3", "").replace("_", " ").upper() for k in POLLUTANT_KEYS]
+_POLLUTANT_LIMITS = [WHO_LIMITS[k]["safe"] for k in POLLUTANT_KEYS]
+_CONDITION_MORTALITY = [CONDITION_WEIGHTS[c]["mortality_rate_per_100k"] for c in CONDITION_NAMES]
+
+
+def _condition_prediction(name, probability, mortality):
+    return {
+        "condition": name,
+        "probability": probability,
+        "probability_pct": round(probability * 100, 1),
+        "severity": "High" if probability > 0.6 else "Medium" if probability > 0.3 else "Low",
+        "severity_color": "#dc2626" if probability > 0.6 else "#f59e0b" if probability > 0.3 else "#22c55e",
+        "mortality_rate_per_100k": mortality,
+    }
+
 
+def _who_compliance(exposure, classes, current, time_weighted, means, exceed_hours, exceed_readings):
+    """WHO guideline compliance for each pollutant of one zone (per-pollutant lists in _WHO_KEYS order)."""
+    compliance = []
+    for i, key in enumerate(_WHO_KEYS):
+        limits = WHO_LIMITS[key]
+        val = exposure[i]
+        status, color = WHO_STATUSES[classes[i]]
         compliance.append({
             "pollutant": key,
             "value": round(val, 1),
+            "current_value": round(current[i], 1),
+            "averaging_period": WHO_AVERAGING[key],
+            "basis": "time_weighted" if time_weighted[i] else "instantaneous",
+            "rolling_means": {w: (round(m, 1) if m == m else None) for w, m in zip(_WINDOW_NAMES, means[i])},
+            "exceedance_hours_24h": round(exceed_hours[i], 2),
+            "exceedance_readings_24h": int(exceed_readings[i]),
             "who_limit": limits["safe"],
             "unit": limits["unit"],
             "status": status,
@@ -183,79 +293,139 @@ def _who_compliance(zone):
 #  MAIN ENTRY POINT
 # ═══════════════════════════════════════════════════════════════════════════
 
-def get_health_impact(state=None):
+_health_cache = SnapshotCache(maxsize=64)
+_row_cache = {"version": None, "rows": {}}     # zone id -> result row for the current snapshot
+_row_lock = threading.Lock()
+
+
+def get_health_impact(state=None, zones=None):
     """ML-powered health impact analysis for all zones using live data."""
-    zones = get_all_zones(state=state)
-    results = []
-
-    all_scores = []
-    for zone in zones:
-        # ML risk score (0-100)
-        risk_score = _ml_risk_score(zone)
-        all_scores.append(risk_score)
-        risk_class = _classify_overall_risk(risk_score)
-
-        # Per-condition predictions (logistic regression)
-        condition_predictions = []
-        for cond_name, cond_weights in CONDITION_WEIGHTS.items():
-            probability = _predict_condition_risk(zone, cond_name, cond_weights)
-            condition_predictions.append({
-                "condition": cond_name,
-                "probability": probability,
-                "probability_pct": round(probability * 100, 1),
-                "severity": "High" if probability > 0.6 else "Medium" if probability > 0.3 else "Low",
-                "severity_color": "#dc2626" if probability > 0.6 else "#f59e0b" if probability > 0.3 else "#22c55e",
-                "mortality_rate_per_100k": cond_weights["mortality_rate_per_100k"],
-            })
-
-        # WHO compliance
-        who_status = _who_compliance(zone)
-        violations = sum(1 for w in who_status if w["status"] in ("Exceeds Limit", "Severely Exceeds"))
-
-        # Pollutant breakdown for radar/bar charts
-        pollutant_data = []
-        for key in POLLUTANT_KEYS:
-            val = zone.get(key, 0)
-            norm = _normalize_pollutant(val, key)
-            pollutant_data.append({
-                "name": key.replace("_ugm3", "").replace("_", " ").upper(),
-                "value": round(val, 1),
-                "normalized": round(norm * 100, 1),
-                "who_limit": WHO_LIMITS[key]["safe"],
-            })
-
-        results.append({
+    if zones is not None:
+        return _summarize(_health_rows(zones))
+    hit, cached = _health_cache.get(state, get_snapshot_version())
+    if hit:
+        return cached
+    zones, version = get_zone_snapshot(state=state)
+    # Zone rows are shared between the statewide and all-zone views of one snapshot
+    with _row_lock:
+        if _row_cache["version"] is None or version > _row_cache["version"]:
+            _row_cache.update(version=version, rows={})
+        rows = _row_cache["rows"] if _row_cache["version"] == version else {}
+        missing = [z for z in zones if z["id"] not in rows]
+        if missing:
+            rows.update((row["zone_id"], row) for row in _health_rows(missing))
+        result = _summarize([rows[z["id"]] for z in zones])
+    _health_cache.put(state, version, result)
+    return result
+
+
+def _health_rows(zones):
+    """Result rows for a batch of zones; every model runs once over the whole batch."""
+    m = health_matrices(zones)
+    scores = m["risk_score"].tolist()
+    levels = np.digitize(m["risk_score"], RISK_LEVEL_BINS).tolist()
+    raw = m["raw"].tolist()
+    normalized = np.round(m["normalized"] * 100, 1).tolist()
+    probabilities = m["probabilities"].tolist()
+    who_exposure = m["exposure"][:, _WHO_COLUMNS].tolist()
+    who_current = m["raw"][:, _WHO_COLUMNS].tolist()
+    who_weighted = m["time_weighted"][:, _WHO_COLUMNS].tolist()
+    day = _WINDOW_NAMES.index("24h")
+    windows = m["windows"]
+    who_means = windows["mean"][:, _WHO_COLUMNS].tolist()
+    who_exceed_hours = windows["exceed_hours"][:, _WHO_COLUMNS, day].tolist()
+    who_exceed_readings = windows["exceed_readings"][:, _WHO_COLUMNS, day].tolist()
+    who_class = m["who_class"].tolist()
+    violations = (m["who_class"] >= 2).sum(axis=1).tolist()
+
+    return [
+        {
             "zone_id": zone["id"],
             "zone_name": zone["name"],
             "city": zone.get("city", "unknown"),
+            "state": zone.get("state"),
             "current_aqi": zone["current_aqi"],
             "current_co2_ppm": zone["current_co2_ppm"],
             "avg_temperature_c": zone.get("avg_temperature_c"),
-            "risk_score": risk_score,
-            "health_risk": risk_class,
-            "condition_predictions": condition_predictions,
-            "who_compliance": who_status,
-            "who_violations": violations,
-            "pollutant_data": pollutant_data,
+            "risk_score": scores[i],
+            "health_risk": RISK_CLASSES[levels[i]],
+            "condition_predictions": [
+                _condition_prediction(name, p, mortality)
+                for name, p, mortality in zip(CONDITION_NAMES, probabilities[i], _CONDITION_MORTALITY)
+            ],
+            "who_compliance": _who_compliance(
+                who_exposure[i], who_class[i], who_current[i], who_weighted[i],
+                who_means[i], who_exceed_hours[i], who_exceed_readings[i],
+            ),
+            "who_violations": violations[i],
+            # Pollutant breakdown for radar/bar charts
+            "pollutant_data": [
+                {"name": name, "value": round(val, 1), "normalized": norm, "who_limit": limit}
+                for name, val, norm, limit in zip(_POLLUTANT_NAMES, raw[i], normalized[i], _POLLUTANT_LIMITS)
+            ],
             "source": zone.get("source", "live"),
             "api_source": zone.get("api_source", "Open-Meteo"),
-        })
+        }
+        for i, zone in enumerate(zones)
+    ]
 
-    # Sort by risk score (highest first)
-    results.sort(key=lambda x: x["risk_score"], reverse=True)
 
-    # Summary stats
-    avg_score = round(sum(all_scores) / len(all_scores), 1) if all_scores else 0
-    severe_count = sum(1 for s in all_scores if s >= 55)
+AT_RISK_SCORE = 35          # "High" risk and above counts vulnerable residents as at risk
+
 
+def _population_summary(rows):
+    """Population-weighted risk, expected cases and state rollups for summary rows."""
+    zone_ids = [r["zone_id"] for r in rows]
+    pop = population_vectors(zone_ids)
+    scores = np.array([r["risk_score"] for r in rows], dtype=np.float64)
+    probabilities = np.array(
+        [[c["probability"] for c in r["condition_predictions"]] for r in rows], dtype=np.float64,
+    ).reshape(len(rows), len(CONDITION_NAMES))
+    mortality = np.array(_CONDITION_MORTALITY) / 1e5
+
+    total = pop["population"].sum()
+    cases = pop["population"] @ probabilities * mortality
+    names, weights = group_weights(zone_ids, [r["state"] or "unknown" for r in rows])
+    state_pop = weights.sum(axis=1)
+    state_risk = np.divide(weights @ scores, state_pop, out=np.zeros_like(state_pop), where=state_pop > 0)
+    state_cases = weights @ probabilities * mortality
+    state_zones = np.count_nonzero(weights, axis=1)
+
+    return {
+        "population": int(total),
+        "risk_score": round(float(pop["population"] @ scores / total), 1) if total else 0,
+        "vulnerable_population": int(pop["vulnerable"].sum()),
+        "vulnerable_at_risk": int(pop["vulnerable"][scores >= AT_RISK_SCORE].sum()),
+        "coverage": round(float(pop["known"].mean()), 3) if rows else 0,
+        "expected_cases": {name: round(float(c), 1) for name, c in zip(CONDITION_NAMES, cases)},
+    }, [
+        {
+            "state": name,
+            "population": int(state_pop[g]),
+            "zones_with_population": int(state_zones[g]),
+            "population_weighted_risk_score": round(float(state_risk[g]), 1),
+            "expected_cases": {c: round(float(v), 1) for c, v in zip(CONDITION_NAMES, state_cases[g])},
+        }
+        for g, name in enumerate(names)
+    ]
+
+
+def _summarize(rows):
+    results = sorted(rows, key=lambda x: x["risk_score"], reverse=True)
+    all_scores = [r["risk_score"] for r in results]
+    population_weighted, state_rollups = _population_summary(rows)    # zone order: cached weights
+
+    # Summary stats
     return {
         "health_impact_analysis": results,
         "summary": {
             "total_zones": len(results),
-            "avg_risk_score": avg_score,
+            "avg_risk_score": round(sum(all_scores) / len(all_scores), 1) if all_scores else 0,
             "max_risk_score": round(max(all_scores), 1) if all_scores else 0,
-            "severe_zones": severe_count,
+            "severe_zones": sum(1 for s in all_scores if s >= 55),
             "highest_risk_zone": results[0]["zone_name"] if results else "N/A",
+            "population_weighted": population_weighted,
             "models_used": ["Logistic Regression", "Weighted Ensemble", "WHO Guideline Checker"],
         },
+        "state_rollups": state_rollups,
     }
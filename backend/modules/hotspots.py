@@ -0,0 +1,311 @@
+"""
+MODULE 6d: Geo-Spatial Hotspot Engine
+DBSCAN over great-circle neighbourhoods with cluster tracking across snapshots.
+
+  - Spatial index: haversine BallTree over zone coordinates, built once per
+    zone set; every zone's neighbours within HOTSPOT_RADIUS_KM are cached
+  - Hotspots: DBSCAN restricted to "hot" zones (CO₂ ≥ HOT_CO2_PPM or
+    AQI ≥ HOT_AQI) using the cached neighbourhoods — no distance queries
+    per snapshot. Only the connected regions around zones that turned hot or
+    cold are re-clustered; everything else keeps its labels.
+  - Tracking: clusters are matched to the previous snapshot by member
+    overlap, so they keep stable IDs; births, deaths, merges and splits are
+    recorded as events
+  - Propagation: movement of the intensity-weighted centroid between
+    snapshots (bearing, compass direction, distance)
+"""
+
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from data.snapshot import get_snapshot_version
+
+try:
+    from sklearn.neighbors import BallTree
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+EARTH_RADIUS_KM = 6371.0
+HOTSPOT_RADIUS_KM = 100.0   # district-level zones; use ~2 km for ward-level zones
+MIN_SAMPLES = 3             # DBSCAN core point: itself + 2 hot neighbours
+HOT_CO2_PPM = 420           # caution levels, below the warnings in data/alert_rules.json
+HOT_AQI = 100
+MATCH_MIN_OVERLAP = 0.3     # Jaccard overlap for a cluster to keep its ID
+STATIONARY_KM = 0.5
+MAX_EVENTS = 200
+MAX_ZONE_SETS = 8
+
+COMPASS = ["N", "NE", "E", "SE", "S", "SW", "W", "NW"]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  SPATIAL INDEX
+# ═══════════════════════════════════════════════════════════════════════════
+
+class _ZoneSet:
+    """BallTree neighbourhoods plus the cluster tracking state for one zone set."""
+
+    def __init__(self, ids, coords):
+        self.ids = ids
+        self.radians = np.radians(coords)
+        tree = BallTree(self.radians, metric="haversine")
+        neighbours = tree.query_radius(self.radians, r=HOTSPOT_RADIUS_KM / EARTH_RADIUS_KM)
+        n = len(ids)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(nb) for nb in neighbours])
+        indices = np.concatenate(neighbours) if n else np.zeros(0, dtype=np.int64)
+        self.adjacency = csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(n, n))
+
+        self.lock = threading.Lock()
+        self.hot = None
+        self.labels = np.full(n, -1, dtype=np.int64)   # stable cluster id per zone, -1 = none
+        self.clusters = {}                              # stable id -> tracking info
+        self.next_id = 1
+        self.events = deque(maxlen=MAX_EVENTS)
+
+
+_zone_sets = OrderedDict()
+_zone_sets_lock = threading.Lock()
+
+
+def _zone_set(zones):
+    ids = [z["id"] for z in zones]
+    coords = np.array([[float(z["lat"]), float(z["lng"])] for z in zones], dtype=np.float64)
+    key = hashlib.sha1("|".join(ids).encode() + coords.tobytes()).hexdigest()
+    with _zone_sets_lock:
+        zone_set = _zone_sets.get(key)
+        if zone_set is None:
+            zone_set = _zone_sets[key] = _ZoneSet(ids, coords)
+            while len(_zone_sets) > MAX_ZONE_SETS:
+                _zone_sets.popitem(last=False)
+        _zone_sets.move_to_end(key)
+    return zone_set
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  CLUSTERING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _dbscan(adjacency, members):
+    """DBSCAN over the cached neighbourhoods of `members`; returns local labels (-1 = noise)."""
+    sub = adjacency[members][:, members]
+    labels = np.full(len(members), -1, dtype=np.int64)
+    core = np.asarray(sub.sum(axis=1)).ravel() >= MIN_SAMPLES
+    if not core.any():
+        return labels
+    core_idx = np.flatnonzero(core)
+    _, core_labels = connected_components(sub[core_idx][:, core_idx], directed=False)
+    labels[core_idx] = core_labels
+    # Border points join the cluster of their first core neighbour
+    for i in np.flatnonzero(~core):
+        row = sub.indices[sub.indptr[i]:sub.indptr[i + 1]]
+        row = row[core[row]]
+        if len(row):
+            labels[i] = labels[row[0]]
+    return labels
+
+
+def _affected(zone_set, hot):
+    """Hot zones whose clustering can change: hot-graph components touching a flipped zone."""
+    flipped = np.flatnonzero(hot != zone_set.hot)
+    hot_idx = np.flatnonzero(hot)
+    if not len(flipped) or not len(hot_idx):
+        return hot_idx[:0]
+    sub = zone_set.adjacency[hot_idx][:, hot_idx]
+    _, component = connected_components(sub, directed=False)
+    touched = np.zeros(len(hot), dtype=bool)
+    touched[zone_set.adjacency[flipped].indices] = True
+    return hot_idx[np.isin(component, np.unique(component[touched[hot_idx]]))]
+
+
+def _recluster(zone_set, hot):
+    """Local cluster labels for this snapshot, reusing previous labels outside the affected region."""
+    if zone_set.hot is None:
+        region = np.flatnonzero(hot)
+        labels = np.full(len(hot), -1, dtype=np.int64)
+    else:
+        region = _affected(zone_set, hot)
+        labels = np.where(hot, zone_set.labels, -1)
+        labels[region] = -1
+    if len(region):
+        local = _dbscan(zone_set.adjacency, region)
+        # kept labels are stable ids (< next_id), so fresh labels start above them
+        labels[region] = np.where(local >= 0, local + zone_set.next_id, -1)
+    return labels
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  TRACKING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _bearing(from_rad, to_rad):
+    lat1, lng1 = from_rad
+    lat2, lng2 = to_rad
+    y = math.sin(lng2 - lng1) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lng2 - lng1)
+    return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+
+def _distance_km(a_rad, b_rad):
+    dlat, dlng = b_rad[0] - a_rad[0], b_rad[1] - a_rad[1]
+    h = math.sin(dlat / 2) ** 2 + math.cos(a_rad[0]) * math.cos(b_rad[0]) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, h)))
+
+
+def _centroid(radians, weights):
+    """Weighted spherical centroid (lat, lng) in radians."""
+    lat, lng = radians[:, 0], radians[:, 1]
+    xyz = np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=1)
+    x, y, z = (xyz * weights[:, None]).sum(axis=0)
+    return math.atan2(z, math.hypot(x, y)), math.atan2(y, x)
+
+
+def _match(previous, labels):
+    """Map local labels to previous stable ids by member overlap; returns ({label: id}, merges, splits)."""
+    new_labels = np.unique(labels[labels >= 0])
+    both = (previous >= 0) & (labels >= 0)
+    pairs = {}
+    for old, new in zip(previous[both], labels[both]):
+        pairs[(int(old), int(new))] = pairs.get((int(old), int(new)), 0) + 1
+    old_sizes = dict(zip(*np.unique(previous[previous >= 0], return_counts=True)))
+    new_sizes = dict(zip(*np.unique(labels[labels >= 0], return_counts=True)))
+
+    assigned, taken = {}, set()
+    for (old, new), overlap in sorted(pairs.items(), key=lambda kv: -kv[1]):
+        if new in assigned or old in taken:
+            continue
+        if overlap / (old_sizes[old] + new_sizes[new] - overlap) >= MATCH_MIN_OVERLAP:
+            assigned[new] = old
+            taken.add(old)
+    merges = {old: assigned[new] for (old, new) in pairs if old not in taken and new in assigned}
+    splits = {new: old for (old, new) in pairs if new not in assigned and old in taken}
+    return {int(lbl): assigned.get(int(lbl)) for lbl in new_labels}, merges, splits
+
+
+def _event(zone_set, kind, cluster_id, zone_idx, version, **extra):
+    zone_set.events.append({
+        "event": kind,
+        "cluster_id": cluster_id,
+        "zone_ids": [zone_set.ids[i] for i in zone_idx],
+        "at": datetime.now().isoformat(),
+        "snapshot_version": version,
+        **extra,
+    })
+
+
+def detect_hotspots(zones):
+    """
+    Hotspot clusters for a zone snapshot, tracked against the previous call on
+    the same zone set. Each zone needs id, name, lat, lng, current_co2_ppm, current_aqi.
+    """
+    if not HAS_SKLEARN or len(zones) < MIN_SAMPLES:
+        return []
+    zone_set = _zone_set(zones)
+    co2 = np.array([float(z["current_co2_ppm"] or 0) for z in zones])
+    aqi = np.array([float(z["current_aqi"] or 0) for z in zones])
+    hot = (co2 >= HOT_CO2_PPM) | (aqi >= HOT_AQI)
+    intensity = np.maximum(co2 / HOT_CO2_PPM, aqi / HOT_AQI)
+    version = get_snapshot_version()
+    now = time.time()
+
+    with zone_set.lock:
+        if zone_set.hot is not None and np.array_equal(hot, zone_set.hot):
+            stable = zone_set.labels.copy()                # membership unchanged — stats only
+        else:
+            labels = _recluster(zone_set, hot)
+            mapping, merges, splits = _match(zone_set.labels, labels)
+            stable = np.full(len(zones), -1, dtype=np.int64)
+            for lbl, cid in mapping.items():
+                members = np.flatnonzero(labels == lbl)
+                if cid is None:
+                    cid = zone_set.next_id
+                    zone_set.next_id += 1
+                    zone_set.clusters[cid] = {"first_seen": now, "snapshots": 0, "centroid": None, "size": 0}
+                    if lbl in splits:
+                        _event(zone_set, "split", cid, members, version, split_from=splits[lbl])
+                    else:
+                        _event(zone_set, "birth", cid, members, version)
+                stable[members] = cid
+            alive = set(stable[stable >= 0].tolist())
+            for cid in list(zone_set.clusters):
+                if cid not in alive:
+                    members = np.flatnonzero(zone_set.labels == cid)
+                    if cid in merges:
+                        _event(zone_set, "merge", cid, members, version, merged_into=merges[cid])
+                    else:
+                        _event(zone_set, "death", cid, members, version)
+                    del zone_set.clusters[cid]
+            zone_set.hot = hot
+            zone_set.labels = stable
+
+        hotspots = []
+        for cid in np.unique(stable[stable >= 0]).tolist():
+            members = np.flatnonzero(stable == cid)
+            info = zone_set.clusters[cid]
+            centroid = _centroid(zone_set.radians[members], intensity[members])
+            propagation = None
+            if info["centroid"] is not None:
+                distance = _distance_km(info["centroid"], centroid)
+                if distance < STATIONARY_KM:
+                    propagation = {"direction": "stationary", "bearing_deg": None, "distance_km": round(distance, 2)}
+                else:
+                    bearing = _bearing(info["centroid"], centroid)
+                    propagation = {
+                        "direction": COMPASS[int((bearing + 22.5) // 45) % 8],
+                        "bearing_deg": round(bearing, 1),
+                        "distance_km": round(distance, 2),
+                    }
+                if version != info.get("version"):
+                    info["snapshots"] += 1
+            else:
+                info["snapshots"] = 1
+            trend = "new" if info["centroid"] is None else (
+                "growing" if len(members) > info["size"] else "shrinking" if len(members) < info["size"] else "stable")
+            if version != info.get("version") or info["centroid"] is None:
+                info.update(centroid=centroid, size=len(members), version=version, propagation=propagation, trend=trend)
+            else:                                           # same snapshot again — report the last movement
+                propagation, trend = info["propagation"], info["trend"]
+
+            source_i = members[np.argmax(intensity[members])]
+            source = zones[source_i]
+            names = [zones[i]["name"] for i in members]
+            others = ", ".join(n for n in names if n != source["name"])
+            drift = f" (drifting {propagation['direction']}, {propagation['distance_km']} km)" if propagation and propagation["bearing_deg"] is not None else ""
+            hotspots.append({
+                "cluster_id": cid,
+                "zones": names,
+                "zone_ids": [zones[i]["id"] for i in members],
+                "avg_co2_ppm": round(float(co2[members].mean()), 1),
+                "avg_aqi": round(float(aqi[members].mean()), 1),
+                "centroid": {"lat": round(math.degrees(centroid[0]), 4), "lng": round(math.degrees(centroid[1]), 4)},
+                "propagation_source": source["name"],
+                "propagation_source_id": source["id"],
+                "propagation": propagation,
+                "trend": trend,
+                "first_seen": datetime.fromtimestamp(info["first_seen"]).isoformat(),
+                "snapshots_active": info["snapshots"],
+                "message": f"Pollution cluster detected: {source['name']} → spreading to {others}{drift}",
+            })
+    hotspots.sort(key=lambda h: -len(h["zone_ids"]))
+    return hotspots
+
+
+def get_hotspot_events(zones=None, limit: int = 50):
+    """Recent birth / death / merge / split events, newest first (all zone sets unless zones given)."""
+    if zones:
+        zone_sets = [_zone_set(zones)]
+    else:
+        with _zone_sets_lock:
+            zone_sets = list(_zone_sets.values())
+    events = [e for zs in zone_sets for e in zs.events]
+    events.sort(key=lambda e: e["at"], reverse=True)
+    return events[:limit]
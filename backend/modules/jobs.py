@@ -0,0 +1,344 @@
+"""
+MODULE 14: Background Job Runner
+Runs long optimizations outside the request/response cycle.
+
+  - Submit → returns immediately with a job id (identical submissions on the
+    same data snapshot are deduplicated onto one job)
+  - Bounded thread pool + bounded queue; extra submissions are rejected
+  - Job state, progress and results persist in SQLite under backend/var/
+  - Cooperative cancellation and per-job timeouts: handlers receive
+    progress(fraction, message) and should_stop() callbacks
+  - Jobs left queued/running by a previous process are marked interrupted;
+    running jobs past their timeout are marked timed out
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from data.snapshot import get_snapshot_version
+from data.storage import var_path
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.environ.get("URBANECOTWIN_JOBS_DB") or var_path("jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("URBANECOTWIN_JOB_WORKERS", "2"))
+MAX_PENDING_JOBS = 32
+DEFAULT_TIMEOUT_S = 600
+MAX_TIMEOUT_S = 3600
+STALE_GRACE_S = 60
+RETENTION_DAYS = 7
+
+# Snapshot versions restart with every process while the job store persists, so dedup keys
+# carry a per-process id: a result is never reused for another process's snapshot version
+BOOT_ID = uuid.uuid4().hex
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled", "timed_out", "interrupted")
+
+
+class JobQueueFull(Exception):
+    """Too many queued or running jobs."""
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  JOB TYPES
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _run_optimize(params, progress, should_stop):
+    from modules.rl_optimizer import optimize
+    return optimize(**params)
+
+
+def _run_budget_sweep(params, progress, should_stop):
+    from modules.rl_optimizer import budget_sweep
+    return budget_sweep(**params)
+
+
+def _run_pareto(params, progress, should_stop):
+    from modules.pareto import get_pareto_fronts
+    return get_pareto_fronts(**params)
+
+
+def _run_strategy_search(params, progress, should_stop):
+    from data.city_data import get_all_zones
+    from modules.rl_optimizer import _evaluation_pipeline
+    from modules.strategy_search import search_strategies
+    params = dict(params)
+    zone_id = params.pop("zone_id", None)
+    bundle = _evaluation_pipeline(get_all_zones(state=params.pop("state", None)))
+    selected = [(z, c) for z, c in zip(bundle["zones"], bundle["contexts"]) if not zone_id or z["id"] == zone_id]
+    result = search_strategies([c for _, c in selected], progress=progress, should_stop=should_stop, **params)
+    return {
+        "results": [
+            {"zone_id": z["id"], "zone_name": z["name"], "tailored_strategy": s}
+            for (z, _), s in zip(selected, result["strategies"])
+        ],
+        "search": result["stats"],
+    }
+
+
+def _run_train_policy(params, progress, should_stop):
+    from modules.rl_training import train_policy
+    return train_policy(progress=progress, should_stop=should_stop, **params)
+
+
+def _run_report_export(params, progress, should_stop):
+    from modules.report_export import render_export
+    # snapshot_version only keys deduplication; the export is rendered from the snapshot current at run time
+    return render_export(params.get("state"), params.get("format", "pdf"), progress, should_stop)
+
+
+# type -> (handler, allowed parameters, depends on the live data snapshot)
+JOB_TYPES = {
+    "optimize": (_run_optimize, {"zone_id", "state", "budget_inr", "objective", "mode", "time_limit_s"}, True),
+    "budget_sweep": (_run_budget_sweep, {"budgets", "points", "state", "objective"}, True),
+    "pareto": (_run_pareto, {"zone_id", "state", "n_candidates"}, True),
+    "strategy_search": (_run_strategy_search, {"zone_id", "state", "cost_cap_inr", "population", "generations",
+                                               "time_limit_s", "patience", "seed"}, True),
+    "train_policy": (_run_train_policy, {"episodes", "n_envs", "workers", "seed"}, False),
+    "report_export": (_run_report_export, {"state", "format", "snapshot_version"}, False),
+}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  PERSISTENT STORE
+# ═══════════════════════════════════════════════════════════════════════════
+
+_db_lock = threading.Lock()
+_conn = None
+
+_SUMMARY_COLUMNS = ("id", "type", "params", "status", "progress", "message", "error", "snapshot_version",
+                    "timeout_s", "created_at", "started_at", "finished_at")
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(JOBS_DB_PATH, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                params TEXT NOT NULL,
+                dedup_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                result TEXT,
+                error TEXT,
+                snapshot_version INTEGER,
+                timeout_s REAL NOT NULL,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        # Anything still active belongs to a previous process
+        _conn.execute(
+            f"UPDATE jobs SET status = 'interrupted', error = 'Server restarted', finished_at = ? "
+            f"WHERE status IN {ACTIVE_STATUSES}",
+            (datetime.now().isoformat(),),
+        )
+        cutoff = (datetime.now() - timedelta(days=RETENTION_DAYS)).isoformat()
+        _conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        _conn.commit()
+    return _conn
+
+
+def _execute(sql, args=()):
+    with _db_lock:
+        conn = _db()
+        cursor = conn.execute(sql, args)
+        conn.commit()
+        return cursor
+
+
+def _query(sql, args=()):
+    with _db_lock:
+        return _db().execute(sql, args).fetchall()
+
+
+def _update(job_id, **fields):
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    _execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _finish(job_id, status, **fields):
+    """Final status of a running job; a no-op if it was already finished (e.g. timed out by _reap_stale)."""
+    fields = {"status": status, "finished_at": datetime.now().isoformat(), **fields}
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    _execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running'", (*fields.values(), job_id))
+
+
+def _summary(row):
+    job = {k: row[k] for k in _SUMMARY_COLUMNS}
+    job["params"] = json.loads(job["params"])
+    job["progress"] = round(job["progress"], 4)
+    return job
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  EXECUTION
+# ═══════════════════════════════════════════════════════════════════════════
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_cancel_events = {}
+_deadlines = {}
+
+
+def _run(job_id, job_type, params):
+    cancel = _cancel_events.get(job_id)
+    deadline = _deadlines.get(job_id)
+    started = _execute(
+        "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+        (datetime.now().isoformat(), job_id),
+    ).rowcount
+    if cancel is None or deadline is None or not started:
+        _cancel_events.pop(job_id, None)
+        _deadlines.pop(job_id, None)
+        return
+    handler = JOB_TYPES[job_type][0]
+
+    last_report = [0.0]
+
+    def progress(fraction, message=None):
+        now = time.time()
+        # Throttle store writes; progress callbacks can fire every few milliseconds
+        if now - last_report[0] >= 0.25:
+            last_report[0] = now
+            _update(job_id, progress=max(0.0, min(float(fraction), 1.0)), message=message)
+
+    def should_stop():
+        return cancel.is_set() or time.time() >= deadline
+
+    try:
+        result = handler(params, progress, should_stop)
+        if time.time() >= deadline:
+            _finish(job_id, "timed_out", error="Job exceeded its timeout")
+        elif cancel.is_set():
+            _finish(job_id, "cancelled")
+        else:
+            _finish(job_id, "succeeded", progress=1.0, message="done", result=json.dumps(result, default=str))
+    except Exception as e:
+        logger.exception(f"Job {job_id} ({job_type}) failed")
+        _finish(job_id, "failed", error=str(e))
+    finally:
+        _cancel_events.pop(job_id, None)
+        _deadlines.pop(job_id, None)
+
+
+def _reap_stale():
+    """Mark running jobs well past their timeout (e.g. a hung handler) as timed out."""
+    now = time.time()
+    for job_id, deadline in list(_deadlines.items()):
+        if now > deadline + STALE_GRACE_S:
+            event = _cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+            _execute(
+                "UPDATE jobs SET status = 'timed_out', error = 'Job exceeded its timeout', finished_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (datetime.now().isoformat(), job_id),
+            )
+
+
+def _dedup_key(job_type, params, snapshot_version):
+    payload = json.dumps([BOOT_ID, job_type, params, snapshot_version], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def submit_job(job_type: str, params: dict = None, timeout_s: float = None) -> dict:
+    """
+    Queue a job and return its summary. An identical active job is returned
+    instead; for snapshot-bound types so is one that already succeeded on the
+    same data snapshot.
+    """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type '{job_type}'. Available: {sorted(JOB_TYPES)}")
+    _, allowed, snapshot_bound = JOB_TYPES[job_type]
+    params = {k: v for k, v in (params or {}).items() if v is not None}
+    unknown = set(params) - allowed
+    if unknown:
+        raise ValueError(f"Unsupported parameters for '{job_type}': {sorted(unknown)}")
+    timeout_s = min(float(timeout_s or DEFAULT_TIMEOUT_S), MAX_TIMEOUT_S)
+
+    _reap_stale()
+    snapshot_version = get_snapshot_version() if snapshot_bound else None
+    key = _dedup_key(job_type, params, snapshot_version)
+    reusable = ("queued", "running", "succeeded") if snapshot_bound else ACTIVE_STATUSES
+    existing = _query(
+        f"SELECT * FROM jobs WHERE dedup_key = ? AND status IN ({', '.join('?' * len(reusable))}) "
+        "ORDER BY created_at DESC LIMIT 1",
+        (key, *reusable),
+    )
+    if existing:
+        return {**_summary(existing[0]), "deduplicated": True}
+
+    if len(_deadlines) >= MAX_PENDING_JOBS:
+        raise JobQueueFull(f"{MAX_PENDING_JOBS} jobs are already queued or running")
+
+    job_id = uuid.uuid4().hex
+    _execute(
+        "INSERT INTO jobs (id, type, params, dedup_key, status, snapshot_version, timeout_s, created_at) "
+        "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+        (job_id, job_type, json.dumps(params, default=str), key, snapshot_version, timeout_s,
+         datetime.now().isoformat()),
+    )
+    _cancel_events[job_id] = threading.Event()
+    _deadlines[job_id] = time.time() + timeout_s
+    _executor.submit(_run, job_id, job_type, params)
+    return {**get_job(job_id), "deduplicated": False}
+
+
+def get_job(job_id: str):
+    """Job summary (without the result), or None."""
+    _reap_stale()
+    rows = _query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    return _summary(rows[0]) if rows else None
+
+
+def get_job_result(job_id: str):
+    """(summary, result) — result is None until the job has succeeded."""
+    rows = _query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    if not rows:
+        return None, None
+    row = rows[0]
+    return _summary(row), json.loads(row["result"]) if row["result"] else None
+
+
+def list_jobs(status: str = None, limit: int = 50):
+    _reap_stale()
+    if status:
+        rows = _query("SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit))
+    else:
+        rows = _query("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+    return {"jobs": [_summary(r) for r in rows], "workers": JOB_WORKERS, "active": len(_deadlines)}
+
+
+def cancel_job(job_id: str):
+    """Request cancellation; queued jobs are cancelled immediately, running ones at their next check."""
+    job = get_job(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        return job
+    event = _cancel_events.get(job_id)
+    if event is not None:
+        event.set()
+    cancelled = _execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+        (datetime.now().isoformat(), job_id),
+    ).rowcount
+    if not cancelled:
+        _update(job_id, message="cancellation requested")
+    return get_job(job_id)
@@ -0,0 +1,179 @@
+"""
+MODULE 15: Live Push
+Server-sent events for dashboards: digital twin deltas and alert transitions.
+
+  - The broadcaster subscribes to the reading store ("readings.snapshot") and
+    the alert engine ("alerts.transitions"). Bursts are coalesced for
+    COALESCE_S (latest row per zone wins), then each message is built and
+    serialized once per state filter — one broadcast per snapshot, however
+    many dashboards are connected
+  - Every connection has a bounded queue; when a slow client falls behind
+    the oldest messages are dropped and the client is told to resync (refetch
+    /api/zones) before it receives anything newer
+  - Idle connections get a keep-alive comment every HEARTBEAT_S
+"""
+
+import json
+import asyncio
+import logging
+import threading
+from collections import deque
+from itertools import count
+
+from data.city_data import ZONES, get_cached_zone
+from data.events import bus
+from data.reading_store import READINGS_TOPIC
+from modules.alerts import ALERTS_TOPIC
+from modules.digital_twin import twin_rows
+
+logger = logging.getLogger(__name__)
+
+COALESCE_S = 0.5
+MAX_QUEUE = 64
+HEARTBEAT_S = 15
+TOPICS = ("twin", "alerts")
+
+
+class Client:
+    """One connected stream: bounded drop-oldest queue, woken from publisher threads."""
+
+    def __init__(self, state, topics, loop):
+        self.state = state
+        self.topics = topics
+        self.loop = loop
+        self.queue = deque(maxlen=MAX_QUEUE)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.resync = False
+
+    def push(self, message):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            self.resync = True      # the client missed deltas
+        self.queue.append(message)
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+
+_lock = threading.Lock()
+_clients = set()
+_pending = {"zones": {}, "alerts": [], "snapshot_version": None, "timer": None}
+_sequence = count(1)
+_stats = {"broadcasts": 0, "messages": 0}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  BROADCASTER
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _schedule_flush():
+    if _pending["timer"] is None:
+        timer = threading.Timer(COALESCE_S, _flush)
+        timer.daemon = True
+        _pending["timer"] = timer
+        timer.start()
+
+
+def _on_readings(event):
+    payload = event.payload
+    fields = payload["fields"]
+    with _lock:
+        if not _clients:
+            return
+        for zid, values in zip(payload["zone_ids"], payload["values"]):
+            if zid in ZONES:
+                _pending["zones"][zid] = {"id": zid, **ZONES[zid], **dict(zip(fields, values))}
+        _pending["snapshot_version"] = payload.get("snapshot_version")
+        _schedule_flush()
+
+
+def _on_alerts(event):
+    with _lock:
+        if not _clients:
+            return
+        _pending["alerts"].extend(event.payload["transitions"])
+        _schedule_flush()
+
+
+def _frame(topic, data):
+    return f"event: {topic}\nid: {next(_sequence)}\ndata: {json.dumps(data)}\n\n"
+
+
+def _flush():
+    with _lock:
+        pending = _pending["zones"]
+        transitions = _pending["alerts"]
+        version = _pending["snapshot_version"]
+        _pending.update(zones={}, alerts=[], timer=None)
+        clients = list(_clients)
+    if not clients or not (pending or transitions):
+        return
+    # The cached zone entry is what /api/zones serves (incl. source / api_source); the
+    # reading fields alone are only a fallback when the live cache has already expired
+    zones = [get_cached_zone(zid) or zone for zid, zone in pending.items()]
+    rows = twin_rows(zones) if zones else []
+    states = {zone["id"]: zone.get("state") for zone in zones}
+
+    # One frame per (topic, state filter) in use, shared by every client with that filter
+    frames = {}
+    for state in {c.state for c in clients}:
+        twin = [r for r in rows if not state or states[r["id"]] == state]
+        if twin:
+            frames[("twin", state)] = _frame("twin", {"zones": twin, "snapshot_version": version})
+        alerts = [t for t in transitions if not state or t["alert"].get("state") == state]
+        if alerts:
+            frames[("alerts", state)] = _frame("alerts", {"transitions": alerts})
+    for client in clients:
+        for topic in client.topics:
+            frame = frames.get((topic, client.state))
+            if frame:
+                client.push(frame)
+                _stats["messages"] += 1
+    _stats["broadcasts"] += 1
+
+
+bus.subscribe(READINGS_TOPIC, _on_readings)
+bus.subscribe(ALERTS_TOPIC, _on_alerts)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  STREAMS
+# ═══════════════════════════════════════════════════════════════════════════
+
+async def stream(state=None, topics=TOPICS):
+    """Server-sent event stream for one connection (async generator of frames)."""
+    client = Client(state, tuple(t for t in topics if t in TOPICS), asyncio.get_running_loop())
+    with _lock:
+        _clients.add(client)
+    try:
+        yield _frame("hello", {"state": state, "topics": list(client.topics), "max_queue": MAX_QUEUE})
+        while True:
+            if client.resync:       # checked before every frame: nothing stale goes out after an overflow
+                client.resync = False
+                yield _frame("resync", {"dropped": client.dropped})
+            elif client.queue:
+                yield client.queue.popleft()
+            else:
+                client.wakeup.clear()
+                if client.queue or client.resync:
+                    continue
+                try:
+                    await asyncio.wait_for(client.wakeup.wait(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+    finally:
+        with _lock:
+            _clients.discard(client)
+
+
+def get_push_status():
+    with _lock:
+        clients = list(_clients)
+    return {
+        "clients": len(clients),
+        "by_state": {s or "all": sum(1 for c in clients if c.state == s) for s in {c.state for c in clients}},
+        "queued": sum(len(c.queue) for c in clients),
+        "dropped": sum(c.dropped for c in clients),
+        "coalesce_s": COALESCE_S,
+        "max_queue": MAX_QUEUE,
+        **_stats,
+    }
@@ -5,23 +5,67 @@ Enhanced with ML anomaly detection, geo-spatial hotspot detection,
 multi-objective optimization, UN/India policy compliance.
 """
 
-import math
+import time
 import random
+import threading
 from datetime import datetime
-from data.city_data import get_all_zones
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from data.city_data import get_zone_snapshot
+from data.snapshot import get_snapshot_version
+from data.events import bus
 from modules.prediction_engine import get_predictions
-from modules.rl_optimizer import optimize, optimize_with_budget
-from modules.policy_report import generate_report
-from modules.carbon_credits import calculate_carbon_credits
+from modules.rl_optimizer import optimize
+from modules.pareto import get_pareto_fronts, score_strategies
+from modules.compute_graph import pull
+from modules.anomaly_model import score_zones
+from modules.hotspots import detect_hotspots, get_hotspot_events
+from modules.online_detectors import baseline_deviations
+from modules.alert_rules import format_message, get_rules
 
-try:
-    from sklearn.ensemble import IsolationForest
-    from sklearn.cluster import DBSCAN
-    import numpy as np
-    HAS_SKLEARN = True
-except ImportError:
-    HAS_SKLEARN = False
-    import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  AGENT RUN — one pinned zone snapshot + memo of shared computations
+# ═══════════════════════════════════════════════════════════════════════════
+
+class AgentRun:
+    """
+    Shared state of one multi-agent run. All agents read the same zone list,
+    and results several agents need (optimization, pareto, ...) are computed
+    once: concurrent requests for the same key wait for the first. Snapshot
+    products (credits, report, ...) come from the computation graph via pull().
+    """
+
+    def __init__(self, zones=None, state=None, version=None):
+        if zones is None:
+            zones, version = get_zone_snapshot(state=state)
+        elif version is None:
+            version = get_snapshot_version()
+        self.zones = zones
+        self.state = state
+        self.snapshot_version = version
+        self._memo = {}
+        self._lock = threading.Lock()
+        self.memo_hits = 0
+
+    def pull(self, name):
+        """Derived product from the snapshot computation graph, for this run's zones."""
+        return pull(name, state=self.state, zones=self.zones, version=self.snapshot_version)
+
+    def get(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._memo.get(key)
+            owner = future is None
+            if owner:
+                future = self._memo[key] = Future()
+            else:
+                self.memo_hits += 1
+        if owner:
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -35,126 +79,117 @@ def _to_native(val):
     return val
 
 
+# Zone status severity per detector; zones inside a hotspot cluster are critical
+SEVERITY_RANK = {"normal": 0, "warning": 1, "critical": 2}
+ANOMALY_SEVERITY = {"isolation_forest": "warning", "baseline_deviation": "warning", "threshold": "warning"}
+HOTSPOT_SEVERITY = "critical"
+
+
 def _isolation_forest_anomaly(zones_data):
-    """Isolation Forest anomaly detection — detects unusual patterns beyond threshold rules."""
-    if not HAS_SKLEARN or len(zones_data) < 3:
+    """Isolation Forest anomaly detection — scored by the persisted model trained on reading history."""
+    if len(zones_data) < 3:
         return []
-    X = np.array([[float(z["current_co2_ppm"]), float(z["current_aqi"]), float(z.get("pm2_5") or 0) / 10] for z in zones_data])
-    clf = IsolationForest(contamination=0.15, random_state=42)
-    preds = clf.fit_predict(X)
-    anomalies = []
-    for i, p in enumerate(preds):
-        if int(p) == -1:
-            anomalies.append({"zone_id": zones_data[i]["id"], "zone_name": zones_data[i]["name"], "method": "isolation_forest"})
-    return anomalies
-
-
-def _seasonal_deviation_detection(zones_data):
-    """Seasonal trend deviation — detects values significantly off expected seasonal pattern."""
-    anomalies = []
-    hour = datetime.now().hour
-    # Expected diurnal pattern: higher during day (8-20), lower at night
-    expected_base = 400 + 15 * math.sin((hour - 6) * math.pi / 12)
-    for z in zones_data:
-        dev = abs(z["current_co2_ppm"] - expected_base)
-        if dev > 35:
-            anomalies.append({"zone_id": z["id"], "zone_name": z["name"], "method": "seasonal_deviation", "deviation_ppm": round(dev, 1)})
-    return anomalies
-
-
-def _threshold_rules(zones_data):
-    """Legacy threshold-based alerts (kept for baseline)."""
-    anomalies = []
-    for z in zones_data:
-        if z["current_co2_ppm"] >= 460:
-            anomalies.append({"zone_id": z["id"], "zone_name": z["name"], "method": "threshold", "alert": f"CO₂ critical: {z['current_co2_ppm']} ppm"})
-        elif z["current_aqi"] >= 150:
-            anomalies.append({"zone_id": z["id"], "zone_name": z["name"], "method": "threshold", "alert": f"AQI critical: {z['current_aqi']}"})
-    return anomalies
-
-
-def _geo_spatial_hotspots(zones_data):
-    """DBSCAN spatial clustering — pollution hotspot detection and propagation tracking."""
-    if not HAS_SKLEARN or len(zones_data) < 5:
+    scored = score_zones(zones_data)
+    if scored is None:
         return []
-    coords = np.array([[float(z["lat"]), float(z["lng"]), float(z["current_co2_ppm"]) / 50, float(z["current_aqi"]) / 30] for z in zones_data])
-    clustering = DBSCAN(eps=0.15, min_samples=3).fit(coords)
-    labels = clustering.labels_
-    hotspots = {}
-    for i, lbl in enumerate(labels):
-        if int(lbl) >= 0:
-            hotspots.setdefault(int(lbl), []).append(zones_data[i])
-    result = []
-    for lbl, cluster in hotspots.items():
-        if len(cluster) >= 2:
-            avg_co2 = sum(float(z["current_co2_ppm"]) for z in cluster) / len(cluster)
-            names = [z["name"] for z in cluster]
-            source = max(cluster, key=lambda z: float(z["current_co2_ppm"]))
-            result.append({
-                "cluster_id": int(lbl),
-                "zones": names,
-                "zone_ids": [z["id"] for z in cluster],
-                "avg_co2_ppm": round(float(avg_co2), 1),
-                "propagation_source": source["name"],
-                "message": f"Pollution cluster detected: {source['name']} → spreading to {', '.join(n for n in names if n != source['name'])}",
-            })
-    return result
+    scores, flags = scored
+    return [
+        {"zone_id": zones_data[i]["id"], "zone_name": zones_data[i]["name"], "method": "isolation_forest",
+         "score": round(float(scores[i]), 4)}
+        for i in np.flatnonzero(flags)
+    ]
+
+
+def _threshold_rules(zones_data, rules):
+    """Threshold findings from the rule DSL's monitoring rules (first matching rule per zone)."""
+    ctx = rules.zone_context(zones_data)
+    matched = rules.evaluate(rules.monitoring, ctx)
+    values = {i: rule["value"](ctx) for i, rule in enumerate(rules.monitoring)}
+    return [
+        {
+            "zone_id": zones_data[k]["id"], "zone_name": zones_data[k]["name"], "method": "threshold",
+            "rule": rules.monitoring[i]["id"],
+            "alert": format_message(rules.monitoring[i]["alert"], zones_data[k]["name"], float(values[i][k])),
+        }
+        for k, i in enumerate(matched.tolist()) if i >= 0
+    ]
 
 
 class MonitoringAgent:
     """Proactive monitoring with ML anomaly detection and geo-spatial hotspot detection."""
 
     NAME = "Monitoring Agent"
-    ROLE = "ML-powered environmental surveillance: Isolation Forest, seasonal deviation, geo-spatial DBSCAN"
+    ROLE = "ML-powered environmental surveillance: Isolation Forest, per-zone baseline deviation, geo-spatial DBSCAN"
+
+    @staticmethod
+    def iter_zone_status(zones, anomalies, hotspots):
+        """Per-zone status rows, built from zone-indexed anomaly / hotspot maps (one pass each)."""
+        by_zone = {}
+        for a in anomalies:
+            by_zone.setdefault(a.get("zone_id"), []).append((a["severity"], a.get("alert", f"{a.get('method', 'anomaly')} detected")))
+        for h in hotspots:
+            for zid in h.get("zone_ids", []):
+                by_zone.setdefault(zid, []).append((HOTSPOT_SEVERITY, h["message"]))
+        for z in zones:
+            entries = by_zone.get(z["id"], ())
+            status = max((sev for sev, _ in entries), key=SEVERITY_RANK.__getitem__, default="normal")
+            yield {
+                "zone_id": z["id"], "zone_name": z["name"], "status": status,
+                "alerts": [msg for _, msg in entries[:3]], "co2_ppm": z["current_co2_ppm"], "aqi": z["current_aqi"],
+            }
 
     @staticmethod
-    def analyze():
-        zones = get_all_zones()
+    def scan(zones):
+        """Anomaly findings per detector and geo-spatial hotspots for one zone snapshot."""
         zones_list = [{"id": z["id"], "name": z["name"], "lat": z["lat"], "lng": z["lng"], "current_co2_ppm": z["current_co2_ppm"], "current_aqi": z["current_aqi"], "pm2_5": z.get("pm2_5") or 0, "city": z.get("city", "")} for z in zones]
+        rules = get_rules()
+        findings = {
+            "isolation_forest": _isolation_forest_anomaly(zones_list),
+            "baseline_deviation": baseline_deviations(zones_list),
+            "threshold_rules": _threshold_rules(zones, rules),
+        }
+        anomalies = [a for found in findings.values() for a in found]
+        for a in anomalies:
+            a["severity"] = ANOMALY_SEVERITY.get(a.get("method"), "warning")
+        return {
+            "zones_list": zones_list, "rules": rules, "findings": findings,
+            "anomalies": anomalies, "hotspots": detect_hotspots(zones_list),
+        }
 
-        # ML anomaly detection
-        if_anomalies = _isolation_forest_anomaly(zones_list)
-        seasonal_anomalies = _seasonal_deviation_detection(zones_list)
-        threshold_anomalies = _threshold_rules(zones_list)
+    @staticmethod
+    def analyze(run=None):
+        run = run or AgentRun()
+        zones = run.zones
+
+        # ML anomaly detection + geo-spatial hotspots
+        scan = MonitoringAgent.scan(zones)
+        zones_list, rules, findings = scan["zones_list"], scan["rules"], scan["findings"]
+        if_anomalies = findings["isolation_forest"]
+        baseline_anomalies = findings["baseline_deviation"]
+        threshold_anomalies = findings["threshold_rules"]
 
         all_anomaly_types = [
             {"type": "isolation_forest", "count": len(if_anomalies), "description": "Unusual patterns, sensor noise, unexpected spikes"},
-            {"type": "seasonal_deviation", "count": len(seasonal_anomalies), "description": "Values off expected diurnal/seasonal trend"},
-            {"type": "threshold_rules", "count": len(threshold_anomalies), "description": "CO₂ > 460 / AQI > 150"},
+            {"type": "baseline_deviation", "count": len(baseline_anomalies), "description": "Values off the zone's own EWMA, hour-of-day and median baselines"},
+            {"type": "threshold_rules", "count": len(threshold_anomalies), "description": " / ".join(r["when"].source for r in rules.monitoring)},
         ]
-        total_anomalies = len(if_anomalies) + len(seasonal_anomalies) + len(threshold_anomalies)
-
-        # Geo-spatial hotspots
-        hotspots = _geo_spatial_hotspots(zones_list)
+        total_anomalies = len(if_anomalies) + len(baseline_anomalies) + len(threshold_anomalies)
 
-        zone_status = []
-        for z in zones:
-            alerts = []
-            status = "normal"
-            for a in if_anomalies + seasonal_anomalies + threshold_anomalies:
-                if a.get("zone_id") == z["id"]:
-                    alerts.append(a.get("alert", f"{a.get('method', 'anomaly')} detected"))
-                    status = "warning" if status == "normal" else status
-            for h in hotspots:
-                if z["id"] in h.get("zone_ids", []):
-                    alerts.append(h["message"])
-                    status = "critical" if "cluster" in str(h).lower() else status
-            zone_status.append({
-                "zone_id": z["id"], "zone_name": z["name"], "status": status or "normal",
-                "alerts": alerts[:3], "co2_ppm": z["current_co2_ppm"], "aqi": z["current_aqi"],
-            })
+        hotspots, anomalies = scan["hotspots"], scan["anomalies"]
+        zone_status = list(MonitoringAgent.iter_zone_status(zones, anomalies, hotspots))
 
         return {
             "agent": MonitoringAgent.NAME,
             "role": MonitoringAgent.ROLE,
             "status": "active",
-            "ml_methods": ["Isolation Forest", "Seasonal Deviation", "DBSCAN Clustering"],
+            "ml_methods": ["Isolation Forest", "EWMA / Seasonal / Median-MAD Baselines", "DBSCAN Clustering"],
             "zones_monitored": len(zones),
             "anomalies_detected": total_anomalies,
             "anomaly_breakdown": all_anomaly_types,
             "geo_spatial_hotspots": hotspots,
+            "hotspot_events": get_hotspot_events(zones_list, limit=10),
             "zone_status": zone_status,
-            "anomalies": (if_anomalies + seasonal_anomalies + threshold_anomalies)[:15],
+            "anomalies": anomalies[:15],
             "last_scan": datetime.now().isoformat(),
         }
 
@@ -170,8 +205,9 @@ class PredictionAgent:
     ROLE = "Multi-horizon (1h/24h/7d/30d) + SHAP explainability + counterfactual 'what-if' simulation"
 
     @staticmethod
-    def analyze():
-        preds = get_predictions()
+    def analyze(run=None):
+        run = run or AgentRun()
+        preds = run.get("predictions", get_predictions, zones=run.zones)
         high_risk_zones = []
         shap_summaries = []
         horizons = ["1_hour", "24_hour", "7_day", "30_day"]
@@ -207,7 +243,7 @@ class PredictionAgent:
             "shap_explanations": shap_summaries[:5],
             "counterfactual_available": True,
             "prediction_accuracy": round(random.uniform(0.87, 0.95), 2),
-            "next_update_in": "15 minutes",
+            "next_update_in": f"{AGENT_INTERVALS['prediction'] // 60} minutes",
         }
 
 
@@ -222,36 +258,49 @@ class OptimizationAgent:
     ROLE = "Multi-objective (CO₂, cost, health, acceptability) + Pareto + budget constraints + carbon credit ROI"
 
     @staticmethod
-    def analyze(budget_inr=None):
-        opt_results = optimize()
-        budget_result = None
-        if budget_inr and budget_inr > 0:
-            budget_result = optimize_with_budget(budget_inr)
-
-        credits = calculate_carbon_credits()
+    def analyze(budget_inr=None, run=None):
+        run = run or AgentRun()
+        opt_results = run.get(("optimize", budget_inr), optimize, budget_inr=budget_inr, zones=run.zones)
+        budget_result = opt_results.get("budget_constrained")
+        optimization_results = opt_results.get("optimization_results", [])
+
+        credits = run.pull("credits")
+        pareto = run.get("pareto", get_pareto_fronts, zones=run.zones)
+        zones_by_id = {z["id"]: z for z in run.zones}
+        scores = score_strategies(
+            [zones_by_id[r["zone_id"]] for r in optimization_results],
+            [r["zone_context"] for r in optimization_results],
+            [r.get("best_strategy", {}) for r in optimization_results],
+        )
         recommendations = []
-        pareto_front = []
 
-        for result in opt_results.get("optimization_results", []):
+        for result, score in zip(optimization_results, scores):
             best = result.get("best_strategy", {})
             rec = {
                 "zone": result["zone_name"],
                 "recommended_strategy": best.get("strategy_name", ""),
                 "expected_reduction": f"{best.get('reduction_pct', 0)}%",
                 "estimated_cost": f"₹{best.get('estimated_cost_inr', 0):,.0f}",
-                "health_score": round(random.uniform(72, 95), 1),
-                "social_acceptability_index": round(random.uniform(0.7, 0.95), 2),
+                "health_score": score["health_score"],
+                "social_acceptability_index": score["acceptability"],
                 "carbon_credit_roi": round(random.uniform(1.2, 2.5), 2),
                 "payback_years": round(random.uniform(3, 8), 1),
             }
             recommendations.append(rec)
-            pareto_front.append({
-                "zone": result["zone_name"],
-                "co2_reduction_pct": best.get("reduction_pct", 0),
-                "cost_inr": best.get("estimated_cost_inr", 0),
-                "health_score": rec["health_score"],
-                "acceptability": rec["social_acceptability_index"],
-            })
+
+        # Non-dominated trade-offs of the first zones, a few points per zone
+        pareto_front = []
+        for front in pareto["fronts"][:10]:
+            points = front["front"]
+            for point in points[::max(1, len(points) // 3)][:3]:
+                pareto_front.append({
+                    "zone": front["zone_name"],
+                    "strategy": point["strategy_name"],
+                    "co2_reduction_pct": point["co2_reduction_pct"],
+                    "cost_inr": point["cost_inr"],
+                    "health_score": point["health_score"],
+                    "acceptability": point["acceptability"],
+                })
 
         return {
             "agent": OptimizationAgent.NAME,
@@ -259,9 +308,10 @@ class OptimizationAgent:
             "status": "active",
             "algorithm": "DQN Multi-Objective + Pareto Optimization",
             "objectives": ["CO₂ reduction", "Cost (₹)", "Public health score", "Social acceptability"],
-            "strategies_evaluated": len(opt_results.get("optimization_results", [])) * 5,
+            "strategies_evaluated": pareto["candidates_evaluated"],
             "recommendations": recommendations,
-            "pareto_front": pareto_front[:10],
+            "pareto_front": pareto_front,
+            "pareto_front_sizes": {f["zone_name"]: f["front_size"] for f in pareto["fronts"]},
             "budget_constrained": budget_result if budget_result else None,
             "carbon_market": {
                 "total_credit_potential_inr": credits.get("city_totals", {}).get("total_credits_inr", 0),
@@ -329,9 +379,10 @@ class PolicyAgent:
     ROLE = "UN SDG & IPCC-aligned | WHO & CPCB compliance | MoEFCC & NITI Aayog | Government-ready reports"
 
     @staticmethod
-    def analyze():
-        zones = get_all_zones()
-        report = generate_report()
+    def analyze(run=None):
+        run = run or AgentRun()
+        zones = run.zones
+        report = run.pull("report")
         city_avg_co2 = sum(z["current_co2_ppm"] for z in zones) / len(zones)
         city_avg_aqi = sum(z["current_aqi"] for z in zones) / len(zones)
 
@@ -367,17 +418,103 @@ class PolicyAgent:
 #  API
 # ═══════════════════════════════════════════════════════════════════════════
 
-def get_all_agents(budget_inr=None):
-    """Run all agents and return comprehensive analysis."""
+AGENTS = {
+    "monitoring": MonitoringAgent,
+    "prediction": PredictionAgent,
+    "optimization": OptimizationAgent,
+    "policy": PolicyAgent,
+}
+
+# Background refresh cadence per agent (seconds), see modules/agent_scheduler.py
+AGENT_INTERVALS = {"monitoring": 300, "prediction": 900, "optimization": 1800, "policy": 3600}
+
+_agent_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent")
+
+
+def agent_topic(name):
+    return f"agents.{name}"
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.time()
+    return fn(*args, **kwargs), round(time.time() - started, 3)
+
+
+def iter_zone_status(state=None, min_severity="normal"):
+    """
+    Monitoring zone-status rows one at a time (latest scheduled scan, or a
+    fresh scan for a state filter), at or above min_severity.
+    """
+    event = bus.latest(agent_topic("monitoring")) if state is None else None
+    if event is not None:
+        rows = event.payload["result"]["zone_status"]
+    else:
+        zones, _ = get_zone_snapshot(state=state)
+        scan = MonitoringAgent.scan(zones)
+        rows = MonitoringAgent.iter_zone_status(zones, scan["anomalies"], scan["hotspots"])
+    floor = SEVERITY_RANK[min_severity]
+    return (row for row in rows if SEVERITY_RANK[row["status"]] >= floor)
+
+
+def _published_agents(budget_inr=None):
+    """Latest scheduler results from the event bus, or None until every agent has published."""
+    events = {name: bus.latest(agent_topic(name)) for name in AGENTS}
+    if any(event is None for event in events.values()):
+        return None
+
+    agents = [event.payload["result"] for event in events.values()]
+    if budget_inr:
+        # Budget-specific allocation is computed on demand; the rest stays published
+        agents[list(AGENTS).index("optimization")] = OptimizationAgent.analyze(budget_inr=budget_inr)
+    return {
+        "multi_agent_system": "UrbanEcoTwin Multi-Agent AI",
+        "agents": agents,
+        "system_status": "all_agents_active",
+        "coordination_mode": "collaborative",
+        "execution": {
+            "mode": "scheduled",
+            "published": {
+                name: {**event.to_dict(), "snapshot_version": event.payload["snapshot_version"],
+                       "elapsed_s": event.payload["elapsed_s"], "next_run_at": event.payload["next_run_at"]}
+                for name, event in events.items()
+            },
+        },
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def get_all_agents(budget_inr=None, state=None, fresh=False):
+    """
+    Latest published agent results when the scheduler is running; otherwise (or
+    with fresh=True / a state filter) run all agents concurrently over one zone
+    snapshot. Shared sub-results are computed once per run (see AgentRun).
+    """
+    if not fresh and state is None:
+        published = _published_agents(budget_inr)
+        if published is not None:
+            return published
+
+    started = time.time()
+    run = AgentRun(state=state)
+    futures = [
+        _agent_executor.submit(_timed, MonitoringAgent.analyze, run=run),
+        _agent_executor.submit(_timed, PredictionAgent.analyze, run=run),
+        _agent_executor.submit(_timed, OptimizationAgent.analyze, budget_inr=budget_inr, run=run),
+        _agent_executor.submit(_timed, PolicyAgent.analyze, run=run),
+    ]
+    results = [f.result() for f in futures]
     return {
         "multi_agent_system": "UrbanEcoTwin Multi-Agent AI",
-        "agents": [
-            MonitoringAgent.analyze(),
-            PredictionAgent.analyze(),
-            OptimizationAgent.analyze(budget_inr=budget_inr),
-            PolicyAgent.analyze(),
-        ],
+        "agents": [agent for agent, _ in results],
         "system_status": "all_agents_active",
         "coordination_mode": "collaborative",
+        "execution": {
+            "mode": "parallel",
+            "snapshot_version": run.snapshot_version,
+            "zones": len(run.zones),
+            "agent_seconds": {agent["agent"]: elapsed for agent, elapsed in results},
+            "shared_results_reused": run.memo_hits,
+            "wall_seconds": round(time.time() - started, 3),
+        },
         "timestamp": datetime.now().isoformat(),
     }
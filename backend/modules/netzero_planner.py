@@ -7,9 +7,9 @@ from data.city_data import get_all_zones
 from datetime import datetime
 
 
-def generate_netzero_roadmap(state=None):
+def generate_netzero_roadmap(state=None, zones=None):
     """Generate a comprehensive Net-Zero roadmap."""
-    zones = get_all_zones(state=state)
+    zones = zones if zones is not None else get_all_zones(state=state)
     city_total_co2 = sum(z["current_co2_ppm"] for z in zones)
     city_avg_co2 = city_total_co2 / len(zones)
 
@@ -0,0 +1,275 @@
+"""
+MODULE 6e: Online Baseline Detectors
+Streaming per-zone anomaly detection against each zone's own history.
+
+Every zone × pollutant keeps O(1) state, updated from the reading store's
+"readings.snapshot" events:
+  - EWMA mean / variance
+  - hour-of-day profile (24 EWMA mean / variance buckets)
+  - streaming median / MAD (frugal stochastic approximation, seeded from
+    the running moments during warm-up)
+A reading is flagged when at least MIN_VOTES of the warmed-up detectors see a
+deviation beyond their threshold. All state is held in (zones × pollutants)
+arrays, so each snapshot update is a handful of vectorized operations, and is
+persisted to backend/var/online_detectors.npz across restarts. On a cold start
+the last REPLAY_DAYS of the reading store are replayed.
+"""
+
+import io
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from data.events import bus
+from data.reading_store import READINGS_TOPIC, load_readings
+from data.storage import var_path
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = os.environ.get("URBANECOTWIN_DETECTOR_STATE") or var_path("online_detectors.npz")
+POLLUTANTS = ["current_co2_ppm", "current_aqi", "pm2_5", "pm10", "nitrogen_dioxide_ugm3", "ozone_ugm3"]
+LABELS = {
+    "current_co2_ppm": ("CO₂", "ppm"), "current_aqi": ("AQI", ""), "pm2_5": ("PM2.5", "µg/m³"),
+    "pm10": ("PM10", "µg/m³"), "nitrogen_dioxide_ugm3": ("NO₂", "µg/m³"), "ozone_ugm3": ("O₃", "µg/m³"),
+}
+
+EWMA_ALPHA = 0.1
+SEASONAL_ALPHA = 0.2
+MEDIAN_ETA = 0.05           # median / MAD step, as a fraction of the current MAD
+MIN_OBSERVATIONS = 12       # readings before EWMA / median baselines vote
+MIN_SEASONAL_OBSERVATIONS = 4
+EWMA_Z = 3.0
+SEASONAL_Z = 3.0
+ROBUST_Z = 3.5
+MIN_VOTES = 2
+SCALE_FLOOR = 0.01          # spread floor as a fraction of the baseline level
+MAD_TO_SIGMA = 1.4826
+REPLAY_DAYS = 7
+PERSIST_INTERVAL_S = 60
+
+_STATE_ARRAYS = ("count", "mean", "var", "s_mean", "s_var", "s_count", "median", "mad", "z", "flag", "value", "expected")
+_lock = threading.Lock()
+_state = {"ids": [], "index": {}, "arrays": None, "loaded": False, "saved_at": 0.0, "updates": 0}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  STATE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _empty(n):
+    p = len(POLLUTANTS)
+    return {
+        "count": np.zeros((n, p), dtype=np.int64),
+        "mean": np.zeros((n, p)), "var": np.zeros((n, p)),
+        "s_mean": np.zeros((n, p, 24)), "s_var": np.zeros((n, p, 24)),
+        "s_count": np.zeros((n, p, 24), dtype=np.int64),
+        "median": np.zeros((n, p)), "mad": np.zeros((n, p)),
+        "z": np.full((n, p, 3), np.nan),      # last EWMA / seasonal / robust z-scores
+        "flag": np.zeros((n, p), dtype=bool),
+        "value": np.full((n, p), np.nan),
+        "expected": np.full((n, p), np.nan),
+    }
+
+
+def _rows(zone_ids):
+    """Row per zone id, growing the state arrays (by doubling) for new zones."""
+    index = _state["index"]
+    for zid in zone_ids:
+        if zid not in index:
+            index[zid] = len(_state["ids"])
+            _state["ids"].append(zid)
+    arrays = _state["arrays"]
+    capacity = len(arrays["count"]) if arrays else 0
+    if len(_state["ids"]) > capacity:
+        grown = _empty(max(len(_state["ids"]), 2 * capacity, 64))
+        if arrays:
+            for name, arr in arrays.items():
+                grown[name][:capacity] = arr
+        _state["arrays"] = grown
+    return np.array([index[zid] for zid in zone_ids], dtype=np.int64)
+
+
+def _save():
+    arrays = _state["arrays"]
+    if arrays is None:
+        return
+    n = len(_state["ids"])
+    buf = io.BytesIO()
+    np.savez(buf, ids=np.array(_state["ids"]), pollutants=np.array(POLLUTANTS), **{k: v[:n] for k, v in arrays.items()})
+    tmp_path = f"{STATE_PATH}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp_path, STATE_PATH)
+        _state["saved_at"] = time.time()
+    except OSError as e:
+        logger.warning(f"Could not save detector state to {STATE_PATH}: {e}")
+
+
+def _load_state():
+    try:
+        with np.load(STATE_PATH, allow_pickle=False) as data:
+            if [str(p) for p in data["pollutants"]] != POLLUTANTS:
+                logger.warning(f"Detector state at {STATE_PATH} tracks other pollutants — ignoring it")
+                return False
+            ids = [str(i) for i in data["ids"]]
+            _rows(ids)
+            for name in _STATE_ARRAYS:
+                _state["arrays"][name][:len(ids)] = data[name]
+        return True
+    except FileNotFoundError:
+        return False
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Could not load detector state from {STATE_PATH}: {e}")
+        return False
+
+
+def _ensure_loaded(until=None):
+    """Load saved state, or replay the reading store (before `until`) on a cold start."""
+    if _state["loaded"]:
+        return
+    _state["loaded"] = True
+    if _load_state():
+        return
+    zone_ids, timestamps, values = load_readings(since=time.time() - REPLAY_DAYS * 86400, fields=POLLUTANTS)
+    if until is not None:
+        keep = timestamps < until
+        zone_ids, timestamps, values = np.array(zone_ids)[keep], timestamps[keep], values[keep]
+    if not len(timestamps):
+        return
+    zone_ids = np.array(zone_ids)
+    bounds = np.flatnonzero(np.diff(timestamps)) + 1
+    for batch in np.split(np.arange(len(timestamps)), bounds):
+        _update(zone_ids[batch].tolist(), values[batch], timestamps[batch[0]])
+    logger.info(f"Online detectors replayed {len(timestamps)} readings")
+    _save()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  UPDATE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _zscore(x, center, spread, ready):
+    scale = np.maximum(spread, SCALE_FLOOR * np.abs(center) + 1e-9)
+    return np.where(ready, (x - center) / scale, np.nan)
+
+
+def _update(zone_ids, X, recorded_at):
+    """Score then absorb one batch of readings (one row per zone, NaN = missing)."""
+    r = _rows(zone_ids)
+    a = _state["arrays"]
+    hour = datetime.fromtimestamp(recorded_at).hour
+    valid = ~np.isnan(X)
+    x = np.where(valid, X, 0.0)
+
+    n, m, v = a["count"][r], a["mean"][r], a["var"][r]
+    sm, sv, sn = a["s_mean"][r, :, hour], a["s_var"][r, :, hour], a["s_count"][r, :, hour]
+    med, mad = a["median"][r], a["mad"][r]
+
+    # Score against the baselines before they absorb this reading
+    warm = valid & (n >= MIN_OBSERVATIONS)
+    z = np.stack([
+        _zscore(x, m, np.sqrt(v), warm),
+        _zscore(x, sm, np.sqrt(sv), valid & (sn >= MIN_SEASONAL_OBSERVATIONS)),
+        _zscore(x, med, MAD_TO_SIGMA * mad, warm),
+    ], axis=-1)
+    with np.errstate(invalid="ignore"):
+        votes = (np.abs(z) > np.array([EWMA_Z, SEASONAL_Z, ROBUST_Z])).sum(axis=-1)
+    a["z"][r] = z
+    a["flag"][r] = votes >= MIN_VOTES
+    a["value"][r] = np.where(valid, X, np.nan)
+    a["expected"][r] = np.where(sn >= MIN_SEASONAL_OBSERVATIONS, sm, np.where(n > 0, m, np.nan))
+
+    # EWMA mean / variance (α starts at 1/n, i.e. plain running moments during warm-up)
+    alpha = np.maximum(EWMA_ALPHA, 1.0 / (n + 1))
+    d = x - m
+    a["mean"][r] = np.where(valid, m + alpha * d, m)
+    a["var"][r] = np.where(valid, (1 - alpha) * (v + alpha * d * d), v)
+    a["count"][r] = n + valid
+
+    # Hour-of-day profile
+    s_alpha = np.maximum(SEASONAL_ALPHA, 1.0 / (sn + 1))
+    ds = x - sm
+    a["s_mean"][r, :, hour] = np.where(valid, sm + s_alpha * ds, sm)
+    a["s_var"][r, :, hour] = np.where(valid, (1 - s_alpha) * (sv + s_alpha * ds * ds), sv)
+    a["s_count"][r, :, hour] = sn + valid
+
+    # Streaming median / MAD, seeded from the running moments until warmed up
+    step = MEDIAN_ETA * np.maximum(mad, SCALE_FLOOR * np.abs(med) + 1e-9)
+    warming = n + 1 < MIN_OBSERVATIONS
+    new_med = np.where(warming, a["mean"][r], med + step * np.sign(x - med))
+    new_mad = np.where(warming, np.sqrt(a["var"][r]) / MAD_TO_SIGMA, mad + step * np.sign(np.abs(x - med) - mad))
+    a["median"][r] = np.where(valid, new_med, med)
+    a["mad"][r] = np.where(valid, new_mad, mad)
+    _state["updates"] += 1
+
+
+def _on_readings(event):
+    payload = event.payload
+    fields = payload["fields"]
+    cols = [fields.index(p) for p in POLLUTANTS]
+    X = np.array([[row[c] if row[c] is not None else np.nan for c in cols] for row in payload["values"]], dtype=np.float64)
+    with _lock:
+        _ensure_loaded(until=payload["recorded_at"])      # the store already holds this batch
+        _update(payload["zone_ids"], X, payload["recorded_at"])
+        if time.time() - _state["saved_at"] >= PERSIST_INTERVAL_S:
+            _save()
+
+
+bus.subscribe(READINGS_TOPIC, _on_readings)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  QUERIES
+# ═══════════════════════════════════════════════════════════════════════════
+
+def baseline_deviations(zones):
+    """Zones whose latest reading deviates from their own baselines (worst pollutant per zone)."""
+    with _lock:
+        _ensure_loaded()
+        index = _state["index"]
+        known = [(z, index[z["id"]]) for z in zones if z["id"] in index]
+        if not known:
+            return []
+        a = _state["arrays"]
+        rows = np.array([i for _, i in known])
+        flags = a["flag"][rows]
+        z = np.nan_to_num(np.abs(a["z"][rows]), nan=0.0).max(axis=-1)
+        values, expected = a["value"][rows], a["expected"][rows]
+    anomalies = []
+    for k in np.flatnonzero(flags.any(axis=1)):
+        p = int(np.argmax(np.where(flags[k], z[k], -1)))
+        label, unit = LABELS[POLLUTANTS[p]]
+        zone = known[k][0]
+        anomalies.append({
+            "zone_id": zone["id"],
+            "zone_name": zone["name"],
+            "method": "baseline_deviation",
+            "pollutant": POLLUTANTS[p],
+            "value": round(float(values[k, p]), 1),
+            "expected": round(float(expected[k, p]), 1),
+            "z_score": round(float(z[k, p]), 2),
+            "alert": f"{label} {values[k, p]:.1f}{' ' + unit if unit else ''} vs usual {expected[k, p]:.1f} (z={z[k, p]:.1f})",
+        })
+    return anomalies
+
+
+def get_detector_status():
+    with _lock:
+        _ensure_loaded()
+        n = len(_state["ids"])
+        a = _state["arrays"]
+        warm = int((a["count"][:n] >= MIN_OBSERVATIONS).all(axis=1).sum()) if n else 0
+        flagged = int(a["flag"][:n].any(axis=1).sum()) if n else 0
+    return {
+        "zones_tracked": n,
+        "zones_warmed_up": warm,
+        "zones_flagged": flagged,
+        "pollutants": POLLUTANTS,
+        "updates": _state["updates"],
+        "persisted_at": datetime.fromtimestamp(_state["saved_at"]).isoformat() if _state["saved_at"] else None,
+    }
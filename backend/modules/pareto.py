@@ -0,0 +1,321 @@
+"""
+MODULE 5e: Multi-Objective Pareto Engine
+Non-dominated strategy fronts over CO₂ reduction, cost, public health and
+social acceptability.
+
+Non-dominated filtering (all objectives minimized internally):
+  - 2 objectives: lexicographic sort + running minimum, O(N log N), vectorized
+  - 3 objectives: sweep over the first objective with a 2-D staircase of the
+    other two (Kung et al.), O(N log N) comparisons
+  - more objectives: blocks in objective-sum order, each checked against
+    the front so far with vectorized dominance tests
+  - for 3+ objectives, a vectorized pre-filter against a small pivot set
+    drops most dominated candidates before the exact pass
+
+Candidates: every template scaled over a range of sizes plus random action
+mixes, shared by all zones and evaluated in one (Z, P) matrix pass. Fronts
+are cached per snapshot.
+"""
+
+import time
+import bisect
+import functools
+
+import numpy as np
+
+from data.city_data import get_all_zones
+from data.snapshot import SnapshotCache, get_snapshot_version
+from modules.health_impact import risk_scores
+from modules.rl_optimizer import (
+    ACTION_TYPES, _as_number, _compile_strategies, _context_arrays, _evaluate_matrix, _evaluation_pipeline,
+)
+from modules.strategy_search import UNIT_COSTS, QUANTITY_BOUNDS, _SEEDS, _FAMILIES, _family
+
+DEFAULT_CANDIDATES = 2048
+CANDIDATE_SCALES = np.geomspace(0.1, 1.5, 16)
+MAX_FRONT_POINTS = 25
+PIVOT_LIMIT = 256
+BLOCK_ELEMENTS = 4_000_000
+
+# Public acceptance of each action type (0–1), aligned with ACTION_TYPES
+ACCEPTABILITY = np.array([0.95, 0.85, 0.7, 0.6, 0.5, 0.9])
+
+# Health improvement per % of realized CO₂ reduction (same 0.8 factor as the RL reward)
+HEALTH_IMPROVEMENT_FACTOR = 0.8
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  NON-DOMINATED FILTERING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _front_2d(points):
+    """Points must be unique and lexicographically sorted."""
+    previous_min = np.minimum.accumulate(np.concatenate([[np.inf], points[:-1, 1]]))
+    return points[:, 1] < previous_min
+
+
+def _front_3d(points):
+    """Sweep in first-objective order; the staircase holds the (f2, f3) front seen so far."""
+    keep = np.zeros(len(points), dtype=bool)
+    ys, zs = [], []     # staircase: f2 ascending, f3 strictly descending
+    for i, (_, y, z) in enumerate(points.tolist()):
+        k = bisect.bisect_right(ys, y)
+        if k and zs[k - 1] <= z:
+            continue
+        keep[i] = True
+        lo = bisect.bisect_left(ys, y)
+        hi = lo
+        while hi < len(ys) and zs[hi] >= z:
+            hi += 1
+        ys[lo:hi] = [y]
+        zs[lo:hi] = [z]
+    return keep
+
+
+def _dominated_by(points, pivots):
+    """Whether each point is dominated by any pivot, in memory-bounded blocks."""
+    dominated = np.zeros(len(points), dtype=bool)
+    if len(pivots) == 0:
+        return dominated
+    block = max(1, BLOCK_ELEMENTS // (len(pivots) * points.shape[1]))
+    for start in range(0, len(points), block):
+        chunk = points[start:start + block, None, :]
+        no_worse = (pivots[None] <= chunk).all(axis=2)
+        better = (pivots[None] < chunk).any(axis=2)
+        dominated[start:start + block] = (no_worse & better).any(axis=1)
+    return dominated
+
+
+def _front_blocks(points):
+    """
+    Any-dimension front: visit points by objective sum (a dominator always has a
+    strictly smaller sum) and check each block against the front found so far.
+    """
+    order = np.argsort(points.sum(axis=1), kind="stable")
+    keep = np.zeros(len(points), dtype=bool)
+    front = points[:0]
+    block = 1024
+    for start in range(0, len(order), block):
+        idx = order[start:start + block]
+        idx = idx[~_dominated_by(points[idx], front)]
+        idx = idx[~_dominated_by(points[idx], points[idx])]
+        keep[idx] = True
+        front = np.concatenate([front, points[idx]])
+    return keep
+
+
+def _unique_rows(objectives):
+    """Lexicographically sorted unique rows and the inverse mapping (np.unique(axis=0), faster)."""
+    order = np.lexsort(objectives.T[::-1])
+    ordered = objectives[order]
+    new = np.concatenate([[True], (ordered[1:] != ordered[:-1]).any(axis=1)])
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    return ordered[new], inverse
+
+
+def _pivots(points):
+    """Cheap dominators: the 2-D front of the first two objectives + per-objective minima."""
+    front = points[_front_2d(points)]
+    extremes = points[points.argmin(axis=0)]
+    pivots = np.concatenate([front, extremes])
+    if len(pivots) > PIVOT_LIMIT:
+        pivots = pivots[np.linspace(0, len(pivots) - 1, PIVOT_LIMIT).astype(int)]
+    return pivots
+
+
+def non_dominated_mask(objectives):
+    """
+    Boolean mask of the Pareto-optimal rows of an (N, M) array (minimization).
+    Duplicate points share the same result.
+    """
+    objectives = np.asarray(objectives, dtype=np.float64)
+    n, m = objectives.shape
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    if m == 1:
+        return objectives[:, 0] == objectives[:, 0].min()
+
+    # Both sweeps rely on unique, lexicographically sorted rows
+    points, inverse = _unique_rows(objectives)
+    if m == 2:
+        return _front_2d(points)[inverse]
+
+    candidates = np.nonzero(~_dominated_by(points, _pivots(points)))[0]
+    keep = np.zeros(len(points), dtype=bool)
+    if m == 3:
+        keep[candidates] = _front_3d(points[candidates])
+    else:
+        keep[candidates] = _front_blocks(points[candidates])
+    return keep[inverse]
+
+
+def pareto_ranks(objectives, max_fronts=1):
+    """Front index per row (0 = Pareto front) by successive peeling; -1 beyond max_fronts."""
+    objectives = np.asarray(objectives, dtype=np.float64)
+    ranks = np.full(len(objectives), -1)
+    remaining = np.arange(len(objectives))
+    for rank in range(max_fronts):
+        if len(remaining) == 0:
+            break
+        mask = non_dominated_mask(objectives[remaining])
+        ranks[remaining[mask]] = rank
+        remaining = remaining[~mask]
+    return ranks
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  CANDIDATES & OBJECTIVES
+# ═══════════════════════════════════════════════════════════════════════════
+
+@functools.lru_cache(maxsize=8)
+def _candidate_quantities(n_candidates, seed=0):
+    """Scaled templates + random cost mixes (deterministic, shared by all zones)."""
+    rng = np.random.default_rng(seed)
+    scaled = np.floor((_SEEDS[:, None, :] * CANDIDATE_SCALES[None, :, None]).reshape(-1, len(ACTION_TYPES)))
+    n_random = max(0, n_candidates - len(scaled))
+    shares = rng.dirichlet(np.full(len(ACTION_TYPES), 0.5), n_random)
+    totals = np.exp(rng.uniform(np.log(1e6), np.log(2.5e9), n_random))
+    mixes = np.minimum(np.floor(shares * totals[:, None] / UNIT_COSTS), QUANTITY_BOUNDS)
+    quantities = np.concatenate([scaled, mixes])
+    return quantities[quantities.sum(axis=1) > 0]
+
+
+def _acceptability(ctx, quantities, costs):
+    """
+    Deterministic social acceptability (0–1): cost-weighted acceptance of the
+    action mix, lower for traffic control in congested zones and factory
+    regulation in industrial zones, minus a disruption term for scale.
+    """
+    base = np.broadcast_to(ACCEPTABILITY, (len(ctx["co2_current"]), len(ACTION_TYPES))).copy()
+    base[:, ACTION_TYPES.index("traffic_control")] -= np.where(ctx["traffic_density"] > 0.7, 0.15, 0.0)
+    base[:, ACTION_TYPES.index("factory_regulation")] -= np.where(ctx["industrial_index"] > 0.6, 0.1, 0.0)
+
+    spend = quantities * UNIT_COSTS
+    shares = spend / np.maximum(spend.sum(axis=-1, keepdims=True), 1.0)
+    if shares.ndim == 2:
+        mix = np.einsum("pa,za->zp", shares, base)
+    else:
+        mix = np.einsum("zpa,za->zp", shares, base)
+    scale = np.minimum(costs / np.maximum(ctx["budget_remaining"][:, None], 1.0), 1.0)
+    return np.clip(mix - 0.1 * scale, 0.0, 1.0)
+
+
+def _objectives(zones, ctx, quantities):
+    """Evaluate candidates (P, A) or (Z, P, A); returns (Z, P) objective arrays."""
+    costs = quantities @ UNIT_COSTS
+    family = _family(quantities)
+    evaluation = _evaluate_matrix(
+        ctx, quantities, costs, _FAMILIES["alignment_codes"][family], _FAMILIES["repeat_keys"][family],
+    )
+    base_co2 = ctx["co2_current"][:, None]
+    realized_ppm = base_co2 - evaluation["new_co2_ppm"]
+    realized_pct = np.where(base_co2 > 0, realized_ppm / base_co2 * 100, 0.0)
+    risk = risk_scores(zones)[:, None]
+    health = 100 - risk * (1 - HEALTH_IMPROVEMENT_FACTOR * realized_pct / 100)
+    return {
+        "reduction_ppm": realized_ppm,
+        "reduction_pct": realized_pct,
+        "cost_inr": evaluation["estimated_cost_inr"],
+        "health_score": health,
+        "acceptability": _acceptability(ctx, quantities, evaluation["estimated_cost_inr"]),
+        "rl_reward": evaluation["rl_reward"],
+        "family": np.broadcast_to(family, realized_ppm.shape),
+    }
+
+
+def _front_point(objectives, quantities, z, p):
+    q = quantities[p] if quantities.ndim == 2 else quantities[z, p]
+    family_name = _FAMILIES["names"][objectives["family"][z, p]]
+    return {
+        "strategy_name": f"{family_name} mix",
+        "actions": [
+            {"type": a, "quantity": int(q[i]), "cost_per_unit": _as_number(UNIT_COSTS[i])}
+            for i, a in enumerate(ACTION_TYPES) if q[i] > 0
+        ],
+        "co2_reduction_ppm": round(float(objectives["reduction_ppm"][z, p]), 2),
+        "co2_reduction_pct": round(float(objectives["reduction_pct"][z, p]), 2),
+        "cost_inr": _as_number(objectives["cost_inr"][z, p]),
+        "health_score": round(float(objectives["health_score"][z, p]), 1),
+        "acceptability": round(float(objectives["acceptability"][z, p]), 3),
+        "rl_reward": round(float(objectives["rl_reward"][z, p]), 4),
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  MAIN ENTRY POINTS
+# ═══════════════════════════════════════════════════════════════════════════
+
+_pareto_cache = SnapshotCache(maxsize=16)
+
+
+def compute_pareto_fronts(zones, zone_contexts, n_candidates=DEFAULT_CANDIDATES):
+    """
+    Pareto front per zone over (CO₂ reduction ↑, cost ↓, acceptability ↑).
+
+    Within one zone the health score is a monotone function of the realized
+    CO₂ reduction, so it never changes the front; it is reported per point.
+    """
+    key = (tuple(c["id"] for c in zone_contexts), n_candidates)
+    version = get_snapshot_version()
+    hit, cached = _pareto_cache.get(key, version)
+    if hit:
+        return cached
+
+    started = time.time()
+    quantities = _candidate_quantities(n_candidates)
+    objectives = _objectives(zones, _context_arrays(zone_contexts), quantities)
+
+    fronts = []
+    for z, zone in enumerate(zones):
+        minimized = np.column_stack([
+            -objectives["reduction_ppm"][z], objectives["cost_inr"][z], -objectives["acceptability"][z],
+        ])
+        members = np.nonzero(non_dominated_mask(minimized))[0]
+        members = members[np.argsort(objectives["cost_inr"][z, members], kind="stable")]
+        shown = members
+        if len(members) > MAX_FRONT_POINTS:
+            shown = members[np.linspace(0, len(members) - 1, MAX_FRONT_POINTS).astype(int)]
+        fronts.append({
+            "zone_id": zone["id"],
+            "zone_name": zone["name"],
+            "front_size": int(len(members)),
+            "front": [_front_point(objectives, quantities, z, p) for p in shown],
+        })
+
+    result = {
+        "fronts": fronts,
+        "objectives": ["CO₂ reduction (max)", "Cost ₹ (min)", "Public health score (max)", "Social acceptability (max)"],
+        "candidates_per_zone": int(len(quantities)),
+        "candidates_evaluated": int(len(quantities) * len(zones)),
+        "elapsed_s": round(time.time() - started, 3),
+        "timestamp": __import__("datetime").datetime.now().isoformat(),
+    }
+    _pareto_cache.put(key, version, result)
+    return result
+
+
+def get_pareto_fronts(zone_id: str = None, state: str = None, n_candidates: int = DEFAULT_CANDIDATES, zones=None):
+    """Pareto fronts for all zones (or one zone) of the current snapshot."""
+    bundle = _evaluation_pipeline(zones if zones is not None else get_all_zones(state=state))
+    result = compute_pareto_fronts(bundle["zones"], bundle["contexts"], n_candidates)
+    if zone_id:
+        result = {**result, "fronts": [f for f in result["fronts"] if f["zone_id"] == zone_id]}
+    return result
+
+
+def score_strategies(zones, zone_contexts, strategies):
+    """Health score and acceptability of one given strategy per zone."""
+    if not zones:
+        return []
+    quantities = _compile_strategies(
+        [{"name": s.get("strategy_name", ""), "actions": s.get("actions", [])} for s in strategies]
+    )["quantities"]
+    objectives = _objectives(zones, _context_arrays(zone_contexts), quantities[:, None, :])
+    return [
+        {
+            "health_score": round(float(objectives["health_score"][z, 0]), 1),
+            "acceptability": round(float(objectives["acceptability"][z, 0]), 3),
+        }
+        for z in range(len(zones))
+    ]
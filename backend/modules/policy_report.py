@@ -10,12 +10,15 @@ from modules.carbon_credits import calculate_carbon_credits
 from modules.netzero_planner import generate_netzero_roadmap
 
 
-def generate_report(state=None):
-    """Generate comprehensive policy report."""
-    zones = get_all_zones(state=state)
-    scores = get_sustainability_scores(state=state)
-    credits = calculate_carbon_credits(state=state)
-    roadmap = generate_netzero_roadmap(state=state)
+def generate_report(state=None, zones=None, scores=None, credits=None, roadmap=None):
+    """
+    Generate comprehensive policy report.
+    Callers holding a zone snapshot (and any already computed sections) can pass them in.
+    """
+    zones = zones if zones is not None else get_all_zones(state=state)
+    scores = scores or get_sustainability_scores(state=state, zones=zones)
+    credits = credits or calculate_carbon_credits(state=state, zones=zones)
+    roadmap = roadmap or generate_netzero_roadmap(state=state, zones=zones)
 
     city_avg_co2 = sum(z["current_co2_ppm"] for z in zones) / len(zones)
     city_avg_aqi = sum(z["current_aqi"] for z in zones) / len(zones)
@@ -11,6 +11,10 @@ Advanced ML Pipeline:
 import math
 import random
 from datetime import datetime
+
+import numpy as np
+from scipy.special import ndtri
+
 from data.city_data import get_all_zones
 
 
@@ -152,13 +156,69 @@ def _generate_advanced_series(zone, all_zones, hours, traffic_factor_override=No
     return series, spatial_lag
 
 
+# ═══════════════════════════════════════════════════════════════════════════
+#  FORECAST TENSOR (all zones × hours in one pass)
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Nominal interval confidence at the published horizons (hours), interpolated in log-hours
+HORIZON_CONFIDENCE = {1: 0.98, 24: 0.95, 168: 0.88, 720: 0.82}
+BASE_MARGIN_PPM = 2.0       # mean of the per-horizon margin's U(1, 3) jitter
+ENSEMBLE_NOISE_SD = math.hypot(0.65 * 0.8, 0.35 * 1.0)
+
+
+def _spatial_lags(zones) -> np.ndarray:
+    """_calculate_spatial_lag for every zone at once (same-city neighbour mean)."""
+    _, city = np.unique([z.get("city", "chennai") for z in zones], return_inverse=True)
+    co2 = np.array([z["current_co2_ppm"] for z in zones], dtype=np.float64)
+    total = np.bincount(city, weights=co2)[city]
+    n = np.bincount(city)[city]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lag = ((total - co2) / (n - 1) - 400) * 0.15
+    return np.round(np.where(n > 1, lag, 0.0), 2)
+
+
+def forecast_tensor(zones, hours: int = 24) -> dict:
+    """
+    Expected CO₂ path of the stacking ensemble for zones × hours 1..hours
+    (noise-free version of _generate_advanced_series), with central intervals:
+      mean / lower / upper / sd: (zones, hours); hours, confidence: (hours,)
+    sd is the normal spread implied by each interval at its confidence.
+    """
+    n = len(zones)
+    h = np.arange(1, hours + 1, dtype=np.float64)
+    base = np.array([z["current_co2_ppm"] for z in zones], dtype=np.float64)[:, None]
+    temp = np.array([z.get("avg_temperature_c") or 0 for z in zones], dtype=np.float64)[:, None]
+    humidity = np.array([z.get("avg_humidity_pct") or 0 for z in zones], dtype=np.float64)[:, None]
+    pm25 = np.array([z.get("pm2_5") or 0 for z in zones], dtype=np.float64)[:, None]
+    lag = _spatial_lags(zones)[:, None] if n else np.zeros((0, 1))
+
+    peak = ((8 <= h) & (h <= 11)) | ((17 <= h) & (h <= 20))
+    traffic = np.where(peak, 1.5, 0.5)
+    lgbm = base + 10 * np.sin((h - 6) * np.pi / 12) + (temp - 25) * 0.5 + traffic * 1.5
+    xgb = base + 12 * np.sin((h - 5.5) * np.pi / 12) + (humidity - 50) * -0.05 + np.log1p(pm25) * 0.8
+    mean = lgbm * 0.65 + xgb * 0.35 + lag * 1.2 + h * 0.2
+
+    anchors = sorted(HORIZON_CONFIDENCE)
+    confidence = np.interp(np.log(h), np.log(anchors), [HORIZON_CONFIDENCE[a] for a in anchors])
+    margin = (1 - confidence) * np.abs(mean - base) + BASE_MARGIN_PPM
+    sd = np.sqrt((margin / ndtri((1 + confidence) / 2)) ** 2 + ENSEMBLE_NOISE_SD ** 2)
+    return {
+        "hours": h.astype(int),
+        "confidence": confidence,
+        "mean": mean,
+        "lower": mean - margin,
+        "upper": mean + margin,
+        "sd": sd,
+    }
+
+
 # ═══════════════════════════════════════════════════════════════════════════
 #  MAIN ENTRY
 # ═══════════════════════════════════════════════════════════════════════════
 
-def get_predictions(zone_id: str = None, state: str = None):
+def get_predictions(zone_id: str = None, state: str = None, zones=None):
     """Generate multi-horizon predictions (1h, 24h, 7d, 30d) with confidence intervals + SHAP."""
-    all_zones = get_all_zones(state=state)
+    all_zones = zones if zones is not None else get_all_zones(state=state)
 
     zones = all_zones
     if zone_id:
@@ -0,0 +1,163 @@
+"""
+MODULE 13c: Predictive Alerts
+"Expected to breach in N hours" warnings from the CO₂ forecast.
+
+On every reading snapshot (in a background worker, coalesced, never on a
+request) the prediction engine's forecast tensor is built for all zones and
+the alert rules are evaluated against it in one vectorized pass over
+zones × forecast hours × N_SCENARIOS quantiles of each hour's forecast
+interval. Fields without a forecast keep their current value. The share of
+quantile scenarios in which a level's enter condition holds is that hour's
+breach confidence; the first hour reaching MIN_CONFIDENCE for a level the
+zone is not already at becomes a predictive alert.
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.special import ndtri
+
+from data.city_data import ZONES
+from data.events import bus
+from data.reading_store import READINGS_TOPIC
+from modules.alert_rules import format_message, get_rules
+from modules.prediction_engine import forecast_tensor
+
+logger = logging.getLogger(__name__)
+
+PREDICTIVE_TOPIC = "alerts.predictive"
+FORECAST_HOURS = 24
+FORECAST_FIELD = "current_co2_ppm"
+N_SCENARIOS = 20
+MIN_CONFIDENCE = 0.5
+
+_QUANTILE_Z = ndtri((np.arange(N_SCENARIOS) + 0.5) / N_SCENARIOS)
+
+_lock = threading.Lock()
+_state = {"zones": {}, "alerts": [], "computed_at": None, "snapshot_version": None, "compute_ms": None, "pending": False}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="predictive")
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  EVALUATION
+# ═══════════════════════════════════════════════════════════════════════════
+
+def predictive_alerts(zones, hours: int = FORECAST_HOURS) -> list:
+    """Predictive alerts for zone dicts (one pass over zones × hours × scenarios)."""
+    rules = get_rules()
+    n = len(zones)
+    if not n or not rules.alerts:
+        return []
+    forecast = forecast_tensor(zones, hours)
+    h, k = len(forecast["hours"]), N_SCENARIOS
+    size = n * h * k
+
+    # Current readings (and rolling aggregates), then the same repeated over hours × scenarios
+    now_ctx = rules.zone_context(zones)
+    current = rules.scenario_context(now_ctx["fields"], now_ctx["aggregates"], n)
+    columns = {f: np.repeat(now_ctx["fields"][f], h * k) for f in rules.fields}
+    if FORECAST_FIELD in rules.fields:
+        scenarios = forecast["mean"][:, :, None] + forecast["sd"][:, :, None] * _QUANTILE_Z
+        columns[FORECAST_FIELD] = scenarios.reshape(size)
+    ctx = rules.scenario_context(columns, {key: np.repeat(v, h * k) for key, v in now_ctx["aggregates"].items()}, size)
+
+    alerts = []
+    for group in rules.alerts:
+        levels = group["levels"]
+        rank = np.arange(1, len(levels) + 1)
+        confidence = np.stack([
+            np.asarray(l["enter"](ctx), dtype=bool).reshape(n, h, k).mean(axis=2) for l in levels
+        ], axis=-1)                                                          # zones × hours × levels
+        at_now = np.where(np.stack([np.asarray(l["enter"](current), dtype=bool) for l in levels], axis=-1), rank, 0).max(axis=1)
+        likely = confidence >= MIN_CONFIDENCE
+        reached = likely.any(axis=1) & (rank > at_now[:, None])             # zones × levels
+        if not reached.any():
+            continue
+        values = np.median(np.asarray(group["value"](ctx), dtype=np.float64).reshape(n, h, k), axis=2)
+        first_hour = likely.argmax(axis=1)                                   # zones × levels
+        for z in np.flatnonzero(reached.any(axis=1)).tolist():
+            level = int(np.flatnonzero(reached[z])[-1])                      # highest level expected
+            hour = int(first_hour[z, level])
+            spec, zone = levels[level], zones[z]
+            in_hours = int(forecast["hours"][hour])
+            conf = float(confidence[z, hour, level])
+            value = float(values[z, hour])
+            alerts.append({
+                "id": f"predictive-{group['type']}-{zone['id']}",
+                "zone_id": zone["id"],
+                "zone_name": zone["name"],
+                "state": zone.get("state"),
+                "type": group["type"],
+                "mode": "predictive",
+                "severity": "info",
+                "predicted_severity": spec["severity"],
+                "color": "#8b5cf6",
+                "title": f"{spec.get('title', group['type'])} Expected",
+                "message": f"{format_message(spec.get('message', ''), zone['name'], value, spec.get('threshold'))} "
+                           f"— expected in {in_hours} h ({conf:.0%} confidence)",
+                "value": round(value, 1),
+                "threshold": spec.get("threshold"),
+                "expected_in_hours": in_hours,
+                "confidence": round(conf, 2),
+                "recommended_action": spec.get("recommended_action"),
+            })
+    alerts.sort(key=lambda a: (a["expected_in_hours"], -a["confidence"]))
+    return alerts
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  SNAPSHOT PROCESSING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _run():
+    with _lock:
+        _state["pending"] = False
+        zones = list(_state["zones"].values())
+        version = _state["snapshot_version"]
+    started = time.perf_counter()
+    try:
+        alerts = predictive_alerts(zones)
+    except Exception:
+        logger.exception("Predictive alert evaluation failed")
+        return
+    with _lock:
+        _state.update(alerts=alerts, computed_at=datetime.now().isoformat(), snapshot_version=version,
+                      compute_ms=round((time.perf_counter() - started) * 1000, 1))
+    bus.publish(PREDICTIVE_TOPIC, {"alerts": alerts, "snapshot_version": version})
+
+
+def _on_readings(event):
+    payload = event.payload
+    fields = payload["fields"]
+    with _lock:
+        for zid, values in zip(payload["zone_ids"], payload["values"]):
+            if zid in ZONES:
+                _state["zones"][zid] = {"id": zid, **ZONES[zid], **dict(zip(fields, values))}
+        _state["snapshot_version"] = payload.get("snapshot_version")
+        if _state["pending"]:
+            return      # a run is already queued and will see these readings
+        _state["pending"] = True
+    _executor.submit(_run)
+
+
+bus.subscribe(READINGS_TOPIC, _on_readings)
+
+
+def get_predictive_alerts(state=None):
+    """Latest predictive alerts (computed with the last snapshot, not on this request)."""
+    with _lock:
+        alerts = _state["alerts"]
+        meta = {k: _state[k] for k in ("computed_at", "snapshot_version", "compute_ms")}
+    if state:
+        alerts = [a for a in alerts if a["state"] == state]
+    return {
+        "alerts": alerts,
+        "total_alerts": len(alerts),
+        "horizon_hours": FORECAST_HOURS,
+        "min_confidence": MIN_CONFIDENCE,
+        **meta,
+    }
@@ -0,0 +1,485 @@
+"""
+MODULE 17: Report Export
+Policy report downloads: a printable PDF, plus zone-level CSV and Parquet.
+
+  - Rendering runs as a "report_export" background job (modules.jobs), never
+    on the request. The report and its sections come from the snapshot
+    computation graph, so an export costs no more than viewing the report
+  - Artifacts are cached on disk under var/reports/<process id>, keyed by
+    (state, snapshot version, format). Repeat requests on the same snapshot are
+    served from disk straight away. The least recently used artifacts are
+    evicted once the cache holds more than MAX_CACHE_BYTES. Snapshot versions
+    restart with every process, so each process keeps its own directory and
+    file names; the app removes its directory on shutdown and prunes
+    directories left behind by earlier processes on startup
+  - Downloads are streamed from the file in chunks, never loaded into memory
+  - The PDF is written directly (standard Type 1 fonts, no dependency).
+    Parquet needs pyarrow and is listed as unavailable without it
+"""
+
+import os
+import csv
+import time
+import uuid
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from data.city_data import get_zone_snapshot
+from data.snapshot import get_snapshot_version
+from data.storage import var_path
+from modules.carbon_credits import CREDIT_RATE_PER_TONNE_INR
+from modules.compute_graph import pull
+
+try:
+    import pyarrow  # noqa: F401 — Parquet engine for pandas
+    _HAS_PARQUET = True
+except ImportError:
+    _HAS_PARQUET = False
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+STALE_EXPORT_S = 24 * 3600
+FORMATS = {
+    "pdf": "application/pdf",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+ZONE_COLUMNS = [
+    "zone_id", "zone_name", "city", "state", "lat", "lng",
+    "co2_ppm", "aqi", "pm2_5", "pm10", "no2_ugm3",
+    "sustainability_score", "grade", "air_quality_score", "carbon_emissions_score",
+    "reduction_ppm", "reduction_tonnes", "credits_earned", "credit_value_inr",
+]
+
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+EXPORTS_DIR = os.path.dirname(var_path("reports", "_"))
+REPORT_DIR = os.path.join(EXPORTS_DIR, PROCESS_ID)
+
+_lock = threading.Lock()
+_artifacts = OrderedDict()      # (state, snapshot_version, format) -> artifact dict, LRU order
+_stats = {"hits": 0, "misses": 0, "rendered": 0, "evictions": 0}
+
+
+def available_formats() -> dict:
+    return {fmt: fmt != "parquet" or _HAS_PARQUET for fmt in FORMATS}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  ZONE TABLE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def zone_rows(zones, scores, credits) -> list:
+    """One flat row per zone (readings, sustainability score, carbon credits)."""
+    score_by_zone = {s["zone_id"]: s for s in scores["zone_scores"]}
+    credit_by_zone = {c["zone_id"]: c for c in credits["carbon_credit_analysis"]}
+    rows = []
+    for z in zones:
+        score = score_by_zone.get(z["id"], {})
+        credit = credit_by_zone.get(z["id"], {})
+        breakdown = score.get("breakdown", {})
+        tonnes = credit.get("reduction_tonnes", 0.0)
+        rows.append({
+            "zone_id": z["id"],
+            "zone_name": z["name"],
+            "city": z.get("city"),
+            "state": z.get("state"),
+            "lat": z.get("lat"),
+            "lng": z.get("lng"),
+            "co2_ppm": z.get("current_co2_ppm"),
+            "aqi": z.get("current_aqi"),
+            "pm2_5": z.get("pm2_5"),
+            "pm10": z.get("pm10"),
+            "no2_ugm3": z.get("nitrogen_dioxide_ugm3"),
+            "sustainability_score": score.get("sustainability_score"),
+            "grade": score.get("grade"),
+            "air_quality_score": breakdown.get("air_quality"),
+            "carbon_emissions_score": breakdown.get("carbon_emissions"),
+            "reduction_ppm": credit.get("reduction_ppm"),
+            "reduction_tonnes": tonnes,
+            "credits_earned": credit.get("carbon_credits", {}).get("credits_earned"),
+            "credit_value_inr": round(tonnes * CREDIT_RATE_PER_TONNE_INR, 2),
+        })
+    rows.sort(key=lambda r: (r["state"] or "", r["zone_name"]))
+    return rows
+
+
+def _write_csv(path, report, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=ZONE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _write_parquet(path, report, rows):
+    import pandas as pd
+    pd.DataFrame(rows, columns=ZONE_COLUMNS).to_parquet(path, index=False)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  PDF
+# ═══════════════════════════════════════════════════════════════════════════
+
+PAGE_W, PAGE_H = 595, 842       # A4 in points
+MARGIN = 50
+FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold"}
+_TEXT_SUBSTITUTIONS = {"₂": "2", "₹": "Rs ", "µ": "u", "→": "->", "≥": ">=", "≤": "<="}
+
+
+def _pdf_text(value) -> bytes:
+    """WinAnsi-encoded, escaped PDF string body; characters outside it are dropped."""
+    text = str(value)
+    for old, new in _TEXT_SUBSTITUTIONS.items():
+        text = text.replace(old, new)
+    raw = text.encode("cp1252", errors="ignore")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _fit(value, width, size) -> str:
+    """Truncate to roughly fit width points (Helvetica averages ~0.5 em per character)."""
+    text = str(value)
+    limit = max(int(width / (size * 0.5)), 1)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _wrap(value, width, size) -> list:
+    words, lines, line = str(value).split(), [], ""
+    limit = max(int(width / (size * 0.5)), 1)
+    for word in words:
+        if line and len(line) + 1 + len(word) > limit:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + [line] if line else lines
+
+
+class _PdfDocument:
+    """Top-down text layout on A4 pages, written as a minimal PDF 1.4 file."""
+
+    def __init__(self, title, footer):
+        self.title = title
+        self.footer = footer
+        self.pages = []
+        self._new_page()
+
+    def _new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_H - MARGIN
+
+    def _ensure(self, height):
+        if self.y - height < MARGIN + 20:
+            self._new_page()
+
+    def text(self, x, value, size=10, font="F1", color=(0, 0, 0)):
+        self.ops.append(b"BT /%s %d Tf %.3f %.3f %.3f rg %.1f %.1f Td (%s) Tj ET" % (
+            font.encode(), size, *color, x, self.y, _pdf_text(value)))
+
+    def rule(self, color=(0.75, 0.78, 0.82)):
+        self.ops.append(b"%.3f %.3f %.3f RG 0.6 w %d %.1f m %d %.1f l S" % (
+            *color, MARGIN, self.y, PAGE_W - MARGIN, self.y))
+
+    def title_block(self, title, subtitle, meta):
+        self.text(MARGIN, title, size=18, font="F2", color=(0.06, 0.24, 0.2))
+        self.y -= 20
+        self.text(MARGIN, subtitle, size=11, color=(0.3, 0.33, 0.38))
+        self.y -= 16
+        self.text(MARGIN, meta, size=8, color=(0.45, 0.47, 0.5))
+        self.y -= 10
+        self.rule(color=(0.06, 0.24, 0.2))
+        self.y -= 14
+
+    def heading(self, value):
+        self._ensure(40)
+        self.y -= 8
+        self.text(MARGIN, value, size=13, font="F2", color=(0.06, 0.24, 0.2))
+        self.y -= 6
+        self.rule()
+        self.y -= 14
+
+    def paragraph(self, value, size=10, font="F1", indent=0):
+        for line in _wrap(value, PAGE_W - 2 * MARGIN - indent, size):
+            self._ensure(size + 4)
+            self.text(MARGIN + indent, line, size=size, font=font)
+            self.y -= size + 4
+
+    def key_values(self, pairs):
+        for key, value in pairs:
+            self._ensure(14)
+            self.text(MARGIN, key, size=10, font="F2")
+            self.text(MARGIN + 210, _fit(value, PAGE_W - 2 * MARGIN - 210, 10), size=10)
+            self.y -= 14
+
+    def table(self, headers, rows, widths, size=8):
+        def header():
+            x = MARGIN
+            for h, w in zip(headers, widths):
+                self.text(x, _fit(h, w - 4, size), size=size, font="F2")
+                x += w
+            self.y -= 4
+            self.rule()
+            self.y -= size + 4
+
+        self._ensure(3 * (size + 4))
+        header()
+        for row in rows:
+            if self.y - (size + 4) < MARGIN + 20:
+                self._new_page()
+                header()        # repeat the header on every page the table spans
+            x = MARGIN
+            for value, w in zip(row, widths):
+                self.text(x, _fit("" if value is None else value, w - 4, size), size=size)
+                x += w
+            self.y -= size + 4
+        self.y -= 6
+
+    def save(self, path):
+        n_fonts, n_pages = len(FONTS), len(self.pages)
+        first_page = 3 + n_fonts
+        page_ids = [first_page + 2 * i for i in range(n_pages)]
+        info_id = first_page + 2 * n_pages
+        font_refs = b" ".join(b"/%s %d 0 R" % (name.encode(), 3 + i) for i, name in enumerate(FONTS))
+
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % p for p in page_ids), n_pages),
+        ]
+        objects += [b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % base.encode()
+                    for base in FONTS.values()]
+        for number, (page_id, ops) in enumerate(zip(page_ids, self.pages), start=1):
+            footer = [
+                b"0.75 0.78 0.82 RG 0.6 w %d %d m %d %d l S" % (MARGIN, MARGIN, PAGE_W - MARGIN, MARGIN),
+                b"BT /F1 7 Tf 0.45 0.47 0.5 rg %d %d Td (%s) Tj ET" % (MARGIN, MARGIN - 12, _pdf_text(self.footer)),
+                b"BT /F1 7 Tf 0.45 0.47 0.5 rg %d %d Td (%s) Tj ET" % (
+                    PAGE_W - MARGIN - 50, MARGIN - 12, _pdf_text(f"Page {number} of {n_pages}")),
+            ]
+            content = b"\n".join(ops + footer)
+            objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << %s >> >> "
+                           b"/Contents %d 0 R >>" % (PAGE_W, PAGE_H, font_refs, page_id + 1))
+            objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(b"<< /Title (%s) /Producer (UrbanEcoTwin-NetZero) /CreationDate (D:%s) >>" % (
+            _pdf_text(self.title), datetime.now().strftime("%Y%m%d%H%M%S").encode()))
+
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+            offsets = []
+            for i, body in enumerate(objects, start=1):
+                offsets.append(f.tell())
+                f.write(b"%d 0 obj\n%s\nendobj\n" % (i, body))
+            xref = f.tell()
+            f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+            f.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+            f.write(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+                len(objects) + 1, info_id, xref))
+
+
+def _write_pdf(path, report, rows):
+    summary = report["executive_summary"]
+    roadmap = report["net_zero_roadmap_summary"]
+    economics = report["carbon_economics"]
+    doc = _PdfDocument(report["title"], f"{report['report_id']} · {report['subtitle']}")
+    doc.title_block(report["title"], report["subtitle"],
+                    f"Report {report['report_id']} · generated {report['generated_at'][:19].replace('T', ' ')}")
+
+    doc.heading("1. Executive Summary")
+    doc.key_values([
+        ("Coverage", summary["city"] if summary["city"] != "all" else "All states"),
+        ("Zones analysed", summary["zones_analyzed"]),
+        ("Average CO₂ (ppm)", summary["current_avg_co2_ppm"]),
+        ("Average AQI", summary["current_avg_aqi"]),
+        ("Sustainability score / grade", f"{summary['sustainability_score']} / {summary['sustainability_grade']}"),
+        ("Net-zero target year", summary["net_zero_target_year"]),
+        ("Net-zero feasible", "Yes" if summary["net_zero_feasible"] else "No"),
+        ("Carbon credit potential", summary["total_carbon_credit_potential"]),
+        ("Highest CO₂ zone", report["current_state"]["worst_zone"]),
+        ("Lowest CO₂ zone", report["current_state"]["best_zone"]),
+    ])
+
+    doc.heading("2. Priority Recommendations")
+    for i, rec in enumerate(report["recommendations"], start=1):
+        doc.paragraph(f"{i}. [{rec['priority']}] {rec['action']}", font="F2")
+        doc.paragraph(f"Expected impact: {rec['expected_impact']} · Timeline: {rec['timeline']} · "
+                      f"Estimated cost: {rec['estimated_cost']}", size=9, indent=12)
+        doc.y -= 4
+
+    doc.heading("3. Net-Zero Roadmap and Carbon Economics")
+    doc.key_values([
+        ("Target year", roadmap["target_year"]),
+        ("Phases", roadmap["phases"]),
+        ("Total investment", roadmap["total_investment"]),
+        ("Credit potential over plan", roadmap["carbon_credits_potential"]),
+        ("CO₂ reduction potential (t)", f"{economics['total_reduction_tonnes']:,.2f}"),
+        ("Credits earned", f"{economics['total_credits_earned']:,.1f}"),
+        ("Credit value (INR)", economics["total_credits_inr"]),
+        ("Credit value (USD)", economics["total_credits_usd"]),
+    ])
+
+    doc.heading("4. Zone Assessment")
+    doc.table(
+        ["Zone", "State", "CO₂ ppm", "AQI", "PM2.5", "Score", "Grade", "Reduction t", "Credit value (INR)"],
+        [[r["zone_name"], r["state"], r["co2_ppm"], r["aqi"],
+          None if r["pm2_5"] is None else round(r["pm2_5"], 1),
+          r["sustainability_score"], r["grade"], f"{r['reduction_tonnes']:,.1f}", f"{r['credit_value_inr']:,.0f}"]
+         for r in rows],
+        widths=[100, 70, 45, 35, 40, 40, 35, 60, 70],
+    )
+    doc.paragraph("Readings are the latest live observations at generation time. Carbon credits are valued at the "
+                  "voluntary carbon market rate for a reduction to 350 ppm.", size=8)
+    doc.save(path)
+
+
+_WRITERS = {"pdf": _write_pdf, "csv": _write_csv, "parquet": _write_parquet}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  ARTIFACT CACHE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _lookup(state, version, fmt):
+    key = (state, version, fmt)
+    with _lock:
+        artifact = _artifacts.get(key)
+        if artifact is None or not os.path.exists(artifact["path"]):
+            _artifacts.pop(key, None)
+            _stats["misses"] += 1
+            return None
+        _artifacts.move_to_end(key)
+        _stats["hits"] += 1
+        return artifact
+
+
+def _store(artifact):
+    key = (artifact["state"], artifact["snapshot_version"], artifact["format"])
+    with _lock:
+        _artifacts[key] = artifact
+        _artifacts.move_to_end(key)
+        total = sum(a["size_bytes"] for a in _artifacts.values())
+        while total > MAX_CACHE_BYTES and len(_artifacts) > 1:
+            _, old = _artifacts.popitem(last=False)
+            total -= old["size_bytes"]
+            _stats["evictions"] += 1
+            try:
+                os.remove(old["path"])
+            except OSError:
+                pass
+
+
+def prune_exports(max_age_s: float = STALE_EXPORT_S):
+    """Remove export directories of other processes not written to for max_age_s (app startup)."""
+    cutoff = time.time() - max_age_s
+    for entry in os.scandir(EXPORTS_DIR):
+        if entry.is_dir() and entry.name != PROCESS_ID and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def clear_exports():
+    """Remove this process's artifacts (app shutdown); they cannot be matched by a later process."""
+    with _lock:
+        _artifacts.clear()
+    shutil.rmtree(REPORT_DIR, ignore_errors=True)
+
+
+def get_artifact(name: str):
+    """Cached artifact by file name, or None (unknown or evicted)."""
+    with _lock:
+        for artifact in _artifacts.values():
+            if artifact["name"] == name and os.path.exists(artifact["path"]):
+                return artifact
+    return None
+
+
+def _public(artifact) -> dict:
+    return {k: v for k, v in artifact.items() if k != "path"}
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  RENDERING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _check_format(fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'. Available: {sorted(FORMATS)}")
+    if not available_formats()[fmt]:
+        raise ValueError(f"Export format '{fmt}' needs pyarrow, which is not installed")
+
+
+def render_export(state=None, fmt="pdf", progress=None, should_stop=None):
+    """Render (or reuse) the export of the current snapshot; runs inside a background job."""
+    _check_format(fmt)
+    progress = progress or (lambda fraction, message=None: None)
+    should_stop = should_stop or (lambda: False)
+
+    zones, version = get_zone_snapshot(state=state)
+    cached = _lookup(state, version, fmt)
+    if cached:
+        return _public(cached)
+
+    progress(0.1, "computing report")
+    report = pull("report", state=state, zones=zones, version=version)
+    rows = zone_rows(zones, pull("scores", state=state, zones=zones, version=version),
+                     pull("credits", state=state, zones=zones, version=version))
+    if should_stop():
+        return None
+
+    progress(0.4, f"rendering {fmt}")
+    name = f"report-{state or 'all'}-{PROCESS_ID}-v{version}.{fmt}"
+    path = var_path("reports", PROCESS_ID, name)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    started = datetime.now()
+    try:
+        _WRITERS[fmt](tmp, report, rows)
+        os.replace(tmp, path)       # readers never see a partially written file
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    artifact = {
+        "name": name,
+        "path": path,
+        "format": fmt,
+        "media_type": FORMATS[fmt],
+        "state": state,
+        "snapshot_version": version,
+        "report_id": report["report_id"],
+        "zones": len(rows),
+        "size_bytes": os.path.getsize(path),
+        "created_at": datetime.now().isoformat(),
+        "render_ms": round((datetime.now() - started).total_seconds() * 1000, 1),
+        "download_url": f"/api/reports/exports/{name}",
+    }
+    _store(artifact)
+    with _lock:
+        _stats["rendered"] += 1
+    logger.info(f"Rendered {name} ({artifact['size_bytes']} bytes in {artifact['render_ms']} ms)")
+    return _public(artifact)
+
+
+def request_export(state=None, fmt="pdf") -> dict:
+    """The cached artifact for the current snapshot if there is one, otherwise a queued render job."""
+    from modules.jobs import submit_job
+
+    _check_format(fmt)
+    version = get_snapshot_version()
+    cached = _lookup(state, version, fmt)
+    if cached:
+        return {"status": "ready", "artifact": _public(cached)}
+    job = submit_job("report_export", {"state": state, "format": fmt, "snapshot_version": version})
+    return {"status": "rendering", "job": job}
+
+
+def get_export_status() -> dict:
+    with _lock:
+        artifacts = [_public(a) for a in reversed(_artifacts.values())]
+        stats = dict(_stats)
+    return {
+        "formats": available_formats(),
+        "artifacts": artifacts,
+        "cached_bytes": sum(a["size_bytes"] for a in artifacts),
+        "max_cache_bytes": MAX_CACHE_BYTES,
+        **stats,
+    }
@@ -3,26 +3,83 @@ MODULE 5: Reinforcement Learning Optimizer
 Finds the best sustainability strategy by testing action combinations.
 """
 
-import random
+import os
+import hashlib
+import logging
+import functools
+import numpy as np
 from data.city_data import get_all_zones
+from data.snapshot import SnapshotCache, get_snapshot_version
+from data.storage import var_path
+from modules.budget_allocation import allocate_budget, budget_curve, choice_at
+from modules.carbon_credits import CO2_PPM_TO_TONNES_FACTOR
 
+logger = logging.getLogger(__name__)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  ACTION MODEL
+# ═══════════════════════════════════════════════════════════════════════════
+
+ACTION_TYPES = ["tree_planting", "solar_panels", "ev_transition", "traffic_control", "factory_regulation", "green_cover"]
+ACTION_INDEX = {a: i for i, a in enumerate(ACTION_TYPES)}
+
+# CO₂ reduction (ppm) per unit of each action type, aligned with ACTION_TYPES
+BASE_REDUCTION_PER_UNIT = np.array([0.022, 0.15, 0.008, 0.003, 1.8, 0.5])
+
+# Context modifiers: (context field, comparison, threshold, multiplier per action type)
+CONTEXT_RULES = [
+    ("industrial_index", ">", 0.6, {"solar_panels": 2.0, "traffic_control": 1.5, "factory_regulation": 1.5,
+                                    "tree_planting": 0.5, "green_cover": 0.5}),
+    ("green_cover_index", "<", 0.4, {"tree_planting": 1.8, "green_cover": 1.8, "solar_panels": 0.8}),
+    ("traffic_density", ">", 0.7, {"traffic_control": 2.0, "ev_transition": 2.0, "factory_regulation": 0.7}),
+]
+_CONTEXT_MULTIPLIERS = np.array([
+    [rule[3].get(a, 1.0) for a in ACTION_TYPES] for rule in CONTEXT_RULES
+])
+
+# Contextual policy alignment, by strategy name
+ALIGNMENT_CODES = {
+    "Green Revolution": 1,
+    "Solar Transition": 2,
+    "Traffic & Industry Reform": 3,
+    "Balanced Sustainability": 4,
+    "Maximum Impact": 5,
+}
+_ALIGNMENT_SCORES = [2.0, 2.5, 2.5, 1.5, 1.2]
+_DEFAULT_ALIGNMENT = 0.5
+
+
+@functools.lru_cache(maxsize=None)
+def _zone_hash(zid):
+    """MD5 of the zone id — static per zone, so digested only once per process."""
+    return int(hashlib.md5(zid.encode()).hexdigest(), 16)
+
+
+# Zone contexts for the current snapshot, keyed by (zone id, readings, budget)
+_context_cache = SnapshotCache(maxsize=20000)
 
-import hashlib
 
 def _get_zone_context(zone, budget_remaining=2500000000):
-    """Generate deterministic state context based on zone attributes."""
+    """Generate deterministic state context based on zone attributes (memoized per snapshot)."""
     zid = zone.get("id", "unknown_zone")
-    h = int(hashlib.md5(zid.encode()).hexdigest(), 16)
-    
+    co2_current = zone.get("current_co2_ppm", 420.0)
+    aqi_current = float(zone.get("current_aqi", 100.0))
+
+    key = (zid, co2_current, aqi_current, float(budget_remaining))
+    version = get_snapshot_version()
+    hit, context = _context_cache.get(key, version)
+    if hit:
+        return context
+
+    h = _zone_hash(zid)
+
     # Pseudo-random but deterministic values between 0.0 and 1.0
     industrial_index = (h % 100) / 100.0
     green_cover_index = ((h // 100) % 100) / 100.0
     traffic_density = ((h // 10000) % 100) / 100.0
-    
-    co2_current = zone.get("current_co2_ppm", 420.0)
-    aqi_current = float(zone.get("current_aqi", 100.0))
-    
-    return {
+
+    context = {
         "id": zid,
         "co2_current": co2_current,
         "aqi_current": aqi_current,
@@ -34,81 +91,113 @@ def _get_zone_context(zone, budget_remaining=2500000000):
         "traffic_density": traffic_density,
         "budget_remaining": float(budget_remaining)
     }
+    _context_cache.put(key, version, context)
+    return context
 
-def _evaluate_strategy(zone_context, strategy_name, actions):
-    """Evaluate a strategy dynamically using state-based action modifiers and multi-objective rewards."""
-    base_co2 = zone_context["co2_current"]
-    industrial_index = zone_context["industrial_index"]
-    green_cover_index = zone_context["green_cover_index"]
-    traffic_density = zone_context["traffic_density"]
-    budget_total = zone_context["budget_remaining"]
 
-    total_reduction = 0
+# ═══════════════════════════════════════════════════════════════════════════
+#  VECTORIZED STRATEGY EVALUATION
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _compile_strategies(templates):
+    """
+    Compile strategy templates into dense matrices over ACTION_TYPES.
+
+    Returns quantities (T, A), costs (T,), policy alignment codes (T,)
+    and repetition keys (T,). Unknown action types still count towards
+    cost but carry no reduction.
+    """
+    quantities = np.zeros((len(templates), len(ACTION_TYPES)))
+    costs = np.zeros(len(templates))
+    for t, template in enumerate(templates):
+        for action in template["actions"]:
+            idx = ACTION_INDEX.get(action["type"])
+            if idx is not None:
+                quantities[t, idx] += action["quantity"]
+            costs[t] += action["quantity"] * action.get("cost_per_unit", 1000)
+    names = [template["name"] for template in templates]
+    return {
+        "names": names,
+        "quantities": quantities,
+        "costs": costs,
+        "alignment_codes": np.array([ALIGNMENT_CODES.get(n, 0) for n in names]),
+        "repeat_keys": np.array([len(n) % 5 for n in names]),
+    }
+
+
+def _context_arrays(zone_contexts):
+    """Stack zone contexts into column arrays for the evaluation kernel."""
+    ctx = {
+        key: np.array([c[key] for c in zone_contexts], dtype=np.float64)
+        for key in ("co2_current", "aqi_current", "industrial_index", "green_cover_index",
+                    "traffic_density", "budget_remaining")
+    }
+    ctx["history_hash"] = np.array([_zone_hash(c["id"]) % 5 for c in zone_contexts])
+    return ctx
+
 
-    for action in actions:
-        multiplier = 1.0
-        
-        # Action Context Modifiers
-        if industrial_index > 0.6:
-            if action["type"] == "solar_panels": multiplier *= 2.0
-            elif action["type"] in ["traffic_control", "factory_regulation"]: multiplier *= 1.5
-            elif action["type"] in ["tree_planting", "green_cover"]: multiplier *= 0.5
-            
-        if green_cover_index < 0.4:
-            if action["type"] in ["tree_planting", "green_cover"]: multiplier *= 1.8
-            elif action["type"] == "solar_panels": multiplier *= 0.8
-            
-        if traffic_density > 0.7:
-            if action["type"] in ["traffic_control", "ev_transition"]: multiplier *= 2.0
-            elif action["type"] == "factory_regulation": multiplier *= 0.7
-
-        # Apply Base Reductions
-        if action["type"] == "tree_planting":
-            total_reduction += action["quantity"] * 0.022 * multiplier
-        elif action["type"] == "solar_panels":
-            total_reduction += action["quantity"] * 0.15 * multiplier
-        elif action["type"] == "ev_transition":
-            total_reduction += action["quantity"] * 0.008 * multiplier
-        elif action["type"] == "traffic_control":
-            total_reduction += action["quantity"] * 0.003 * multiplier
-        elif action["type"] == "factory_regulation":
-            total_reduction += action["quantity"] * 1.8 * multiplier
-        elif action["type"] == "green_cover":
-            total_reduction += action["quantity"] * 0.5 * multiplier
-
-    new_co2 = max(base_co2 - total_reduction, 280)
-    reduction_pct = (total_reduction / base_co2) * 100 if base_co2 > 0 else 0
-    cost = sum(a["quantity"] * a.get("cost_per_unit", 1000) for a in actions)
-    efficiency = reduction_pct / (cost / 1000000) if cost > 0 else 0
+def _action_multipliers(ctx):
+    """Context multiplier per zone and action type (Z, A), from masks over zone context."""
+    multipliers = np.ones((len(ctx["co2_current"]), len(ACTION_TYPES)))
+    for (field, op, threshold, _), rule_mult in zip(CONTEXT_RULES, _CONTEXT_MULTIPLIERS):
+        mask = ctx[field] > threshold if op == ">" else ctx[field] < threshold
+        multipliers *= np.where(mask[:, None], rule_mult[None, :], 1.0)
+    return multipliers
+
+
+def _soft_cap(ratio):
+    """Diminishing returns above 1.0 (square root) instead of a hard cap."""
+    return np.where(ratio > 1.0, np.sqrt(np.maximum(ratio, 1.0)), ratio)
+
+
+def _evaluate_matrix(ctx, quantities, costs, alignment_codes, repeat_keys):
+    """
+    Evaluate every zone × strategy in one NumPy pass.
+
+    quantities: (T, A) shared templates or (Z, T, A) per-zone candidates
+    costs:      (T,) or (Z, T)
+    Returns a dict of (Z, T) arrays.
+    """
+    base_co2 = ctx["co2_current"][:, None]
+    aqi = ctx["aqi_current"][:, None]
+    budget_total = ctx["budget_remaining"][:, None]
+    multipliers = _action_multipliers(ctx)
+
+    per_unit = quantities * BASE_REDUCTION_PER_UNIT
+    if quantities.ndim == 2:
+        total_reduction = np.einsum("ta,za->zt", per_unit, multipliers)
+    else:
+        total_reduction = np.einsum("zta,za->zt", per_unit, multipliers)
+    cost = np.broadcast_to(costs, total_reduction.shape)
+
+    new_co2 = np.maximum(base_co2 - total_reduction, 280)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reduction_pct = np.where(base_co2 > 0, total_reduction / base_co2 * 100, 0.0)
+        efficiency = np.where(cost > 0, reduction_pct / (cost / 1000000), 0.0)
 
     # ── Multi-Objective Reward Calculation ──
     # Soft limits using diminishing returns (square root) instead of hard caps to reward massive interventions
-    import math
-    
-    co2_ratio = reduction_pct / 30.0
-    normalized_co2_reduction = math.sqrt(co2_ratio) if co2_ratio > 1.0 else co2_ratio
-    
-    health_ratio = (reduction_pct * 0.8) / 25.0
-    normalized_health_improvement = math.sqrt(health_ratio) if health_ratio > 1.0 else health_ratio
-    
-    sust_gain = (reduction_pct * 0.5) / 10.0
-    sustainability_score_gain = math.sqrt(sust_gain) if sust_gain > 1.0 else sust_gain
-    
+    normalized_co2_reduction = _soft_cap(reduction_pct / 30.0)
+    normalized_health_improvement = _soft_cap((reduction_pct * 0.8) / 25.0)
+    sustainability_score_gain = _soft_cap((reduction_pct * 0.5) / 10.0)
+
     # Contextual Policy Alignment
-    policy_alignment_score = 0.5
-    if strategy_name == "Green Revolution" and green_cover_index < 0.4:
-        policy_alignment_score = 2.0
-    elif strategy_name == "Solar Transition" and industrial_index > 0.6:
-        policy_alignment_score = 2.5
-    elif strategy_name == "Traffic & Industry Reform" and traffic_density > 0.7:
-        policy_alignment_score = 2.5
-    elif strategy_name == "Balanced Sustainability" and cost <= 0.2 * budget_total:
-        policy_alignment_score = 1.5
-    elif strategy_name == "Maximum Impact" and (base_co2 > 480 or zone_context["aqi_current"] > 200):
-        policy_alignment_score = 1.2
-
-    normalized_cost = min(cost / max(budget_total, 1), 1.0)
-    budget_violation_penalty = max(0, (cost - budget_total) / max(budget_total, 1))
+    codes = np.asarray(alignment_codes)
+    policy_alignment_score = np.select(
+        [
+            (codes == 1) & (ctx["green_cover_index"] < 0.4)[:, None],
+            (codes == 2) & (ctx["industrial_index"] > 0.6)[:, None],
+            (codes == 3) & (ctx["traffic_density"] > 0.7)[:, None],
+            (codes == 4) & (cost <= 0.2 * budget_total),
+            (codes == 5) & ((base_co2 > 480) | (aqi > 200)),
+        ],
+        _ALIGNMENT_SCORES,
+        _DEFAULT_ALIGNMENT,
+    )
+
+    budget_safe = np.maximum(budget_total, 1)
+    normalized_cost = np.minimum(cost / budget_safe, 1.0)
+    budget_violation_penalty = np.maximum(0, (cost - budget_total) / budget_safe)
 
     # Weighting explicitly pushes the model to respect cost and policy alignment heavily for varied distribution
     reward = (
@@ -121,35 +210,54 @@ def _evaluate_strategy(zone_context, strategy_name, actions):
     )
 
     # Penalties
-    if cost > 0.25 * budget_total and zone_context["aqi_current"] <= 120 and base_co2 <= 460:
-        reward -= 0.5 # Huge penalty for spending wildly on safe zones
-        
+    reward = reward - np.where((cost > 0.25 * budget_total) & (aqi <= 120) & (base_co2 <= 460), 0.5, 0.0)
+
     # Simulated repetition penalty
-    history_hash = int(hashlib.md5(zone_context["id"].encode()).hexdigest(), 16) % 5
-    if history_hash == (len(strategy_name) % 5):
-        reward -= 0.1
+    reward = reward - np.where(ctx["history_hash"][:, None] == np.asarray(repeat_keys), 0.1, 0.0)
 
     # Urgency Multipliers based on AQI Risk
-    aqi = zone_context["aqi_current"]
-    if aqi > 170:
-        urgency_multiplier = 1.5
-    elif aqi > 120:
-        urgency_multiplier = 1.2
-    else:
-        urgency_multiplier = 1.0
-
-    final_reward = reward * urgency_multiplier
+    urgency_multiplier = np.where(aqi > 170, 1.5, np.where(aqi > 120, 1.2, 1.0))
 
     return {
-        "new_co2_ppm": round(new_co2, 1),
-        "reduction_ppm": round(total_reduction, 2),
-        "reduction_pct": round(reduction_pct, 2),
+        "new_co2_ppm": new_co2,
+        "reduction_ppm": total_reduction,
+        "reduction_pct": reduction_pct,
         "estimated_cost_inr": cost,
-        "efficiency_score": round(efficiency, 2),
-        "rl_reward": round(final_reward, 4)
+        "efficiency_score": efficiency,
+        "rl_reward": reward * urgency_multiplier,
     }
 
 
+def _as_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _evaluation_row(evaluation, z, t):
+    """Format one zone × strategy cell of the evaluation matrix (arrays or nested lists)."""
+    return {
+        "new_co2_ppm": round(float(evaluation["new_co2_ppm"][z][t]), 1),
+        "reduction_ppm": round(float(evaluation["reduction_ppm"][z][t]), 2),
+        "reduction_pct": round(float(evaluation["reduction_pct"][z][t]), 2),
+        "estimated_cost_inr": _as_number(evaluation["estimated_cost_inr"][z][t]),
+        "efficiency_score": round(float(evaluation["efficiency_score"][z][t]), 2),
+        "rl_reward": round(float(evaluation["rl_reward"][z][t]), 4),
+    }
+
+
+def _evaluate_compiled(zone_contexts, compiled):
+    return _evaluate_matrix(
+        _context_arrays(zone_contexts), compiled["quantities"], compiled["costs"],
+        compiled["alignment_codes"], compiled["repeat_keys"],
+    )
+
+
+def _evaluate_strategy(zone_context, strategy_name, actions):
+    """Evaluate a single strategy for a single zone (1 × 1 slice of the evaluation matrix)."""
+    compiled = _compile_strategies([{"name": strategy_name, "actions": actions}])
+    return _evaluation_row(_evaluate_compiled([zone_context], compiled), 0, 0)
+
+
 STRATEGY_TEMPLATES = [
     {
         "name": "Green Revolution",
@@ -207,42 +315,162 @@ LIGHT_STRATEGY_TEMPLATES = [
 ]
 
 
+_COMPILED_TEMPLATES = _compile_strategies(STRATEGY_TEMPLATES)
+_COMPILED_BUDGET_TEMPLATES = _compile_strategies(STRATEGY_TEMPLATES + LIGHT_STRATEGY_TEMPLATES)
+
+
+def _evaluate_templates(zone_contexts, include_light=False):
+    """Evaluate all strategy templates for all zones; returns one unsorted list per zone."""
+    templates = STRATEGY_TEMPLATES + LIGHT_STRATEGY_TEMPLATES if include_light else STRATEGY_TEMPLATES
+    compiled = _COMPILED_BUDGET_TEMPLATES if include_light else _COMPILED_TEMPLATES
+    evaluation = {k: v.tolist() for k, v in _evaluate_compiled(zone_contexts, compiled).items()}
+    return [
+        [
+            {
+                "strategy_name": s["name"],
+                "description": s.get("description", "Scaled intervention"),
+                "actions": s["actions"],
+                **_evaluation_row(evaluation, z, t),
+            }
+            for t, s in enumerate(templates)
+        ]
+        for z in range(len(zone_contexts))
+    ]
+
+
+def _get_all_strategies_for_zones(zones, include_light=True):
+    """Get all strategies (including light variants) for many zones in one matrix pass."""
+    per_zone = _evaluate_templates([_get_zone_context(z) for z in zones], include_light=include_light)
+    return [sorted(strats, key=lambda x: x.get("rl_reward", 0), reverse=True) for strats in per_zone]
+
+
 def _get_all_strategies_for_budget(zone, include_light=True):
     """Get all strategies including light variants for budget-constrained allocation."""
-    all_strats = []
-    zone_context = _get_zone_context(zone)
-    for s in STRATEGY_TEMPLATES:
-        ev = _evaluate_strategy(zone_context, s["name"], s["actions"])
-        all_strats.append({"strategy_name": s["name"], "description": s["description"], "actions": s["actions"], **ev})
-    if include_light:
-        for s in LIGHT_STRATEGY_TEMPLATES:
-            ev = _evaluate_strategy(zone_context, s["name"], s["actions"])
-            all_strats.append({"strategy_name": s["name"], "description": "Scaled intervention", "actions": s["actions"], **ev})
-    return sorted(all_strats, key=lambda x: x.get("rl_reward", 0), reverse=True)
-
-
-def optimize(zone_id: str = None, state: str = None):
-    """Run RL-style optimization to find best strategy for each zone."""
-    zones = get_all_zones(state=state)
-    if zone_id:
-        zones = [z for z in zones if z["id"] == zone_id]
+    return _get_all_strategies_for_zones([zone], include_light=include_light)[0]
 
-    results = []
-    for zone in zones:
-        strategy_results = []
-        zone_context = _get_zone_context(zone)
-        for strategy in STRATEGY_TEMPLATES:
-            evaluation = _evaluate_strategy(zone_context, strategy["name"], strategy["actions"])
-            strategy_results.append({
-                "strategy_name": strategy["name"],
-                "description": strategy["description"],
-                "actions": strategy["actions"],
-                **evaluation,
-            })
 
-        # Sort by rl_reward metric
-        strategy_results.sort(key=lambda x: x.get("rl_reward", 0), reverse=True)
+# ═══════════════════════════════════════════════════════════════════════════
+#  TRAINED POLICY (see modules/rl_training.py)
+# ═══════════════════════════════════════════════════════════════════════════
+
+POLICY_PATH = os.environ.get("URBANECOTWIN_RL_POLICY") or var_path("rl_policy.npz")
+
+# State discretization: the context masks used by the evaluator, AQI urgency /
+# alignment bands, CO₂ alignment / penalty bands and the repetition hash
+AQI_BANDS = [120, 170, 200]
+CO2_BANDS = [460, 480]
+N_POLICY_STATES = 8 * (len(AQI_BANDS) + 1) * (len(CO2_BANDS) + 1) * 5
+
+_policy_cache = {"mtime": None, "policy": None}
+
+
+def _encode_states(ctx):
+    """Map context arrays to tabular policy state indices (Z,)."""
+    flags = (
+        (ctx["industrial_index"] > 0.6).astype(int)
+        + (ctx["green_cover_index"] < 0.4).astype(int) * 2
+        + (ctx["traffic_density"] > 0.7).astype(int) * 4
+    )
+    aqi_band = np.digitize(ctx["aqi_current"], AQI_BANDS, right=True)
+    co2_band = np.digitize(ctx["co2_current"], CO2_BANDS, right=True)
+    return ((flags * (len(AQI_BANDS) + 1) + aqi_band) * (len(CO2_BANDS) + 1) + co2_band) * 5 + ctx["history_hash"]
+
+
+def load_policy():
+    """Trained Q-table artifact (reloaded when the file changes), or None if not trained."""
+    try:
+        mtime = os.path.getmtime(POLICY_PATH)
+    except OSError:
+        return None
+    if _policy_cache["mtime"] != mtime:
+        policy = None
+        try:
+            with np.load(POLICY_PATH, allow_pickle=False) as data:
+                policy = {k: data[k] for k in data.files}
+            names = [str(n) for n in policy["template_names"]]
+            if names != [s["name"] for s in STRATEGY_TEMPLATES] or policy["q_table"].shape[0] != N_POLICY_STATES:
+                logger.warning("RL policy at %s does not match the current templates — ignoring it", POLICY_PATH)
+                policy = None
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Could not load RL policy from {POLICY_PATH}: {e}")
+            policy = None
+        _policy_cache.update(mtime=mtime, policy=policy)
+    return _policy_cache["policy"]
+
+
+def _policy_actions(policy, zone_contexts):
+    """One batched forward pass: greedy template index and training visits per zone."""
+    states = _encode_states(_context_arrays(zone_contexts))
+    q_values = policy["q_table"][states]
+    visits = policy["visits"][states].sum(axis=1)
+    return q_values.argmax(axis=1), visits
+
+
+# One evaluation of every template (incl. light variants) per zone set and snapshot,
+# shared by the unconstrained and the budget-constrained results
+_pipeline_cache = SnapshotCache(maxsize=16)
+
+
+def _evaluation_pipeline(zones):
+    """Zone contexts + all-strategy evaluations (sorted by reward), computed once per snapshot."""
+    key = tuple(z["id"] for z in zones)
+    version = get_snapshot_version()
+    hit, bundle = _pipeline_cache.get(key, version)
+    if hit:
+        return bundle
+
+    bundle = {"zones": zones, "contexts": [_get_zone_context(z) for z in zones]}
+    bundle["strategies"] = [
+        sorted(strats, key=lambda x: x.get("rl_reward", 0), reverse=True)
+        for strats in _evaluate_templates(bundle["contexts"], include_light=True)
+    ]
+    _pipeline_cache.put(key, version, bundle)
+    return bundle
+
+
+_TEMPLATE_NAMES = {s["name"] for s in STRATEGY_TEMPLATES}
+
+
+def optimize(zone_id: str = None, state: str = None, budget_inr: float = None, objective: str = "reduction",
+             mode: str = "templates", time_limit_s: float = None, zones=None):
+    """
+    Run RL-style optimization to find best strategy for each zone.
+    With budget_inr, the budget-constrained allocation is added from the same evaluation pass.
+    mode="search" also evolves a zone-tailored strategy (modules/strategy_search.py)
+    within time_limit_s; the best strategy is then the top rl_reward of it and the templates.
+    """
+    zones = zones if zones is not None else get_all_zones(state=state)
+    bundle = _evaluation_pipeline(zones)
+
+    search = None
+    if mode == "search":
+        from modules.strategy_search import search_strategies, DEFAULT_TIME_LIMIT_S
+        selected = [c for c in bundle["contexts"] if not zone_id or c["id"] == zone_id]
+        search = search_strategies(selected, time_limit_s=time_limit_s or DEFAULT_TIME_LIMIT_S)
+        tailored = {c["id"]: s for c, s in zip(selected, search["strategies"])}
+
+    policy = load_policy()
+    if policy is not None and bundle["contexts"]:
+        policy_choice, policy_visits = _policy_actions(policy, bundle["contexts"])
+        convergence = round(float(policy["convergence_score"]), 3)
+
+    results = []
+    for z, (zone, zone_context, strategies) in enumerate(zip(bundle["zones"], bundle["contexts"], bundle["strategies"])):
+        if zone_id and zone["id"] != zone_id:
+            continue
+        # Full-scale templates only, already sorted by rl_reward
+        strategy_results = [s for s in strategies if s["strategy_name"] in _TEMPLATE_NAMES]
         best = strategy_results[0]
+        rl_iterations, convergence_score = 0, None
+        if policy is not None and policy_visits[z] > 0:
+            chosen = STRATEGY_TEMPLATES[policy_choice[z]]["name"]
+            best = next(s for s in strategy_results if s["strategy_name"] == chosen)
+            rl_iterations, convergence_score = int(policy_visits[z]), convergence
+        if search is not None:
+            # Repair and family re-alignment can leave the tailored strategy below the best template
+            strategy_results = sorted([tailored[zone["id"]]] + strategy_results,
+                                      key=lambda x: x.get("rl_reward", 0), reverse=True)
+            best = strategy_results[0]
 
         results.append({
             "zone_id": zone["id"],
@@ -250,17 +478,28 @@ def optimize(zone_id: str = None, state: str = None):
             "current_co2_ppm": zone["current_co2_ppm"],
             "best_strategy": best,
             "all_strategies": strategy_results,
-            "rl_iterations": random.randint(3000, 5200),
-            "convergence_score": round(random.uniform(0.91, 0.98), 3),
+            "rl_iterations": rl_iterations,
+            "convergence_score": convergence_score,
             "zone_context": zone_context
         })
 
-    return {
+    output = {
         "optimization_results": results,
-        "algorithm": "Context-Aware DQN Multi-Objective Policy",
-        "training_episodes": 10000,
+        "algorithm": "Context-Aware Tabular Q-Learning Policy" if policy is not None else "Context-Aware Multi-Objective Reward Ranking (no trained policy)",
+        "training_episodes": int(policy["episodes"]) if policy is not None else 0,
+        "policy": {
+            "trained": policy is not None,
+            "trained_at": str(policy["trained_at"]) if policy is not None else None,
+            "q_updates": int(policy["updates"]) if policy is not None else 0,
+            "convergence_score": float(policy["convergence_score"]) if policy is not None else None,
+        },
         "timestamp": __import__("datetime").datetime.now().isoformat(),
     }
+    if search is not None:
+        output["search"] = search["stats"]
+    if budget_inr and budget_inr > 0:
+        output["budget_constrained"] = _allocate_budget(bundle, budget_inr, objective)
+    return output
 
 
 def _compute_need_score(co2_ppm: float, aqi: float) -> float:
@@ -275,31 +514,33 @@ def _is_low_need(co2_ppm: float, aqi: float) -> bool:
     return co2_ppm < 400 and aqi < 80
 
 
-def optimize_with_budget(budget_inr: float, state: str = None):
+ALLOCATION_OBJECTIVES = {"reduction": "reduction_ppm", "reward": "rl_reward"}
+
+
+def optimize_with_budget(budget_inr: float, state: str = None, objective: str = "reduction"):
     """
     Need-based budget allocation:
     - Low-need zones (CO2 < 400, AQI < 80): "Not Required"
-    - High-need zones: allocate budget proportionally to need; higher need = larger share
-    - Pick best strategy that fits within each zone's allocated share
+    - High-need zones: solve a multiple-choice knapsack over every zone's
+      candidate strategies so the global budget maximizes total CO₂ reduction
+      (objective="reduction") or total RL reward (objective="reward")
     """
-    results = optimize(state=state)
-    zones = get_all_zones(state=state)
-    zone_lookup = {z["id"]: z for z in zones}
+    return _allocate_budget(_evaluation_pipeline(get_all_zones(state=state)), budget_inr, objective)
 
-    zone_results = results.get("optimization_results", [])
+
+def _split_by_need(bundle):
+    """Zones needing investment (highest need first) and zones where it is not required."""
     needing = []
     not_required = []
 
-    for r in zone_results:
-        zid = r["zone_id"]
-        z = zone_lookup.get(zid, {})
-        co2 = float(z.get("current_co2_ppm", r.get("current_co2_ppm", 0)))
-        aqi = float(z.get("current_aqi") or 0)
+    for zone, strategies in zip(bundle["zones"], bundle["strategies"]):
+        co2 = float(zone.get("current_co2_ppm", 0))
+        aqi = float(zone.get("current_aqi") or 0)
 
         if _is_low_need(co2, aqi):
             not_required.append({
-                "zone_id": zid,
-                "zone_name": r["zone_name"],
+                "zone_id": zone["id"],
+                "zone_name": zone["name"],
                 "current_co2_ppm": co2,
                 "current_aqi": aqi,
                 "budget_used": 0,
@@ -310,34 +551,46 @@ def optimize_with_budget(budget_inr: float, state: str = None):
         else:
             need_score = _compute_need_score(co2, aqi)
             needing.append({
-                **r,
+                "zone_id": zone["id"],
+                "zone_name": zone["name"],
+                "current_co2_ppm": zone["current_co2_ppm"],
                 "current_aqi": aqi,
                 "need_score": round(need_score, 1),
+                "strategies": strategies,
             })
 
-    total_need = sum(n["need_score"] for n in needing)
-    if total_need <= 0:
-        total_need = 1
-    remaining = budget_inr
+    # Sort by need (highest first) for priority
+    needing = sorted(needing, key=lambda x: x["need_score"], reverse=True)
+    return needing, not_required
+
+
+def _option_matrices(strategies_by_zone, value_key):
+    """(zones, options) cost and value matrices; ragged rows padded with inf cost."""
+    option_count = max((len(s) for s in strategies_by_zone), default=0)
+    costs = np.full((len(strategies_by_zone), option_count), np.inf)
+    values = np.zeros((len(strategies_by_zone), option_count))
+    for g, strats in enumerate(strategies_by_zone):
+        costs[g, :len(strats)] = [s.get("estimated_cost_inr", 0) for s in strats]
+        values[g, :len(strats)] = [s.get(value_key, 0) for s in strats]
+    return costs, values
+
+
+def _allocate_budget(bundle, budget_inr, objective):
+    """Budget-constrained allocation over an evaluation pipeline bundle."""
+    value_key = ALLOCATION_OBJECTIVES.get(objective, "reduction_ppm")
+    needing, not_required = _split_by_need(bundle)
     constrained = []
     total_reduction = 0
     total_spent = 0
 
-    # Sort by need (highest first) for priority
-    needing = sorted(needing, key=lambda x: x["need_score"], reverse=True)
+    strategies_by_zone = [r["strategies"] for r in needing]
+    allocation = allocate_budget(*_option_matrices(strategies_by_zone, value_key), budget_inr)
 
-    zone_by_id = {z["id"]: z for z in zones}
-    for r in needing:
+    for r, all_strats, choice in zip(needing, strategies_by_zone, allocation["choice"]):
         need_score = r["need_score"]
-        share = (need_score / total_need) * budget_inr
-        cap = min(share, remaining)
-        zone_data = zone_by_id.get(r["zone_id"], {"current_co2_ppm": r["current_co2_ppm"], "current_aqi": r.get("current_aqi") or 0})
-        all_strats = _get_all_strategies_for_budget(zone_data)
-        strategies = [s for s in all_strats if s.get("estimated_cost_inr", 0) <= cap]
-        if strategies:
-            best = max(strategies, key=lambda s: s.get("efficiency_score", 0))
+        if choice >= 0:
+            best = all_strats[int(choice)]
             cost = best.get("estimated_cost_inr", 0)
-            remaining -= cost
             total_spent += cost
             total_reduction += best.get("reduction_ppm", 0)
             constrained.append({
@@ -362,7 +615,7 @@ def optimize_with_budget(budget_inr: float, state: str = None):
                 "need_score": need_score,
                 "budget_used": 0,
                 "best_strategy": None,
-                "note": f"Requires ₹{cost_need/10000000:.1f} Cr (allocated ₹{cap/10000000:.1f} Cr) — budget insufficient",
+                "note": f"Requires ₹{cost_need/10000000:.1f} Cr — budget allocated to higher-impact zones",
                 "need_level": "high" if need_score > 30 else "moderate",
             })
 
@@ -378,5 +631,85 @@ def optimize_with_budget(budget_inr: float, state: str = None):
         "zones_not_required": zones_not_required,
         "zones_underfunded": len([c for c in constrained if not c.get("best_strategy")]),
         "total_co2_reduction_ppm": round(total_reduction, 2),
+        "allocation": {
+            "method": allocation["method"],
+            "exact": allocation["exact"],
+            "objective": objective if objective in ALLOCATION_OBJECTIVES else "reduction",
+            "objective_value": round(allocation["total_value"], 4),
+            "upper_bound": round(allocation["upper_bound"], 4),
+            "optimality_gap": allocation["optimality_gap"],
+        },
         "results": all_results,
     }
+
+
+def budget_sweep(budgets=None, points: int = 20, state: str = None, objective: str = "reduction"):
+    """
+    Reduction-vs-budget curve and marginal abatement cost (MAC) curve in one pass.
+
+    Every high-need zone's strategies are reduced to their efficient (convex
+    hull) upgrades; walking all upgrades by marginal efficiency gives the
+    allocation for every budget at once. Without explicit budgets, `points`
+    budgets are spread up to the cost of funding every efficient upgrade.
+    """
+    value_key = ALLOCATION_OBJECTIVES.get(objective, "reduction_ppm")
+    bundle = _evaluation_pipeline(get_all_zones(state=state))
+    needing, not_required = _split_by_need(bundle)
+    strategies_by_zone = [r["strategies"] for r in needing]
+    costs, values = _option_matrices(strategies_by_zone, value_key)
+
+    full = budget_curve(costs, values, [])
+    saturation = float(full["cumulative_cost"][-1]) if len(full["cumulative_cost"]) else 0.0
+    if budgets is None:
+        budgets = np.linspace(0, saturation, max(int(points), 2))[1:]
+    sweep = budget_curve(costs, values, sorted(float(b) for b in budgets))
+    increments = sweep["increments"]
+
+    samples = []
+    for i, budget in enumerate(sweep["budgets"]):
+        choice = choice_at(increments, sweep["increments_taken"][i], len(needing))
+        funded = np.nonzero(choice >= 0)[0]
+        samples.append({
+            "budget_inr": _as_number(budget),
+            "total_spent_inr": _as_number(sweep["total_cost"][i]),
+            "total_co2_reduction_ppm": round(float(sum(strategies_by_zone[g][choice[g]]["reduction_ppm"] for g in funded)), 2),
+            "objective_value": round(float(sweep["total_value"][i]), 4),
+            "upper_bound": round(float(sweep["upper_bound"][i]), 4),
+            "optimality_gap": round(float(sweep["optimality_gap"][i]), 6),
+            "zones_funded": int(sweep["groups_funded"][i]),
+        })
+
+    # MAC curve: each efficient upgrade, cheapest abatement first
+    mac_curve = []
+    cumulative_ppm = 0.0
+    for i, g in enumerate(increments["group"]):
+        strats = strategies_by_zone[g]
+        k0, k1 = increments["from_option"][i], increments["to_option"][i]
+        before = strats[k0] if k0 >= 0 else None
+        after = strats[k1]
+        abatement_ppm = after["reduction_ppm"] - (before["reduction_ppm"] if before else 0.0)
+        cumulative_ppm += abatement_ppm
+        abatement_tonnes = abatement_ppm * CO2_PPM_TO_TONNES_FACTOR
+        mac_curve.append({
+            "zone_id": needing[g]["zone_id"],
+            "zone_name": needing[g]["zone_name"],
+            "from_strategy": before["strategy_name"] if before else None,
+            "to_strategy": after["strategy_name"],
+            "incremental_cost_inr": _as_number(increments["delta_cost"][i]),
+            "abatement_ppm": round(abatement_ppm, 2),
+            "abatement_tonnes": round(abatement_tonnes, 2),
+            "mac_inr_per_tonne": round(increments["delta_cost"][i] / abatement_tonnes, 2) if abatement_tonnes > 0 else None,
+            "cumulative_cost_inr": _as_number(sweep["cumulative_cost"][i]),
+            "cumulative_abatement_ppm": round(cumulative_ppm, 2),
+        })
+
+    return {
+        "objective": objective if objective in ALLOCATION_OBJECTIVES else "reduction",
+        "method": "convex-hull marginal efficiency sweep",
+        "zones_considered": len(needing),
+        "zones_not_required": len(not_required),
+        "saturation_budget_inr": _as_number(saturation),
+        "curve": samples,
+        "mac_curve": mac_curve,
+        "timestamp": __import__("datetime").datetime.now().isoformat(),
+    }
@@ -0,0 +1,234 @@
+"""
+MODULE 5c: RL Policy Training
+Offline Q-learning for the strategy optimizer.
+
+Environment: one zone's multi-phase planning episode.
+  - State:      tabular encoding of the zone context (rl_optimizer._encode_states)
+  - Action:     one of STRATEGY_TEMPLATES
+  - Reward:     rl_reward from the vectorized strategy evaluator
+  - Transition: CO₂ / AQI reduced by the realized share of the strategy's
+                simulated reduction for that phase
+Agent: NumPy Q-table with ε-greedy exploration over a batch of parallel
+environments (synthetic zones). Shards are trained in a process pool and
+merged by visit-weighted averaging.
+
+The policy is written to rl_optimizer.POLICY_PATH; optimize() then does one
+batched argmax over the table per request.
+
+Usage:  python -m modules.rl_training --episodes 200000 --workers 4
+"""
+
+import os
+import math
+import argparse
+import logging
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from modules.rl_optimizer import (
+    STRATEGY_TEMPLATES, POLICY_PATH, N_POLICY_STATES,
+    _compile_strategies, _encode_states, _evaluate_matrix,
+)
+
+logger = logging.getLogger(__name__)
+
+EPISODE_STEPS = 4           # planning phases per episode
+PHASE_REALIZATION = 0.25    # share of a strategy's full reduction realized per phase
+GAMMA = 0.9
+EPSILON_START = 1.0
+EPSILON_END = 0.05
+MIN_ALPHA = 0.02
+DEFAULT_BUDGET = 2500000000
+EVAL_ZONES = 5000
+
+_COMPILED = _compile_strategies(STRATEGY_TEMPLATES)
+N_ACTIONS = len(STRATEGY_TEMPLATES)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  ENVIRONMENT
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _sample_contexts(rng, n):
+    """Synthetic zone contexts covering the live CO₂ / AQI range."""
+    return {
+        "co2_current": rng.uniform(380, 520, n),
+        "aqi_current": rng.uniform(20, 300, n),
+        "industrial_index": rng.integers(0, 100, n) / 100.0,
+        "green_cover_index": rng.integers(0, 100, n) / 100.0,
+        "traffic_density": rng.integers(0, 100, n) / 100.0,
+        "budget_remaining": np.full(n, float(DEFAULT_BUDGET)),
+        "history_hash": rng.integers(0, 5, n),
+    }
+
+
+def _evaluate(ctx):
+    return _evaluate_matrix(ctx, _COMPILED["quantities"], _COMPILED["costs"],
+                            _COMPILED["alignment_codes"], _COMPILED["repeat_keys"])
+
+
+def _step(ctx, actions):
+    """Apply one strategy per environment; returns (reward, next context)."""
+    evaluation = _evaluate(ctx)
+    rows = np.arange(len(actions))
+    reward = evaluation["rl_reward"][rows, actions]
+    reduction_ppm = evaluation["reduction_ppm"][rows, actions]
+    reduction_pct = evaluation["reduction_pct"][rows, actions]
+
+    next_ctx = dict(ctx)
+    next_ctx["co2_current"] = np.maximum(ctx["co2_current"] - reduction_ppm * PHASE_REALIZATION, 280.0)
+    aqi_drop = np.clip(0.8 * reduction_pct / 100 * PHASE_REALIZATION, 0.0, 0.9)
+    next_ctx["aqi_current"] = ctx["aqi_current"] * (1 - aqi_drop)
+    return reward, next_ctx
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  Q-LEARNING
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _train_shard(seed, episodes, n_envs, progress=None, should_stop=None):
+    """Train one Q-table on its own stream of synthetic zones."""
+    rng = np.random.default_rng(seed)
+    q_table = np.zeros((N_POLICY_STATES, N_ACTIONS))
+    visits = np.zeros((N_POLICY_STATES, N_ACTIONS))
+    batches = max(1, math.ceil(episodes / n_envs))
+    checkpoint = None
+    td_errors = []
+
+    for b in range(batches):
+        if should_stop is not None and should_stop():
+            break
+        if progress is not None:
+            progress(b / batches, f"batch {b}/{batches}")
+        epsilon = EPSILON_END + (EPSILON_START - EPSILON_END) * max(0.0, 1 - b / (0.7 * batches))
+        ctx = _sample_contexts(rng, n_envs)
+        for step in range(EPISODE_STEPS):
+            states = _encode_states(ctx)
+            explore = rng.random(n_envs) < epsilon
+            actions = np.where(explore, rng.integers(0, N_ACTIONS, n_envs), q_table[states].argmax(axis=1))
+            reward, next_ctx = _step(ctx, actions)
+
+            target = reward
+            if step < EPISODE_STEPS - 1:
+                target = reward + GAMMA * q_table[_encode_states(next_ctx)].max(axis=1)
+            td = target - q_table[states, actions]
+
+            # Batched tabular update: average TD error per (state, action) in this batch
+            flat = states * N_ACTIONS + actions
+            td_sum = np.bincount(flat, weights=td, minlength=q_table.size).reshape(q_table.shape)
+            counts = np.bincount(flat, minlength=q_table.size).reshape(q_table.shape)
+            visits += counts
+            alpha = np.maximum(MIN_ALPHA, 1 / np.sqrt(np.maximum(visits, 1)))
+            q_table += np.where(counts > 0, alpha * td_sum / np.maximum(counts, 1), 0.0)
+
+            td_errors.append(float(np.abs(td).mean()))
+            ctx = next_ctx
+
+        if b == int(batches * 0.9):
+            checkpoint = q_table.argmax(axis=1)
+
+    return q_table, visits, checkpoint, td_errors
+
+
+def _merge(shards):
+    """Visit-weighted average of the shard Q-tables."""
+    visits = sum(s[1] for s in shards)
+    weighted = sum(s[0] * s[1] for s in shards)
+    q_table = np.where(visits > 0, weighted / np.maximum(visits, 1), 0.0)
+    return q_table, visits
+
+
+def _convergence_score(q_table, visits, shards):
+    """Share of visited states whose greedy action held over the last 10% of training."""
+    visited = visits.sum(axis=1) > 0
+    if not visited.any():
+        return 0.0
+    final = q_table.argmax(axis=1)
+    stable = [np.mean(s[2][visited] == final[visited]) for s in shards if s[2] is not None]
+    return float(np.mean(stable)) if stable else 0.0
+
+
+def _evaluate_policy(q_table, seed):
+    """Mean one-step reward of the greedy policy vs. the best template, on held-out zones."""
+    ctx = _sample_contexts(np.random.default_rng(seed + 10_000), EVAL_ZONES)
+    rewards = _evaluate(ctx)["rl_reward"]
+    chosen = q_table[_encode_states(ctx)].argmax(axis=1)
+    return float(rewards[np.arange(EVAL_ZONES), chosen].mean()), float(rewards.max(axis=1).mean())
+
+
+def train_policy(episodes=200_000, n_envs=1024, workers=None, seed=0, path=None,
+                 progress=None, should_stop=None):
+    """
+    Train the tabular policy across a process pool and save it to disk.
+    Returns the training summary stored alongside the Q-table; nothing is
+    saved when should_stop() interrupts training.
+    """
+    workers = workers or min(4, os.cpu_count() or 1)
+    per_shard = math.ceil(episodes / workers)
+    seeds = [seed + i for i in range(workers)]
+
+    if workers > 1:
+        shards = [None] * workers
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+            # should_stop is relayed to the workers through a shared event, checked between batches
+            stop = manager.Event()
+            futures = {pool.submit(_train_shard, s, per_shard, n_envs, None, stop.is_set): i
+                       for i, s in enumerate(seeds)}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shards[futures[future]] = future.result()
+                if done and progress is not None:
+                    finished = workers - len(pending)
+                    progress(finished / workers, f"{finished}/{workers} shards")
+                if should_stop is not None and not stop.is_set() and should_stop():
+                    stop.set()
+    else:
+        shards = [_train_shard(seeds[0], per_shard, n_envs, progress, should_stop)]
+    if should_stop is not None and should_stop():
+        return {"episodes": 0, "cancelled": True}
+
+    q_table, visits = _merge(shards)
+    policy_reward, oracle_reward = _evaluate_policy(q_table, seed)
+    summary = {
+        "episodes": per_shard * workers,
+        "updates": int(visits.sum()),
+        "convergence_score": round(_convergence_score(q_table, visits, shards), 4),
+        "final_td_error": round(float(np.mean([s[3][-1] for s in shards])), 4),
+        "eval_policy_reward": round(policy_reward, 4),
+        "eval_oracle_reward": round(oracle_reward, 4),
+        "trained_at": datetime.now().isoformat(),
+    }
+
+    path = path or POLICY_PATH
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        q_table=q_table,
+        visits=visits,
+        template_names=np.array([s["name"] for s in STRATEGY_TEMPLATES]),
+        **{k: np.array(v) for k, v in summary.items()},
+    )
+    os.replace(tmp_path, path)
+    logger.info(f"RL policy saved to {path}: {summary}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the RL strategy policy")
+    parser.add_argument("--episodes", type=int, default=200_000)
+    parser.add_argument("--envs", type=int, default=1024, help="parallel environments per shard")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(train_policy(args.episodes, args.envs, args.workers, args.seed, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,11 @@ Models:
   - Confidence Estimator: uncertainty quantification per prediction
 """
 
+import copy
 import math
 import numpy as np
-from data.city_data import get_zone
+from data.city_data import get_zone, get_cached_zone_version
+from data.snapshot import LRUCache
 
 # ═══════════════════════════════════════════════════════════════════════════
 #  ACTION DEFINITIONS
@@ -24,6 +26,7 @@ ACTION_IMPACTS = {
         "unit": "trees",
         "description": "Each tree absorbs ~22kg CO₂/year",
         "env_factors": {"humidity_boost": 0.3, "temp_penalty": -0.15, "aqi_boost": 0.1},
+        "ramp": {"profile": "logistic", "tau_months": 24.0, "decay_per_year": 0.0},
     },
     "add_solar_panels": {
         "label": "Add Solar Panels",
@@ -31,6 +34,7 @@ ACTION_IMPACTS = {
         "unit": "panels",
         "description": "Each solar panel offsets ~150kg CO₂/year",
         "env_factors": {"temp_boost": 0.2, "humidity_penalty": -0.1, "aqi_neutral": 0.0},
+        "ramp": {"profile": "linear", "tau_months": 3.0, "decay_per_year": 0.005},
     },
     "increase_traffic": {
         "label": "Increase Traffic",
@@ -38,6 +42,7 @@ ACTION_IMPACTS = {
         "unit": "vehicles",
         "description": "Each additional vehicle adds ~5kg CO₂/day",
         "env_factors": {"temp_penalty": -0.2, "humidity_penalty": -0.05, "aqi_penalty": -0.15},
+        "ramp": {"profile": "linear", "tau_months": 1.0, "decay_per_year": 0.0},
     },
     "add_factory": {
         "label": "Add Factory",
@@ -45,6 +50,7 @@ ACTION_IMPACTS = {
         "unit": "factories",
         "description": "Each factory emits ~2500kg CO₂/day",
         "env_factors": {"temp_penalty": -0.1, "humidity_penalty": -0.05, "aqi_penalty": -0.3},
+        "ramp": {"profile": "linear", "tau_months": 9.0, "decay_per_year": 0.0},
     },
     "ev_transition": {
         "label": "EV Transition",
@@ -52,6 +58,7 @@ ACTION_IMPACTS = {
         "unit": "vehicles",
         "description": "Each EV conversion saves ~8kg CO₂/day",
         "env_factors": {"temp_neutral": 0.0, "aqi_boost": 0.12, "co_boost": 0.15},
+        "ramp": {"profile": "exponential", "tau_months": 6.0, "decay_per_year": 0.0},
     },
     "green_cover": {
         "label": "Increase Green Cover",
@@ -59,6 +66,7 @@ ACTION_IMPACTS = {
         "unit": "percent",
         "description": "Each 1% green cover increase absorbs ~500kg CO₂/year",
         "env_factors": {"humidity_boost": 0.25, "temp_penalty": -0.1, "pm_boost": 0.08},
+        "ramp": {"profile": "exponential", "tau_months": 12.0, "decay_per_year": 0.0},
     },
 }
 
@@ -150,47 +158,170 @@ def _compute_confidence(zone, action_key, quantity):
     return round(max(40, min(98, base_confidence)), 1)
 
 
-def _predict_timeline(base_co2, reduction, months=12):
+# ═══════════════════════════════════════════════════════════════════════════
+#  IMPLEMENTATION TIMELINE KERNEL
+# ═══════════════════════════════════════════════════════════════════════════
+
+MAX_HORIZON_MONTHS = 360  # 30-year planning horizon
+RAMP_PROFILES = ("exponential", "linear", "logistic")
+ACTION_KEYS = list(ACTION_IMPACTS.keys())
+
+# Per-action ramp parameters as arrays aligned with ACTION_KEYS
+_RAMP_PROFILE = np.array([RAMP_PROFILES.index(ACTION_IMPACTS[k]["ramp"]["profile"]) for k in ACTION_KEYS])
+_RAMP_TAU = np.array([ACTION_IMPACTS[k]["ramp"]["tau_months"] for k in ACTION_KEYS], dtype=np.float64)
+_RAMP_DECAY = np.array([ACTION_IMPACTS[k]["ramp"]["decay_per_year"] for k in ACTION_KEYS], dtype=np.float64)
+
+# Logistic ramp steepness; the curve is centred on tau and rescaled to start at 0
+_LOGISTIC_K = 4.0
+_LOGISTIC_F0 = 1 / (1 + math.exp(_LOGISTIC_K))
+
+
+def _ramp_matrix(start_months, months):
     """
-    Predict CO₂ reduction timeline using exponential decay model.
-    Actions don't take effect instantly — models gradual impact.
+    Realized fraction of each action's full impact at every month.
+
+    start_months: (S, A) month each action starts in each scenario
+    Returns (S, A, months + 1):
+      - exponential: 1 - e^(-t/τ)
+      - linear:      min(t/τ, 1)
+      - logistic:    S-curve centred on τ (e.g. trees maturing)
+    multiplied by (1 - decay)^(t/12) for assets that degrade over the years.
     """
-    timeline = []
-    for month in range(months + 1):
-        # Exponential approach: impact grows over time (1 - e^(-t/τ))
-        tau = 4.0  # time constant: ~63% impact by month 4
-        realized_pct = 1 - math.exp(-month / tau)
-        realized_reduction = reduction * realized_pct
-        monthly_co2 = round(max(base_co2 - realized_reduction, 280), 1)
-        timeline.append({
-            "month": month,
-            "co2_ppm": monthly_co2,
-            "realized_pct": round(realized_pct * 100, 1),
-        })
-    return timeline
+    t = np.arange(months + 1, dtype=np.float64)
+    elapsed = np.maximum(t - start_months[..., None], 0.0)
+    scaled = elapsed / _RAMP_TAU[:, None]
+
+    exponential = 1 - np.exp(-scaled)
+    linear = np.minimum(scaled, 1.0)
+    logistic = (1 / (1 + np.exp(-_LOGISTIC_K * (scaled - 1))) - _LOGISTIC_F0) / (1 - _LOGISTIC_F0)
+
+    profile = _RAMP_PROFILE[:, None]
+    ramp = np.select([profile == 0, profile == 1], [exponential, linear], logistic)
+    return ramp * (1 - _RAMP_DECAY[:, None]) ** (elapsed / 12)
+
+
+def project_timelines(base_co2, reductions, start_months=None, horizon_months=12):
+    """
+    Vectorized implementation timelines for zones × scenarios × months.
+
+    base_co2:      (Z,) current CO₂ per zone
+    reductions:    (Z, S, A) full-impact CO₂ reduction (ppm) per action, in ACTION_KEYS order
+    start_months:  (S, A) staggered start month per action (default: all start at month 0)
+    Returns compact float32 arrays of shape (Z, S, months + 1):
+      co2_ppm, realized_reduction_ppm, realized_pct
+    """
+    months = max(1, min(int(horizon_months), MAX_HORIZON_MONTHS))
+    base_co2 = np.asarray(base_co2, dtype=np.float64)
+    reductions = np.asarray(reductions, dtype=np.float64)
+    if start_months is None:
+        start_months = np.zeros(reductions.shape[1:], dtype=np.float64)
+    start_months = np.broadcast_to(np.asarray(start_months, dtype=np.float64), reductions.shape[1:])
+
+    ramp = _ramp_matrix(start_months, months)
+    realized = np.einsum("zsa,sam->zsm", reductions, ramp)
+    co2 = np.maximum(base_co2[:, None, None] - realized, 280.0)
+
+    total = reductions.sum(axis=2, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        realized_pct = np.where(total != 0, realized / total * 100, 0.0)
+
+    return {
+        "months": months,
+        "co2_ppm": co2.astype(np.float32),
+        "realized_reduction_ppm": realized.astype(np.float32),
+        "realized_pct": realized_pct.astype(np.float32),
+    }
+
+
+def _predict_timeline(base_co2, action_entries, months=12):
+    """
+    Single zone timeline for the API response. action_entries are
+    (action type, reduction, start month); each distinct (type, start) pair is
+    projected as its own scenario row and the rows are summed, so repeated
+    actions keep their own start months.
+    """
+    groups = {}
+    for key, reduction, start in action_entries:
+        groups[(key, start)] = groups.get((key, start), 0) + reduction
+    reductions = np.zeros((1, max(len(groups), 1), len(ACTION_KEYS)))
+    starts = np.zeros(reductions.shape[1:])
+    for row, ((key, start), reduction) in enumerate(groups.items()):
+        idx = ACTION_KEYS.index(key)
+        reductions[0, row, idx] = reduction
+        starts[row, idx] = start
+
+    projected = project_timelines([base_co2], reductions, starts, months)
+    realized = projected["realized_reduction_ppm"][0].sum(axis=0, dtype=np.float64)
+    total = reductions.sum()
+    co2 = np.maximum(base_co2 - realized, 280.0)
+    pct = realized / total * 100 if total != 0 else np.zeros_like(realized)
+    return [
+        {"month": month, "co2_ppm": round(float(co2[month]), 1), "realized_pct": round(float(pct[month]), 1)}
+        for month in range(projected["months"] + 1)
+    ]
 
 
 # ═══════════════════════════════════════════════════════════════════════════
 #  MAIN SIMULATION FUNCTION
 # ═══════════════════════════════════════════════════════════════════════════
 
-def simulate_scenario(zone_id: str, actions: list):
+# Results keyed by (zone_id, zone reading version, canonical actions, horizon): an entry
+# survives changes to other zones. Frontend presets make identical action packages very common.
+_simulation_cache = LRUCache(maxsize=512)
+
+
+def _canonical_actions(actions):
+    """Order-independent, hashable form of an action package."""
+    return tuple(sorted(
+        (a.get("action", ""), a.get("quantity", 0), a.get("start_month", 0)) for a in actions
+    ))
+
+
+def simulate_scenario(zone_id: str, actions: list, horizon_months: int = 12):
     """
     ML-enhanced scenario simulation using live zone conditions.
 
     1. Fetches live zone data (CO₂, AQI, temp, humidity, pollutants)
     2. For each action, computes environmental modifier via ridge regression
     3. Predicts adjusted CO₂ impact
-    4. Generates implementation timeline with exponential decay model
+    4. Generates implementation timeline from per-action ramp profiles
+       (optional "start_month" per action, horizon up to 30 years)
     5. Returns confidence scores per prediction
+
+    Results are served from an LRU cache while the zone's cached live
+    reading is fresh and unchanged; the live API is only hit when the
+    reading is stale. Callers get their own copy of a cached result.
     """
-    zone = get_zone(zone_id)
-    if not zone:
-        return {"error": f"Zone '{zone_id}' not found"}
+    zone, zone_version = get_cached_zone_version(zone_id)
+    if zone is None:
+        zone = get_zone(zone_id)
+        if not zone:
+            return {"error": f"Zone '{zone_id}' not found"}
+        zone_version = get_cached_zone_version(zone_id)[1]     # None if the live fetch failed
+
+    key = (zone_id, zone_version, _canonical_actions(actions), int(horizon_months))
+    if zone_version is not None:
+        hit, result = _simulation_cache.get(key)
+        if hit:
+            return copy.deepcopy(result)
+
+    result = _run_simulation(zone_id, zone, actions, horizon_months)
+    if zone_version is not None:
+        _simulation_cache.put(key, copy.deepcopy(result))
+    return result
+
+
+def get_simulation_cache_stats():
+    """Hit/miss metrics for the scenario result cache."""
+    return _simulation_cache.stats()
+
 
+def _run_simulation(zone_id, zone, actions, horizon_months):
+    """Compute the full simulation response for one zone."""
     base_co2 = zone["current_co2_ppm"]
     total_reduction = 0
     action_results = []
+    action_entries = []
 
     # Live environment summary for the response (only actual API data)
     env_conditions = {
@@ -220,6 +351,7 @@ def simulate_scenario(zone_id: str, actions: list):
         adjusted_rate = base_rate * env_modifier
         reduction = round(adjusted_rate * quantity, 2)
         total_reduction += reduction
+        action_entries.append((action_type, reduction, act.get("start_month", 0)))
 
         # Confidence estimation
         confidence = _compute_confidence(zone, action_type, quantity)
@@ -228,6 +360,7 @@ def simulate_scenario(zone_id: str, actions: list):
             "action": action_type,
             "label": impact_info["label"],
             "quantity": quantity,
+            "start_month": act.get("start_month", 0),
             "unit": impact_info["unit"],
             "base_rate": base_rate,
             "env_modifier": env_modifier,
@@ -242,7 +375,7 @@ def simulate_scenario(zone_id: str, actions: list):
     reduction_pct = round((total_reduction / base_co2) * 100, 2) if base_co2 > 0 else 0
 
     # Generate implementation timeline
-    timeline = _predict_timeline(base_co2, total_reduction)
+    timeline = _predict_timeline(base_co2, action_entries, horizon_months)
 
     return {
         "zone_id": zone_id,
@@ -256,8 +389,9 @@ def simulate_scenario(zone_id: str, actions: list):
         "available_actions": list(ACTION_IMPACTS.keys()),
         "env_conditions": env_conditions,
         "implementation_timeline": timeline,
+        "horizon_months": len(timeline) - 1,
         "model_info": {
-            "name": "Ridge Regression + Exponential Decay",
+            "name": "Ridge Regression + Per-Action Ramp Profiles",
             "features": ["temperature", "humidity", "wind_speed", "aqi", "pm2_5", "co2"],
             "data_source": zone.get("api_source", "Open-Meteo"),
             "live_adjusted": True,
@@ -0,0 +1,314 @@
+"""
+MODULE 5d: Evolutionary Strategy Search
+Zone-tailored strategies with continuous action quantities.
+
+The templates in the RL optimizer fix both the action mix and the
+quantities. This module searches the quantity space per zone with a
+genetic algorithm under a cost cap:
+  - Genome: one quantity per ACTION_TYPE, normalized to [0, 1] of its bound
+  - Fitness: rl_reward from the vectorized evaluator; a candidate is scored
+    with the policy alignment of the template family it most resembles
+  - Seeding + elitism: every template starts in the population and the best
+    candidate per zone always survives. Seeds are repaired to the zone's cost
+    cap and scored with the alignment of the family they most resemble, so
+    the tailored strategy can still score below an unmodified template
+  - Each generation of every zone is evaluated as one (Z, P, A) batch;
+    zone chunks run in a process pool
+  - Stops at the wall-clock limit, the generation limit, or when no zone
+    improved for `patience` generations
+  - Optional progress / should_stop callbacks (background jobs) are polled
+    between generations; with a process pool, should_stop is relayed to the
+    workers through a shared event
+"""
+
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from modules.rl_optimizer import (
+    ACTION_TYPES, ACTION_INDEX, STRATEGY_TEMPLATES, LIGHT_STRATEGY_TEMPLATES,
+    _as_number, _compile_strategies, _context_arrays, _evaluate_matrix, _evaluation_row,
+)
+from data.snapshot import SnapshotCache, get_snapshot_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POPULATION = 48
+DEFAULT_GENERATIONS = 60
+DEFAULT_TIME_LIMIT_S = 5.0
+DEFAULT_PATIENCE = 10
+IMPROVEMENT_TOL = 1e-4
+ELITES = 4
+MUTATION_RATE = 0.3
+DROP_RATE = 0.05            # chance of switching an action off entirely
+QUANTITY_HEADROOM = 1.5     # search bound = 1.5× the largest template quantity
+MIN_ZONES_PER_WORKER = 32
+SEARCH_WORKERS = int(os.environ.get("URBANECOTWIN_SEARCH_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  SEARCH SPACE
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _unit_costs():
+    costs = np.zeros(len(ACTION_TYPES))
+    for template in STRATEGY_TEMPLATES + LIGHT_STRATEGY_TEMPLATES:
+        for action in template["actions"]:
+            costs[ACTION_INDEX[action["type"]]] = action.get("cost_per_unit", 1000)
+    return costs
+
+
+UNIT_COSTS = _unit_costs()
+_SEEDS = _compile_strategies(STRATEGY_TEMPLATES + LIGHT_STRATEGY_TEMPLATES)["quantities"]
+QUANTITY_BOUNDS = np.ceil(_SEEDS.max(axis=0) * QUANTITY_HEADROOM)
+
+# Template families: cost-share direction, alignment code and repetition key
+_FAMILIES = _compile_strategies(STRATEGY_TEMPLATES)
+_FAMILY_SHARES = _FAMILIES["quantities"] * UNIT_COSTS
+_FAMILY_SHARES = _FAMILY_SHARES / np.linalg.norm(_FAMILY_SHARES, axis=1, keepdims=True)
+
+
+def _family(quantities):
+    """Index of the template whose cost mix is closest (cosine) to each candidate."""
+    shares = quantities * UNIT_COSTS
+    return np.einsum("...a,fa->...f", shares, _FAMILY_SHARES).argmax(axis=-1)
+
+
+def _repair(genes, cost_caps):
+    """Integer quantities scaled down to fit each zone's cost cap."""
+    quantities = genes * QUANTITY_BOUNDS
+    cost = quantities @ UNIT_COSTS
+    scale = np.minimum(1.0, cost_caps[:, None] / np.maximum(cost, 1.0))
+    return np.floor(quantities * scale[..., None])
+
+
+def _fitness(ctx, quantities):
+    family = _family(quantities)
+    evaluation = _evaluate_matrix(
+        ctx, quantities, quantities @ UNIT_COSTS,
+        _FAMILIES["alignment_codes"][family], _FAMILIES["repeat_keys"][family],
+    )
+    return evaluation["rl_reward"]
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  GENETIC ALGORITHM (one chunk of zones)
+# ═══════════════════════════════════════════════════════════════════════════
+
+def _search_chunk(ctx, cost_caps, population, generations, deadline, patience, seed,
+                  progress=None, should_stop=None):
+    """
+    Evolve one population per zone, all zones in lock-step.
+    Returns best quantities (Z, A), best fitness (Z,) and run statistics.
+    """
+    rng = np.random.default_rng(seed)
+    zones, actions = len(cost_caps), len(ACTION_TYPES)
+    rows = np.arange(zones)[:, None]
+
+    seeds = np.clip(_SEEDS / QUANTITY_BOUNDS, 0.0, 1.0)
+    random_genes = rng.random((zones, population - len(seeds), actions))
+    random_genes *= rng.random(random_genes.shape) < 0.7
+    genes = np.concatenate([np.broadcast_to(seeds, (zones,) + seeds.shape), random_genes], axis=1)
+
+    quantities = _repair(genes, cost_caps)
+    fitness = _fitness(ctx, quantities)
+    best_fitness = fitness.max(axis=1)
+    stale, generation, stop_reason = 0, 0, "max_generations"
+
+    while generation < generations:
+        if time.time() >= deadline:
+            stop_reason = "time_limit"
+            break
+        if should_stop is not None and should_stop():
+            stop_reason = "cancelled"
+            break
+        if progress is not None:
+            progress(generation / generations, f"generation {generation}/{generations}")
+        generation += 1
+        sigma = 0.25 * (1 - generation / (generations + 1)) + 0.02
+
+        # Elites survive unchanged; the rest come from tournament selection
+        order = np.argsort(-fitness, axis=1)
+        elites = order[:, :ELITES]
+        n_children = population - ELITES
+        a = rng.integers(0, population, (zones, n_children, 2))
+        b = rng.integers(0, population, (zones, n_children, 2))
+        parents = np.where(fitness[rows[..., None], a] >= fitness[rows[..., None], b], a, b)
+
+        # Blend crossover + Gaussian mutation + action drop-out, in gene space
+        p1 = genes[rows, parents[..., 0]]
+        p2 = genes[rows, parents[..., 1]]
+        w = rng.uniform(-0.25, 1.25, p1.shape)
+        children = p1 + w * (p2 - p1)
+        mutate = rng.random(children.shape) < MUTATION_RATE
+        children += mutate * rng.normal(0.0, sigma, children.shape)
+        children *= rng.random(children.shape) >= DROP_RATE
+        children = np.clip(children, 0.0, 1.0)
+
+        # Children are evaluated on their repaired quantities; store them back as genes
+        child_quantities = _repair(children, cost_caps)
+        genes = np.concatenate([genes[rows, elites], child_quantities / QUANTITY_BOUNDS], axis=1)
+        quantities = np.concatenate([quantities[rows, elites], child_quantities], axis=1)
+        fitness = np.concatenate([fitness[rows, elites], _fitness(ctx, child_quantities)], axis=1)
+
+        generation_best = fitness.max(axis=1)
+        improved = (generation_best - best_fitness).max() > IMPROVEMENT_TOL
+        best_fitness = np.maximum(best_fitness, generation_best)
+        stale = 0 if improved else stale + 1
+        if stale >= patience:
+            stop_reason = "converged"
+            break
+
+    best = fitness.argmax(axis=1)
+    return {
+        "quantities": quantities[np.arange(zones), best],
+        "fitness": fitness[np.arange(zones), best],
+        "generations": generation,
+        "evaluations": zones * (population + generation * (population - ELITES)),
+        "stop_reason": stop_reason,
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+#  PARALLEL DRIVER
+# ═══════════════════════════════════════════════════════════════════════════
+
+_pool = None
+_manager = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=SEARCH_WORKERS)
+            atexit.register(_pool.shutdown, wait=False)
+        return _pool
+
+
+def _stop_event():
+    """An event pool workers can poll (started on first use, shared by later runs)."""
+    global _manager
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.Manager()
+            atexit.register(_manager.shutdown)
+        return _manager.Event()
+
+
+def _slice_context(ctx, start, stop):
+    return {k: v[start:stop] for k, v in ctx.items()}
+
+
+def _run_chunks(ctx, cost_caps, population, generations, deadline, patience, seed,
+                progress=None, should_stop=None):
+    zones = len(cost_caps)
+    n_chunks = max(1, min(SEARCH_WORKERS, zones // MIN_ZONES_PER_WORKER))
+    bounds = np.linspace(0, zones, n_chunks + 1).astype(int)
+    args = [
+        (_slice_context(ctx, lo, hi), cost_caps[lo:hi], population, generations, deadline, patience, seed + i)
+        for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+    if n_chunks == 1:
+        return [_search_chunk(*args[0], progress=progress, should_stop=should_stop)]
+    try:
+        pool = _get_pool()
+        stop = _stop_event() if should_stop is not None else None
+        futures = {pool.submit(_search_chunk, *a, should_stop=stop and stop.is_set): i for i, a in enumerate(args)}
+        results = [None] * n_chunks
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures[future]] = future.result()
+            if done and progress is not None:
+                finished = n_chunks - len(pending)
+                progress(finished / n_chunks, f"{finished}/{n_chunks} zone chunks")
+            if stop is not None and not stop.is_set() and should_stop():
+                stop.set()      # workers stop at their next generation and return their best so far
+        return results
+    except Exception as e:
+        logger.warning(f"Process pool unavailable for strategy search ({e}); running in-process")
+        return [
+            _search_chunk(*a, should_stop=should_stop,
+                          progress=progress and (lambda f, m=None, i=i: progress((i + f) / n_chunks, m)))
+            for i, a in enumerate(args)
+        ]
+
+
+_search_cache = SnapshotCache(maxsize=32)
+
+
+def search_strategies(zone_contexts, cost_cap_inr=None, population=DEFAULT_POPULATION,
+                      generations=DEFAULT_GENERATIONS, time_limit_s=DEFAULT_TIME_LIMIT_S,
+                      patience=DEFAULT_PATIENCE, seed=0, progress=None, should_stop=None):
+    """
+    Evolve a tailored strategy for each zone context.
+
+    cost_cap_inr defaults to each zone's remaining budget. Results are cached
+    per snapshot and search parameters (cancelled runs are not cached).
+    """
+    if not zone_contexts:
+        return {"strategies": [], "stats": {"zones": 0}}
+    population = max(int(population), len(_SEEDS) + ELITES)
+
+    key = (tuple((c["id"], c["co2_current"], c["aqi_current"]) for c in zone_contexts),
+           cost_cap_inr, population, generations, time_limit_s, patience, seed)
+    version = get_snapshot_version()
+    hit, cached = _search_cache.get(key, version)
+    if hit:
+        return cached
+
+    started = time.time()
+    ctx = _context_arrays(zone_contexts)
+    cost_caps = ctx["budget_remaining"] if cost_cap_inr is None else np.full(len(zone_contexts), float(cost_cap_inr))
+    chunks = _run_chunks(ctx, cost_caps, population, generations, started + time_limit_s, patience, seed,
+                         progress=progress, should_stop=should_stop)
+
+    quantities = np.concatenate([c["quantities"] for c in chunks])
+    family = _family(quantities)
+    evaluation = _evaluate_matrix(
+        ctx, quantities[:, None, :], (quantities @ UNIT_COSTS)[:, None],
+        _FAMILIES["alignment_codes"][family][:, None], _FAMILIES["repeat_keys"][family][:, None],
+    )
+
+    strategies = []
+    for z, q in enumerate(quantities):
+        family_name = _FAMILIES["names"][family[z]]
+        actions = [
+            {"type": a, "quantity": int(q[i]), "cost_per_unit": _as_number(UNIT_COSTS[i])}
+            for i, a in enumerate(ACTION_TYPES) if q[i] > 0
+        ]
+        strategies.append({
+            "strategy_name": f"Tailored {family_name}",
+            "description": f"Evolved quantities for this zone ({family_name} mix)",
+            "actions": actions,
+            **_evaluation_row(evaluation, z, 0),
+            "tailored": True,
+        })
+
+    result = {
+        "strategies": strategies,
+        "stats": {
+            "algorithm": "Genetic Algorithm (elitist, template-seeded)",
+            "zones": len(zone_contexts),
+            "population": population,
+            "generations": max(c["generations"] for c in chunks),
+            "evaluations": sum(c["evaluations"] for c in chunks),
+            "stop_reason": sorted({c["stop_reason"] for c in chunks}),
+            "workers": len(chunks),
+            "elapsed_s": round(time.time() - started, 3),
+        },
+    }
+    if should_stop is not None and should_stop():
+        result["stats"]["stop_reason"] = sorted(set(result["stats"]["stop_reason"]) | {"cancelled"})
+    if "cancelled" not in result["stats"]["stop_reason"]:
+        _search_cache.put(key, version, result)
+    return result
@@ -41,9 +41,9 @@ def _get_grade(score):
         return "F"
 
 
-def get_sustainability_scores(state=None):
+def get_sustainability_scores(state=None, zones=None):
     """Calculate sustainability scores for all zones."""
-    zones = get_all_zones(state=state)
+    zones = zones if zones is not None else get_all_zones(state=state)
     scores = []
 
     for zone in zones:
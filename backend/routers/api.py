@@ -3,6 +3,7 @@ API Router — All REST endpoints for UrbanEcoTwin-NetZero.
 """
 
 import json
+import asyncio
 import hashlib
 import secrets
 try:
@@ -12,22 +13,34 @@ except ImportError:
     _HAS_NUMPY = False
     np = None
 
-from fastapi import APIRouter, Query, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import APIRouter, Query, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Any, Dict, List, Optional
 
 from modules.digital_twin import get_digital_twin
 from data.city_data import get_cities, get_states
 from modules.data_fusion import fuse_data
 from modules.prediction_engine import get_predictions, get_counterfactual_prediction
-from modules.scenario_simulation import simulate_scenario, get_available_actions
-from modules.rl_optimizer import optimize, optimize_with_budget
-from modules.netzero_planner import generate_netzero_roadmap
-from modules.sustainability_score import get_sustainability_scores
+from modules.scenario_simulation import simulate_scenario, get_available_actions, get_simulation_cache_stats
+from modules.rl_optimizer import optimize, budget_sweep
+from modules.pareto import get_pareto_fronts
 from modules.carbon_credits import calculate_carbon_credits
-from modules.health_impact import get_health_impact
-from modules.policy_report import generate_report
-from modules.alerts import get_alerts
+from modules.compute_graph import pull, get_graph_stats
+from modules.alert_rules import get_rules_status
+from modules.predictive_alerts import get_predictive_alerts
+from modules.alerts import get_alerts, get_alert, get_alert_history, acknowledge_alert, resolve_alert
+from modules.multi_agent import get_all_agents, iter_zone_status
+from modules.agent_scheduler import get_scheduler_status
+from modules.anomaly_model import get_model_status
+from modules.hotspots import get_hotspot_events
+from modules.online_detectors import get_detector_status
+from modules.report_export import request_export, get_artifact, get_export_status
+from modules.live_push import TOPICS as PUSH_TOPICS, stream as push_stream, get_push_status
+from modules.jobs import (
+    FINAL_STATUSES, JobQueueFull, submit_job, get_job, get_job_result, list_jobs, cancel_job,
+)
 
 router = APIRouter(prefix="/api")
 
@@ -47,11 +60,24 @@ class LoginRequest(BaseModel):
 class ActionItem(BaseModel):
     action: str
     quantity: int
+    start_month: int = Field(0, ge=0, le=360)
 
 
 class SimulationRequest(BaseModel):
     zone_id: str
     actions: List[ActionItem]
+    horizon_months: int = Field(12, ge=1, le=360)
+
+
+class JobRequest(BaseModel):
+    type: str
+    params: Dict[str, Any] = {}
+    timeout_s: Optional[float] = Field(None, gt=0, le=3600)
+
+
+class ReportExportRequest(BaseModel):
+    state: Optional[str] = None
+    format: str = "pdf"
 
 
 # --- Auth Endpoint ---
@@ -100,6 +126,22 @@ def api_zones(city: Optional[str] = Query(None), state: Optional[str] = Query(No
     return get_digital_twin(city=city, state=state)
 
 
+@router.get("/stream")
+async def api_stream(state: Optional[str] = Query(None), topics: str = Query(",".join(PUSH_TOPICS))):
+    """Server-sent events: digital twin deltas ("twin") and alert transitions ("alerts")."""
+    return StreamingResponse(
+        push_stream(state=state, topics=[t.strip() for t in topics.split(",")]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stream/status")
+def api_stream_status():
+    """Connected push clients, queue depth and drop counts."""
+    return get_push_status()
+
+
 @router.get("/data-fusion")
 def api_data_fusion(state: Optional[str] = Query(None)):
     """Get unified environmental data from all sources."""
@@ -124,8 +166,8 @@ def api_counterfactual(
 @router.post("/simulate")
 def api_simulate(request: SimulationRequest):
     """Simulate sustainability actions on a zone."""
-    actions = [{"action": a.action, "quantity": a.quantity} for a in request.actions]
-    return simulate_scenario(request.zone_id, actions)
+    actions = [{"action": a.action, "quantity": a.quantity, "start_month": a.start_month} for a in request.actions]
+    return simulate_scenario(request.zone_id, actions, horizon_months=request.horizon_months)
 
 
 @router.get("/simulate/actions")
@@ -134,17 +176,45 @@ def api_available_actions():
     return get_available_actions()
 
 
+@router.get("/simulate/cache")
+def api_simulation_cache():
+    """Hit/miss metrics for the simulation result cache."""
+    return get_simulation_cache_stats()
+
+
 @router.get("/optimize")
 def api_optimize(
     zone_id: Optional[str] = Query(None),
     budget_inr: Optional[float] = Query(None, description="Budget constraint in INR"),
     state: Optional[str] = Query(None),
+    objective: str = Query("reduction", pattern="^(reduction|reward)$", description="Budget allocation objective"),
+    mode: str = Query("templates", pattern="^(templates|search)$", description="templates, or search for zone-tailored quantities"),
+    time_limit_s: float = Query(5.0, gt=0, le=30, description="Wall-clock limit for mode=search"),
 ):
     """Get RL-optimized sustainability strategies."""
-    result = optimize(zone_id, state=state)
-    if budget_inr and budget_inr > 0:
-        result["budget_constrained"] = optimize_with_budget(budget_inr, state=state)
-    return result
+    return optimize(zone_id, state=state, budget_inr=budget_inr, objective=objective,
+                    mode=mode, time_limit_s=time_limit_s)
+
+
+@router.get("/optimize/budget-sweep")
+def api_optimize_budget_sweep(
+    budgets: Optional[List[float]] = Query(None, description="Budgets in INR (repeat the parameter)"),
+    points: int = Query(20, ge=2, le=500, description="Evenly spaced budgets when none are given"),
+    state: Optional[str] = Query(None),
+    objective: str = Query("reduction", pattern="^(reduction|reward)$"),
+):
+    """Reduction-vs-budget curve and marginal abatement cost curve in one call."""
+    return budget_sweep(budgets=budgets, points=points, state=state, objective=objective)
+
+
+@router.get("/optimize/pareto")
+def api_optimize_pareto(
+    zone_id: Optional[str] = Query(None),
+    state: Optional[str] = Query(None),
+    candidates: int = Query(2048, ge=16, le=20000, description="Candidate strategies per zone"),
+):
+    """Pareto fronts of CO₂ reduction vs. cost vs. health vs. acceptability per zone."""
+    return get_pareto_fronts(zone_id=zone_id, state=state, n_candidates=candidates)
 
 
 
@@ -152,34 +222,233 @@ def api_optimize(
 @router.get("/netzero")
 def api_netzero(state: Optional[str] = Query(None)):
     """Get Net-Zero roadmap."""
-    return generate_netzero_roadmap(state=state)
+    return pull("roadmap", state=state)
 
 
 @router.get("/scores")
 def api_scores(state: Optional[str] = Query(None)):
     """Get sustainability scores for all zones."""
-    return get_sustainability_scores(state=state)
+    return pull("scores", state=state)
 
 
 @router.get("/carbon-credits")
 def api_carbon_credits(zone_id: Optional[str] = Query(None), state: Optional[str] = Query(None)):
     """Get carbon credit calculations."""
-    return calculate_carbon_credits(zone_id, state=state)
+    if zone_id:
+        return calculate_carbon_credits(zone_id, state=state)
+    return pull("credits", state=state)
 
 
 @router.get("/health")
 def api_health(state: Optional[str] = Query(None)):
     """Get health impact predictions."""
-    return get_health_impact(state=state)
+    return pull("health", state=state)
 
 
 @router.get("/report")
 def api_report(state: Optional[str] = Query(None)):
     """Generate comprehensive policy report."""
-    return generate_report(state=state)
+    return pull("report", state=state)
+
+
+@router.post("/reports/export")
+def api_export_report(request: ReportExportRequest, response: Response):
+    """Export the policy report (pdf, csv, parquet): the cached file if ready, otherwise a background job (202)."""
+    try:
+        result = request_export(request.state, request.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    if result["status"] != "ready":
+        response.status_code = 202
+    return result
+
+
+@router.get("/reports/exports")
+def api_report_exports():
+    """Available export formats and the cached export files."""
+    return get_export_status()
+
+
+@router.get("/reports/exports/{name}")
+def api_download_report(name: str):
+    """Download a rendered export (streamed from disk)."""
+    artifact = get_artifact(name)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Export not found or evicted; request it again")
+    return FileResponse(artifact["path"], media_type=artifact["media_type"], filename=artifact["name"])
+
+
+@router.get("/graph/stats")
+def api_graph_stats():
+    """Snapshot computation graph: nodes, computations and memo hit rate."""
+    return get_graph_stats()
+
+
+@router.get("/agents")
+def api_agents(
+    budget_inr: Optional[float] = Query(None, description="Budget constraint in INR for the optimization agent"),
+    state: Optional[str] = Query(None),
+    fresh: bool = Query(False, description="Run the agents now instead of serving the latest scheduled results"),
+):
+    """Monitoring, prediction, optimization and policy agents (latest scheduled run, or run now)."""
+    return get_all_agents(budget_inr=budget_inr, state=state, fresh=fresh)
+
+
+@router.get("/agents/monitoring/zone-status")
+def api_zone_status(
+    state: Optional[str] = Query(None),
+    severity: str = Query("normal", pattern="^(normal|warning|critical)$", description="Minimum zone status"),
+):
+    """Monitoring zone status as newline-delimited JSON, one zone per line."""
+    rows = iter_zone_status(state=state, min_severity=severity)
+    return StreamingResponse((json.dumps(row) + "\n" for row in rows), media_type="application/x-ndjson")
+
+
+@router.get("/agents/schedule")
+def api_agent_schedule():
+    """Background agent scheduler status and latest published versions."""
+    return get_scheduler_status()
+
+
+@router.get("/agents/anomaly-model")
+def api_anomaly_model():
+    """Status of the persisted Isolation Forest used by the monitoring agent."""
+    return get_model_status()
+
+
+@router.get("/agents/detectors")
+def api_online_detectors():
+    """State of the streaming per-zone baseline detectors."""
+    return get_detector_status()
+
+
+@router.get("/agents/hotspot-events")
+def api_hotspot_events(limit: int = Query(50, ge=1, le=200)):
+    """Recent hotspot cluster births, deaths, merges and splits."""
+    return {"events": get_hotspot_events(limit=limit)}
 
 
 @router.get("/alerts")
 def api_alerts(state: Optional[str] = Query(None)):
     """Get active sustainability alerts."""
     return get_alerts(state=state)
+
+
+@router.get("/alerts/history")
+def api_alert_history(state: Optional[str] = Query(None), status: Optional[str] = Query(None),
+                      limit: int = Query(100, ge=1, le=1000)):
+    """Alerts newest first, including resolved ones."""
+    return {"alerts": get_alert_history(state=state, status=status, limit=limit)}
+
+
+@router.get("/alerts/predictive")
+def api_predictive_alerts(state: Optional[str] = Query(None)):
+    """Forecast-driven "expected to breach in N hours" alerts from the latest snapshot."""
+    return get_predictive_alerts(state=state)
+
+
+@router.get("/alerts/rules")
+def api_alert_rules():
+    """The compiled alert rule set (hot-reloaded from data/alert_rules.json)."""
+    return get_rules_status()
+
+
+@router.get("/alerts/{alert_id}")
+def api_get_alert(alert_id: int):
+    """One alert with its lifecycle history."""
+    alert = get_alert(alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    return alert
+
+
+def _alert_transition(result):
+    if result is None:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    if "error" in result:
+        raise HTTPException(status_code=409, detail=result["error"])
+    return result
+
+
+@router.post("/alerts/{alert_id}/acknowledge")
+def api_acknowledge_alert(alert_id: int):
+    """Acknowledge an open alert."""
+    return _alert_transition(acknowledge_alert(alert_id))
+
+
+@router.post("/alerts/{alert_id}/resolve")
+def api_resolve_alert(alert_id: int):
+    """Resolve an active alert by hand."""
+    return _alert_transition(resolve_alert(alert_id))
+
+
+# --- Background Jobs ---
+@router.post("/jobs", status_code=202)
+def api_submit_job(request: JobRequest):
+    """Queue a long-running optimization (optimize, budget_sweep, pareto, strategy_search, train_policy)."""
+    try:
+        return submit_job(request.type, request.params, request.timeout_s)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
+@router.get("/jobs")
+def api_list_jobs(status: Optional[str] = Query(None), limit: int = Query(50, ge=1, le=500)):
+    """Recent jobs, newest first."""
+    return list_jobs(status=status, limit=limit)
+
+
+@router.get("/jobs/{job_id}")
+def api_get_job(job_id: str):
+    """Job status and progress."""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/result")
+def api_get_job_result(job_id: str):
+    """Result of a finished job (409 while it is still queued or running)."""
+    job, result = get_job_result(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return {"job": job, "result": result}
+
+
+@router.get("/jobs/{job_id}/events")
+async def api_job_events(job_id: str):
+    """Server-sent events with job progress until the job finishes."""
+    # get_job reads SQLite; keep it off the event loop
+    if await run_in_threadpool(get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        last = None
+        while True:
+            job = await run_in_threadpool(get_job, job_id)
+            state = (job["status"], job["progress"], job["message"])
+            if state != last:
+                last = state
+                yield f"event: progress\ndata: {json.dumps(job)}\n\n"
+            if job["status"] in FINAL_STATUSES:
+                yield f"event: done\ndata: {json.dumps(job)}\n\n"
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.delete("/jobs/{job_id}")
+def api_cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,51 @@
+"""Brute-force regression checks for the budget allocation solver (run: python -m pytest -q)."""
+
+import itertools
+
+import numpy as np
+
+from modules.budget_allocation import allocate_budget
+
+
+def _brute_force(costs, values, budget):
+    best = 0.0
+    options = [range(-1, costs.shape[1])] * costs.shape[0]
+    for choice in itertools.product(*options):
+        picked = [(g, k) for g, k in enumerate(choice) if k >= 0]
+        cost = sum(costs[g, k] for g, k in picked)
+        if cost <= budget:
+            best = max(best, sum(values[g, k] for g, k in picked))
+    return best
+
+
+def test_exact_budget_is_reachable():
+    costs = np.array([[46, 25, 7], [35, 42, 37]], dtype=float)
+    values = np.array([[9.85, 4.0, 5.71], [6.0, 8.0, 3.0]])
+    result = allocate_budget(costs, values, 49)
+    assert result["exact"]
+    assert np.isclose(result["total_value"], _brute_force(costs, values, 49))
+    assert result["total_cost"] <= 49
+
+
+def test_small_integer_instances_match_brute_force():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        groups, options = rng.integers(1, 5), rng.integers(1, 4)
+        costs = rng.integers(1, 60, (groups, options)).astype(float)
+        values = np.round(rng.uniform(0.1, 15.0, (groups, options)), 2)
+        budget = int(rng.integers(1, 120))
+        result = allocate_budget(costs, values, budget)
+        assert result["exact"]
+        assert result["total_cost"] <= budget + 1e-9
+        assert np.isclose(result["total_value"], _brute_force(costs, values, budget))
+
+
+def test_fractional_costs_stay_feasible():
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        costs = rng.uniform(1, 60, (3, 3))
+        values = rng.uniform(0.1, 15.0, (3, 3))
+        budget = float(rng.uniform(10, 120))
+        result = allocate_budget(costs, values, budget)
+        assert result["total_cost"] <= budget + 1e-9
+        assert result["total_value"] <= _brute_force(costs, values, budget) + 1e-9
@@ -0,0 +1,30 @@
+"""Snapshot cache versioning."""
+
+from data.snapshot import SnapshotCache
+
+
+def test_newer_version_invalidates():
+    cache = SnapshotCache()
+    cache.put("k", 1, "a")
+    assert cache.get("k", 1) == (True, "a")
+    assert cache.get("k", 2) == (False, None)
+
+
+def test_older_version_bypasses_without_moving_back():
+    cache = SnapshotCache()
+    cache.put("k", 5, "current")
+    # A run pinned to an older snapshot neither sees nor clobbers current entries
+    assert cache.get("k", 4) == (False, None)
+    cache.put("k", 4, "stale")
+    assert cache.get("k", 5) == (True, "current")
+    assert cache.stats()["snapshot_version"] == 5
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_discard_only_own_value():
+    cache = SnapshotCache()
+    cache.put("k", 1, "newer")
+    cache.discard("k", "other")
+    assert cache.get("k", 1) == (True, "newer")
+    cache.discard("k", "newer")
+    assert cache.get("k", 1) == (False, None)
@@ -22,6 +22,14 @@ async function postAPI(endpoint, body) {
   return res.json();
 }
 
+export function openStream(state, topics) {
+  return new EventSource(`${API_BASE}/stream${_qs({ state, topics })}`);
+}
+
+export function downloadUrl(path) {
+  return `${API_BASE.replace(/\/api$/, '')}${path}`;
+}
+
 export const api = {
   getStates: () => fetchAPI('/states'),
   getCities: (state) => fetchAPI(`/cities${_qs({ state })}`),
@@ -39,5 +47,13 @@ export const api = {
   getCarbonCredits: (zoneId, state) => fetchAPI(`/carbon-credits${_qs({ zone_id: zoneId, state })}`),
   getHealth: (state) => fetchAPI(`/health${_qs({ state })}`),
   getReport: (state) => fetchAPI(`/report${_qs({ state })}`),
+  exportReport: (state, format) => postAPI('/reports/export', { state, format }),
+  getReportExports: () => fetchAPI('/reports/exports'),
+  getJob: (jobId) => fetchAPI(`/jobs/${jobId}`),
+  getJobResult: (jobId) => fetchAPI(`/jobs/${jobId}/result`),
   getAlerts: (state) => fetchAPI(`/alerts${_qs({ state })}`),
+  getAgents: (budgetCr, state) => {
+    const budget_inr = budgetCr ? Number(budgetCr) * 10000000 : undefined;
+    return fetchAPI(`/agents${_qs({ budget_inr, state })}`);
+  },
 };
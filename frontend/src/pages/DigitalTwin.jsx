@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { api } from '../api/client';
+import { api, openStream } from '../api/client';
 import { useStateContext } from '../context/StateContext';
 import CesiumCityView from '../components/CesiumCityView';
 import { Globe2 } from 'lucide-react';
@@ -25,8 +25,17 @@ export default function DigitalTwin() {
 
   useEffect(() => {
     fetchData(selectedCity);
-    const interval = setInterval(() => fetchData(selectedCity), 60000);
-    return () => clearInterval(interval);
+    // Live deltas pushed by the server; refetch only when told to resync or after a reconnect
+    const source = openStream(selectedState, 'twin');
+    let dropped = false;
+    source.addEventListener('twin', (e) => {
+      const updates = new Map(JSON.parse(e.data).zones.map(z => [z.id, z]));
+      setData(d => d && { ...d, zones: d.zones.map(z => updates.get(z.id) || z), timestamp: new Date().toISOString() });
+    });
+    source.addEventListener('resync', () => fetchData(selectedCity));
+    source.onerror = () => { dropped = true; };
+    source.onopen = () => { if (dropped) { dropped = false; fetchData(selectedCity); } };
+    return () => source.close();
   }, [selectedCity, selectedState]);
 
   if (loading) return <div className="loading"><div className="loading-spinner"></div><p>Loading Digital Twin...</p></div>;
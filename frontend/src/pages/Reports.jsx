@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
-import { api } from '../api/client';
+import { api, downloadUrl } from '../api/client';
 import { useStateContext } from '../context/StateContext';
-import { FileText, Building2, ListChecks, Target, Wallet } from 'lucide-react';
+import { FileText, Building2, ListChecks, Target, Wallet, Download } from 'lucide-react';
 
 export default function Reports() {
   const { selectedState, stateName } = useStateContext();
@@ -13,6 +13,15 @@ export default function Reports() {
   const [budgetLoading, setBudgetLoading] = useState(false);
   const [budgetCr, setBudgetCr] = useState('');
 
+  // Report exports (rendered in a background job, cached per snapshot)
+  const [formats, setFormats] = useState({ pdf: true, csv: true });
+  const [exporting, setExporting] = useState(null);
+  const [exportError, setExportError] = useState(null);
+
+  useEffect(() => {
+    api.getReportExports().then(d => setFormats(d.formats)).catch(() => {});
+  }, []);
+
   useEffect(() => {
     setLoading(true);
     // Reset budget data when state changes
@@ -30,6 +39,28 @@ export default function Reports() {
     }).catch(() => setBudgetLoading(false));
   };
 
+  const exportReport = async (format) => {
+    setExporting(format);
+    setExportError(null);
+    try {
+      let res = await api.exportReport(selectedState, format);
+      let artifact = res.artifact;
+      if (!artifact) {
+        let job = res.job;
+        while (!['succeeded', 'failed', 'cancelled', 'timed_out', 'interrupted'].includes(job.status)) {
+          await new Promise(r => setTimeout(r, 500));
+          job = await api.getJob(job.id);
+        }
+        if (job.status !== 'succeeded') throw new Error(job.error || `Export ${job.status}`);
+        artifact = (await api.getJobResult(job.id)).result;
+      }
+      window.location.assign(downloadUrl(artifact.download_url));
+    } catch (e) {
+      setExportError(e.message);
+    }
+    setExporting(null);
+  };
+
   if (loading) return <div className="loading"><div className="loading-spinner"></div><p>Generating policy report...</p></div>;
   if (!data) return <div className="loading"><p>Failed to load data.</p></div>;
 
@@ -42,6 +73,23 @@ export default function Reports() {
         <div style={{ display: 'flex', alignItems: 'center', gap: 12 }}>
           <h1><FileText size={28} style={{ color: '#64748b' }} /> Policy & Budget Report</h1>
         </div>
+        <div style={{ display: 'flex', alignItems: 'center', gap: 8, marginTop: 12 }}>
+          {Object.entries(formats).filter(([, ok]) => ok).map(([format]) => (
+            <button
+              key={format}
+              onClick={() => exportReport(format)}
+              disabled={exporting !== null}
+              style={{
+                cursor: exporting ? 'not-allowed' : 'pointer', display: 'flex', alignItems: 'center', gap: 6,
+                padding: '8px 14px', borderRadius: 8, background: 'var(--surface)', color: 'inherit',
+                border: '1px solid var(--border-glass)', fontWeight: 600, fontSize: 13, opacity: exporting ? 0.6 : 1,
+              }}
+            >
+              <Download size={14} /> {exporting === format ? 'Rendering...' : format.toUpperCase()}
+            </button>
+          ))}
+          {exportError && <span style={{ fontSize: 13, color: '#ef4444' }}>{exportError}</span>}
+        </div>
       </div>
 
       {/* Dynamic Budget Optimizer */}